@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/dev/ref/settings/
 """
 # pyright: reportUnknownVariableType=none
 
+import os
 from pathlib import Path
 
 from django.db.models import ManyToManyField
@@ -89,6 +90,17 @@ DATABASES = {
     }
 }
 
+# Use PostgreSQL if POSTGRES_DB is set (requires psycopg or psycopg2 to be installed)
+if os.environ.get("POSTGRES_DB"):
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ["POSTGRES_DB"],
+        "USER": os.environ.get("POSTGRES_USER", ""),
+        "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+        "HOST": os.environ.get("POSTGRES_HOST", ""),
+        "PORT": os.environ.get("POSTGRES_PORT", ""),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/dev/ref/settings/#auth-password-validators
@@ -132,3 +144,19 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MERGE_TIMETABLES_BY_HEADSIGN = True
+
+# Uploaded files (GTFS feeds waiting for import)
+
+MEDIA_ROOT = BASE_DIR / "media"
+
+# Run GTFS imports uploaded through the admin in a background worker thread,
+# instead of inside the upload request.
+GTFS_IMPORT_BACKGROUND = True
+
+# Export GTFS in a background thread after every import uploaded through the admin,
+# so that the first download of the new data is served from a finished export.
+GTFS_EXPORT_AFTER_IMPORT = True
+
+# Number of worker threads generating and compressing tables of GTFS exports in parallel.
+# A single worker exports tables one after another.
+GTFS_EXPORT_WORKERS = min(os.cpu_count() or 1, 4)
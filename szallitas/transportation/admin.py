@@ -1,5 +1,10 @@
+from typing import TYPE_CHECKING
+
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.db.models import Model, QuerySet
+from django.http import HttpRequest
 
 from . import models
 
@@ -10,13 +15,45 @@ class TransportAdminSite(admin.AdminSite):
 
 admin_site = TransportAdminSite(name="TransportAdminSite")
 
+if TYPE_CHECKING:
+    # ModelAdmin is only generic for the type checker
+    _ModelAdmin = admin.ModelAdmin[Model]
+else:
+    _ModelAdmin = admin.ModelAdmin
+
+
+class TransportDataAdmin(_ModelAdmin):
+    """TransportDataAdmin bumps the DataVersion together with every change
+    of the transportation data"""
+
+    # NOTE: Signals aren't used for this, as delete receivers would make Django
+    #       load every deleted object - including the ones removed by imports.
+
+    def save_model(
+        self, request: HttpRequest, obj: Model, form: forms.ModelForm, change: bool
+    ) -> None:
+        super().save_model(request, obj, form, change)
+        models.DataVersion.bump()
+
+    def delete_model(self, request: HttpRequest, obj: Model) -> None:
+        super().delete_model(request, obj)
+        models.DataVersion.bump()
+
+    def delete_queryset(self, request: HttpRequest, queryset: QuerySet[Model]) -> None:
+        super().delete_queryset(request, queryset)
+        models.DataVersion.bump()
+
 
 admin_site.register(User, admin.ModelAdmin)
-admin_site.register(models.Agency)
-admin_site.register(models.Calendar)
-admin_site.register(models.CalendarException)
-admin_site.register(models.Line)
-admin_site.register(models.Pattern)
-admin_site.register(models.PatternStop)
-admin_site.register(models.Stop)
-admin_site.register(models.Trip)
+admin_site.register(models.Agency, TransportDataAdmin)
+admin_site.register(models.Calendar, TransportDataAdmin)
+admin_site.register(models.CalendarException, TransportDataAdmin)
+admin_site.register(models.Frequency, TransportDataAdmin)
+admin_site.register(models.Line, TransportDataAdmin)
+admin_site.register(models.Pattern, TransportDataAdmin)
+admin_site.register(models.PatternStop, TransportDataAdmin)
+admin_site.register(models.Stop, TransportDataAdmin)
+admin_site.register(models.TravelTimeProfile, TransportDataAdmin)
+admin_site.register(models.Trip, TransportDataAdmin)
+admin_site.register(models.ImportJob)
+admin_site.register(models.ImportCheckpoint)
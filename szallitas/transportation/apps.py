@@ -1,5 +1,9 @@
+from typing import Any
+
 from django.apps import AppConfig
 from django.contrib.admin.apps import AdminConfig
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
 
 
 class TransportAdminConfig(AdminConfig):
@@ -9,3 +13,17 @@ class TransportAdminConfig(AdminConfig):
 class TransportationConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "transportation"
+
+    def ready(self) -> None:
+        connection_created.connect(enable_sqlite_wal)
+
+
+def enable_sqlite_wal(sender: Any, connection: BaseDatabaseWrapper, **kwargs: Any) -> None:
+    """enable_sqlite_wal switches SQLite databases into write-ahead logging mode.
+
+    In the default (rollback journal) mode, a running GTFS import locks out all readers.
+    With WAL, readers keep seeing the previously committed data until the import commits.
+    """
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
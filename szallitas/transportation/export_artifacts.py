@@ -0,0 +1,271 @@
+import re
+import threading
+import time
+from itertools import chain
+from pathlib import Path
+from typing import IO, Final, Iterator
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .gtfs_tools.gtfs_export import export_all, snapshot
+from .models import DataVersion
+
+DOWNLOAD_NAME: Final[str] = "szallitas-gtfs.zip"
+
+STREAM_CHUNK_SIZE: Final[int] = 1 << 16
+"""STREAM_CHUNK_SIZE is the size (in bytes) of chunks of the archive sent to the client"""
+
+POLL_INTERVAL: Final[float] = 0.05
+# How long a download waits for more of the archive, while it's being exported.
+
+STALL_TIMEOUT: Final[float] = 300.0
+# How long an export may go without writing anything, before it's considered abandoned
+# (e.g. because its process was killed) and the artifact is exported again.
+
+RANGE_PATTERN: Final[re.Pattern[str]] = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ExportFailed(Exception):
+    pass
+
+
+def artifacts_dir() -> Path:
+    """artifacts_dir returns the directory with (finished and in-progress) export artifacts"""
+    return Path(settings.MEDIA_ROOT) / "gtfs_exports"
+
+
+def artifact_path(key: str) -> Path:
+    """artifact_path returns the path of the finished export of the data version
+    with the provided key"""
+    return artifacts_dir() / f"{key}.zip"
+
+
+def part_path(key: str) -> Path:
+    """part_path returns the path of the export of the data version with the provided key,
+    while it's being written"""
+    return artifacts_dir() / f"{key}.part"
+
+
+def stalled(path: Path) -> bool:
+    try:
+        return time.time() - path.stat().st_mtime > STALL_TIMEOUT
+    except FileNotFoundError:
+        return False
+
+
+class AppendOnlyWriter:
+    """AppendOnlyWriter hides the ability to seek of a file from ZipFile, which then never
+    rewrites already written headers - so that the archive can be read while it's written"""
+
+    def __init__(self, f: IO[bytes]) -> None:
+        self.f = f
+
+    def write(self, data: bytes) -> int:
+        return self.f.write(data)
+
+    def flush(self) -> None:
+        self.f.flush()
+
+
+def start_export(key: str) -> threading.Thread | None:
+    """start_export starts exporting the current data into the artifact of the provided
+    data version in a background thread, and returns that thread.
+
+    Nothing is started if the artifact already exists, or is being exported
+    (by any process) - so the data is exported once per version, no matter how many
+    downloads ask for it.
+
+    NOTE: The export runs in a daemon thread, so it's lost if the process exits before
+          it's finished. Its partial artifact is then exported again, once it's stalled.
+    """
+    if artifact_path(key).exists():
+        return None
+
+    part = part_path(key)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    if stalled(part):
+        part.unlink(missing_ok=True)
+    try:
+        f = part.open("xb")
+    except FileExistsError:
+        return None
+
+    thread = threading.Thread(target=_export, args=(key, f), name="gtfs-export", daemon=True)
+    thread.start()
+    return thread
+
+
+def _export(key: str, f: IO[bytes]) -> None:
+    part = part_path(key)
+    try:
+        with f, snapshot():
+            # The artifact must hold exactly the data of its version. If the data has changed
+            # since the export was started, the new version is exported on its own.
+            if DataVersion.current().key != key:
+                raise ExportFailed(key)
+            export_all(
+                AppendOnlyWriter(f),  # type: ignore
+                workers=getattr(settings, "GTFS_EXPORT_WORKERS", 1),
+            )
+        part.replace(artifact_path(key))
+
+        # Artifacts of older versions are never served again.
+        # NOTE: The data may have changed during the export - the current version
+        #       could then have been exported (and published) before this one.
+        current = DataVersion.current().key
+        for old in artifacts_dir().glob("*.zip"):
+            if old.stem not in (key, current):
+                old.unlink(missing_ok=True)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    finally:
+        connections.close_all()
+
+
+def follow_export(key: str) -> Iterator[bytes]:
+    """follow_export yields the artifact of the data version in chunks -
+    following it while it's being exported, so that it's sent as it's generated"""
+    path, part = artifact_path(key), part_path(key)
+    try:
+        f, finished = part.open("rb"), False
+    except FileNotFoundError:
+        # NOTE: The export may have been published (or failed) right after it was looked up
+        if not path.exists():
+            raise ExportFailed(key)
+        f, finished = path.open("rb"), True
+
+    with f:
+        while True:
+            if chunk := f.read(STREAM_CHUNK_SIZE):
+                yield chunk
+            elif finished:
+                return
+            elif path.exists():
+                # Published - the rest of the file is read, and the download is over
+                finished = True
+            elif not part.exists() or stalled(part):
+                raise ExportFailed(key)
+            else:
+                time.sleep(POLL_INTERVAL)
+
+
+def download_response(request: HttpRequest) -> HttpResponseBase:
+    """download_response serves a GTFS export of the current data version.
+
+    The export of every version is stored as an artifact, and served with ETag and
+    Last-Modified of the version - so conditional and range requests are supported.
+    If the artifact doesn't exist yet, it's exported and streamed at the same time.
+    """
+    version = DataVersion.current()
+    etag = f'"{version.key}"'
+    last_modified = int(version.changed_at.timestamp())
+
+    response: HttpResponseBase | None = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        path = artifact_path(version.key)
+        if not path.exists():
+            start_export(version.key)
+        if path.exists():
+            range_header = request.headers.get("Range")
+            if not is_current(request.headers.get("If-Range"), etag, last_modified):
+                # A range of a previous version - the whole current one is sent instead
+                range_header = None
+            response = artifact_response(path, range_header)
+        else:
+            response = export_response(version.key)
+        response["Content-Disposition"] = f"attachment; filename={DOWNLOAD_NAME}"
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def export_response(key: str) -> HttpResponseBase:
+    """export_response streams the artifact of the data version while it's being exported.
+
+    The response isn't started before the first chunk of the artifact is exported (or the
+    export is finished). If the export fails before that, it's run again synchronously,
+    so that a failure fails the request - instead of a successful response being cut short.
+    """
+    chunks = follow_export(key)
+    try:
+        first = next(chunks, b"")
+    except ExportFailed:
+        if thread := start_export(key):
+            thread.join()
+        path = artifact_path(key)
+        if not path.exists():
+            raise
+        return artifact_response(path, None)
+    return StreamingHttpResponse(chain([first], chunks), content_type="application/zip")
+
+
+def is_current(if_range: str | None, etag: str, last_modified: int) -> bool:
+    """is_current checks if the If-Range header (if any) refers to the current data version,
+    either by its ETag or by its Last-Modified date"""
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def artifact_response(path: Path, range_header: str | None) -> HttpResponseBase:
+    """artifact_response serves a finished export artifact, or its single requested range.
+    Multiple ranges aren't supported - the whole artifact is sent instead."""
+    f = path.open("rb")
+    size = path.stat().st_size
+    byte_range = parse_range(range_header, size) if range_header else None
+
+    if byte_range is None:
+        return FileResponse(f, content_type="application/zip")
+
+    start, end = byte_range
+    if start >= end:
+        f.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    response = StreamingHttpResponse(
+        read_range(f, start, end), status=206, content_type="application/zip"
+    )
+    response["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    response["Content-Length"] = str(end - start)
+    return response
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """parse_range returns the [start, end) byte range requested by a Range header,
+    clamped to the size of the content, or None if the header isn't a single byte range.
+    Unsatisfiable ranges are returned as empty."""
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # Suffix range - the last N bytes
+        return max(size - int(last), 0), size
+    if last != "" and int(last) < int(first):
+        return None
+    start = int(first)
+    end = min(int(last) + 1, size) if last != "" else size
+    return (start, end) if start < size else (size, size)
+
+
+def read_range(f: IO[bytes], start: int, end: int) -> Iterator[bytes]:
+    with f:
+        f.seek(start)
+        while start < end and (chunk := f.read(min(STREAM_CHUNK_SIZE, end - start))):
+            start += len(chunk)
+            yield chunk
@@ -0,0 +1,219 @@
+from datetime import date, datetime, time
+from io import StringIO
+from typing import Any, Callable, Final, Iterable, Iterator, Sequence, TypeVar
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Field, Max, Model
+
+M = TypeVar("M", bound=Model)
+
+
+class BulkWriter:
+    """BulkWriter buffers model instances and inserts them with `bulk_create`.
+
+    Models must be provided in dependency order (referenced models first).
+    Whenever the queue of a model fills up, that model and all models preceding it
+    are flushed - so that rows are never inserted before the rows they reference.
+
+    Primary keys are eagerly assigned by `next_id`, which allows referencing
+    objects before they are actually inserted, without fetching their IDs back
+    from the database.
+    """
+
+    MAX_BATCH_SIZE: Final[int] = 5000
+    # Upper bound of rows in a single INSERT, used if the backend has no limit on its own.
+
+    def __init__(
+        self,
+        models: Sequence[type[Model]],
+        on_batch: Callable[[type[Model], int], None] | None = None,
+    ) -> None:
+        self.models = list(models)
+        self.on_batch = on_batch
+        self.queues: dict[type[Model], list[Model]] = {model: [] for model in self.models}
+        self.update_queues: dict[type[Model], list[Model]] = {model: [] for model in self.models}
+        self.batch_sizes: dict[type[Model], int] = {
+            model: backend_batch_size(model) for model in self.models
+        }
+        self.insert_batch_sizes = self.batch_sizes
+        self.id_counters: dict[type[Model], int] = {}
+        # Number of rows queued for insertion or update, and deleted, so far
+        self.changes = 0
+
+    def next_id(self, model: type[Model]) -> int:
+        """next_id reserves a primary key for a new instance of the provided model"""
+        if model not in self.id_counters:
+            max_id = model._default_manager.aggregate(Max("pk"))["pk__max"]  # type: ignore
+            self.id_counters[model] = (max_id or 0) + 1
+
+        new_id = self.id_counters[model]
+        self.id_counters[model] += 1
+        return new_id
+
+    def add(self, obj: M) -> M:
+        """add queues an object for insertion"""
+        model = type(obj)
+        queue = self.queues[model]
+        queue.append(obj)
+        self.changes += 1
+        if len(queue) >= self.insert_batch_sizes[model]:
+            self._flush_up_to(model)
+        return obj
+
+    def update(self, obj: M) -> M:
+        """update queues an object, which already exists in the database, for an update
+        of all of its fields"""
+        model = type(obj)
+        queue = self.update_queues[model]
+        queue.append(obj)
+        self.changes += 1
+        if len(queue) >= self.batch_sizes[model]:
+            self._flush_up_to(model)
+        return obj
+
+    def delete(self, model: type[Model], pks: Iterable[int]) -> None:
+        """delete removes objects with the provided primary keys (and all objects
+        referencing them). Queued objects should be flushed beforehand."""
+        pks = list(pks)
+        self.changes += len(pks)
+        for i in range(0, len(pks), self.batch_sizes[model]):
+            model._default_manager.filter(pk__in=pks[i : i + self.batch_sizes[model]]).delete()
+
+    def flush(self) -> None:
+        """flush inserts all queued objects and updates the database sequences
+        of all models with eagerly-assigned primary keys"""
+        self._flush_up_to(self.models[-1])
+
+        if self.id_counters:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), list(self.id_counters)):
+                    cursor.execute(sql)
+
+    def _flush_up_to(self, last_model: type[Model]) -> None:
+        for model in self.models:
+            queue = self.queues[model]
+            if queue:
+                self.insert(model, queue)
+                if self.on_batch:
+                    self.on_batch(model, len(queue))
+                queue.clear()
+
+            update_queue = self.update_queues[model]
+            if update_queue:
+                model._default_manager.bulk_update(  # type: ignore
+                    update_queue,
+                    [f.name for f in model._meta.concrete_fields if not f.primary_key],
+                    batch_size=self.batch_sizes[model],
+                )
+                if self.on_batch:
+                    self.on_batch(model, len(update_queue))
+                update_queue.clear()
+
+            if model is last_model:
+                break
+
+    def insert(self, model: type[Model], objs: list[Model]) -> None:
+        """insert writes new objects of a model into the database"""
+        batch_size = self.batch_sizes[model]
+        model._default_manager.bulk_create(objs, batch_size=batch_size)  # type: ignore
+
+
+class CopyBulkWriter(BulkWriter):
+    """CopyBulkWriter is a BulkWriter for PostgreSQL, which inserts objects
+    with `COPY ... FROM STDIN` instead of multi-row INSERTs.
+
+    COPY has no limit on the number of rows, and skips parsing and planning
+    of the huge INSERT statements, so much bigger batches are used.
+    """
+
+    COPY_BATCH_SIZE: Final[int] = 50_000
+
+    def __init__(
+        self,
+        models: Sequence[type[Model]],
+        on_batch: Callable[[type[Model], int], None] | None = None,
+    ) -> None:
+        super().__init__(models, on_batch)
+        # NOTE: Updates still go through bulk_update, with backend-limited batches
+        self.insert_batch_sizes = {model: self.COPY_BATCH_SIZE for model in self.models}
+
+    def insert(self, model: type[Model], objs: list[Model]) -> None:
+        # Objects without eagerly-assigned primary keys get them from the database sequence
+        fields = list(model._meta.concrete_fields)
+        if with_pk := [obj for obj in objs if obj.pk is not None]:
+            self.copy(model, with_pk, fields)
+        if without_pk := [obj for obj in objs if obj.pk is None]:
+            self.copy(model, without_pk, [field for field in fields if not field.primary_key])
+
+    def copy(
+        self, model: type[Model], objs: list[Model], fields: "Sequence[Field[Any, Any]]"
+    ) -> None:
+        """copy inserts objects with a single COPY of the provided fields"""
+        sql = "COPY {} ({}) FROM STDIN".format(
+            connection.ops.quote_name(model._meta.db_table),
+            ", ".join(connection.ops.quote_name(field.column) for field in fields),
+        )
+        data = "".join(copy_rows(model, objs, fields))
+
+        with connection.cursor() as cursor:
+            raw_cursor: Any = cursor.cursor
+            if hasattr(raw_cursor, "copy"):
+                # psycopg 3
+                with raw_cursor.copy(sql) as copy:
+                    copy.write(data)
+            else:
+                # psycopg2
+                raw_cursor.copy_expert(sql, StringIO(data))
+
+
+def bulk_writer(
+    models: Sequence[type[Model]],
+    on_batch: Callable[[type[Model], int], None] | None = None,
+) -> BulkWriter:
+    """bulk_writer creates the fastest BulkWriter supported by the active database backend"""
+    if connection.vendor == "postgresql":
+        return CopyBulkWriter(models, on_batch)
+    return BulkWriter(models, on_batch)
+
+
+def copy_rows(
+    model: type[Model],
+    objs: Iterable[Model],
+    fields: "Sequence[Field[Any, Any]] | None" = None,
+) -> Iterator[str]:
+    """copy_rows encodes objects as lines of PostgreSQL COPY text format,
+    with values of the provided fields (all concrete fields of the model by default)"""
+    if fields is None:
+        fields = model._meta.concrete_fields
+    for obj in objs:
+        yield "\t".join(
+            copy_value(field.get_prep_value(getattr(obj, field.attname))) for field in fields
+        ) + "\n"
+
+
+def copy_value(value: Any) -> str:
+    """copy_value encodes a single value in PostgreSQL COPY text format"""
+    if value is None:
+        return "\\N"
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def backend_batch_size(model: type[Model]) -> int:
+    """backend_batch_size returns the maximum number of rows of the provided model
+    which the active database backend can insert in a single query"""
+    fields = model._meta.concrete_fields
+    placeholder_objs = [None] * BulkWriter.MAX_BATCH_SIZE
+    return max(
+        1, min(connection.ops.bulk_batch_size(fields, placeholder_objs), len(placeholder_objs))
+    )
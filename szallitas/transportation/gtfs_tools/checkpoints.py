@@ -0,0 +1,152 @@
+from hashlib import sha256
+from pathlib import Path
+from typing import IO, Any, Final
+
+from django.db import transaction
+from django.db.models import Model
+
+from ..models import (
+    Agency,
+    Calendar,
+    CalendarException,
+    DataVersion,
+    Frequency,
+    ImportCheckpoint,
+    Line,
+    Pattern,
+    PatternStop,
+    Stop,
+    TravelTimeProfile,
+    Trip,
+)
+from ..models.imported import ImportedModel
+
+CHECKPOINT_TRIPS: Final[int] = 20_000
+"""CHECKPOINT_TRIPS is the number of trips committed together by a resumable import"""
+
+STAGED_MODELS: Final[tuple[tuple[type[Model], str], ...]] = (
+    (Frequency, ""),
+    (Trip, ""),
+    (TravelTimeProfile, "pattern__line__"),
+    (PatternStop, "pattern__line__"),
+    (Pattern, "line__"),
+    (CalendarException, "calendar__"),
+    (Calendar, ""),
+    (Line, ""),
+    (Stop, ""),
+    (Agency, ""),
+)
+"""STAGED_MODELS are all models staged by resumable imports (with referencing models first),
+together with lookup paths to the imported objects they belong to - whose namespace
+and staged flag identify them"""
+
+SOURCE_ID_MODELS: Final[tuple[type[ImportedModel], ...]] = (
+    Frequency,
+    Trip,
+    Calendar,
+    Line,
+    Stop,
+    Agency,
+)
+
+
+class Checkpoints:
+    """Checkpoints splits a resumable import into separately committed segments.
+
+    Every commit durably saves the objects loaded so far, together with the progress
+    recorded in the ImportCheckpoint. Must be used as a context manager: leaving it
+    commits the last segment, or rolls it back if an exception was raised.
+    """
+
+    def __init__(self, record: ImportCheckpoint) -> None:
+        self.record = record
+        self.segment = transaction.atomic()
+
+    def __enter__(self) -> "Checkpoints":
+        self.segment.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.segment.__exit__(*exc_info)
+
+    def finished(self, stage: str) -> bool:
+        return stage in self.record.finished_stages
+
+    def commit(self, stage: str | None = None, trips: int = 0) -> None:
+        """commit records a finished stage or the number of committed trips,
+        and commits the current segment"""
+        if stage is not None and stage not in self.record.finished_stages:
+            self.record.finished_stages.append(stage)
+        self.record.trips = max(self.record.trips, trips)
+        self.record.save()
+
+        self.segment.__exit__(None, None, None)
+        self.segment = transaction.atomic()
+        self.segment.__enter__()
+
+
+def feed_digest(zip_path: str | Path | IO[bytes]) -> str:
+    """feed_digest returns the SHA-256 of a feed. Unpacked feeds are hashed
+    by the names and contents of their tables."""
+    digest = sha256()
+    if isinstance(zip_path, (str, Path)) and Path(zip_path).is_dir():
+        for table in sorted(Path(zip_path).iterdir()):
+            if table.is_file():
+                digest.update(table.name.encode("utf-8") + b"\0")
+                digest.update(file_digest(table))
+    elif isinstance(zip_path, (str, Path)):
+        return file_digest(Path(zip_path)).hex()
+    else:
+        position = zip_path.tell()
+        while chunk := zip_path.read(1 << 20):
+            digest.update(chunk)
+        zip_path.seek(position)
+    return digest.hexdigest()
+
+
+def file_digest(path: Path) -> bytes:
+    digest = sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.digest()
+
+
+@transaction.atomic
+def start_checkpoint(namespace: str, digest: str) -> tuple[ImportCheckpoint, bool]:
+    """start_checkpoint returns the checkpoint of an interrupted import of the same feed
+    into the namespace, or creates a new one. The second returned value is True if
+    the import is being resumed. Objects staged from a different feed are discarded."""
+    record = ImportCheckpoint.objects.filter(namespace=namespace).first()
+    if record is not None and record.feed_digest == digest:
+        return record, True
+
+    if record is not None:
+        record.delete()
+    discard_staged(namespace)
+    return ImportCheckpoint.objects.create(namespace=namespace, feed_digest=digest), False
+
+
+def discard_staged(namespace: str) -> None:
+    """discard_staged removes all objects staged by a resumable import into the namespace"""
+    for model, path in STAGED_MODELS:
+        model._default_manager.filter(
+            **{f"{path}namespace": namespace, f"{path}staged": True}
+        ).delete()
+
+
+@transaction.atomic
+def publish_staged(namespace: str) -> None:
+    """publish_staged replaces all published objects of the namespace (or, without a namespace,
+    all published objects) with the objects staged by a resumable import, and removes
+    its checkpoint. Readers see either the old or the new objects, never a mix of both."""
+    for model, path in STAGED_MODELS:
+        published = model._default_manager.filter(**{f"{path}staged": False})
+        if namespace:
+            published = published.filter(**{f"{path}namespace": namespace})
+        published.delete()
+
+    for model in SOURCE_ID_MODELS:
+        model._default_manager.filter(namespace=namespace, staged=True).update(staged=False)
+    ImportCheckpoint.objects.filter(namespace=namespace).delete()
+    DataVersion.bump()
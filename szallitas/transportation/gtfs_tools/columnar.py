@@ -0,0 +1,119 @@
+from array import array
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+# NOTE: All integer columns use the "i" typecode (signed C int, 4 bytes on all supported
+#       platforms), which is enough for stop indices, stop sequences and times in seconds.
+
+
+class Interner:
+    """Interner assigns consecutive integers to distinct strings,
+    so that repeated identifiers can be stored as plain ints in arrays."""
+
+    def __init__(self) -> None:
+        self.indices: dict[str, int] = {}
+        self.values: list[str] = []
+
+    def __call__(self, value: str) -> int:
+        index = self.indices.get(value)
+        if index is None:
+            index = len(self.values)
+            self.indices[value] = index
+            self.values.append(value)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class TripStopTimes(NamedTuple):
+    """TripStopTimes holds stop times of a single trip, ordered by stop_sequence:
+    interned stop indices and departure times in seconds."""
+
+    stops: memoryview
+    times: memoryview
+
+
+def trip_stop_times(stops: Iterable[int], times: Iterable[int]) -> TripStopTimes:
+    return TripStopTimes(memoryview(array("i", stops)), memoryview(array("i", times)))
+
+
+def travel_times(times: memoryview) -> "array[int]":
+    """travel_times converts departure times into offsets from the first departure"""
+    start = times[0]
+    return array("i", (time - start for time in times))
+
+
+class StopTimesTable:
+    """StopTimesTable holds a whole stop_times.txt table in memory, in columnar form.
+
+    Every column is an array of ints, making a stop time take 16 bytes,
+    instead of a few hundred bytes taken by a Python object with string attributes.
+    After all rows have been added, `freeze` must be called to group them by trips.
+    """
+
+    def __init__(self, stops: Interner) -> None:
+        self.stops = stops
+        self.trips = Interner()
+        self.trip_column = array("i")
+        self.sequence_column = array("i")
+        self.stop_column = array("i")
+        self.time_column = array("i")
+
+        # Trip with index i has its stop times at trip_offsets[i]:trip_offsets[i+1]
+        self.trip_offsets: "array[int] | None" = None
+
+    def __len__(self) -> int:
+        return len(self.trip_column)
+
+    def append(self, trip_id: str, stop_sequence: int, stop_id: str, time: int) -> None:
+        self.trip_column.append(self.trips(trip_id))
+        self.sequence_column.append(stop_sequence)
+        self.stop_column.append(self.stops(stop_id))
+        self.time_column.append(time)
+
+    def freeze(self) -> None:
+        """freeze sorts all stop times by (trip, stop_sequence) and indexes trips"""
+        n = len(self)
+        trip, sequence = self.trip_column, self.sequence_column
+
+        # Most feeds are already sorted - don't sort them again
+        is_sorted = all(
+            t1 < t2 or (t1 == t2 and s1 <= s2)
+            for t1, t2, s1, s2 in zip(trip, trip[1:], sequence, sequence[1:])
+        )
+        if not is_sorted:
+            order = sorted(range(n), key=lambda i: (trip[i] << 32) | sequence[i])
+            self.trip_column = array("i", (trip[i] for i in order))
+            self.sequence_column = array("i", (sequence[i] for i in order))
+            self.stop_column = array("i", (self.stop_column[i] for i in order))
+            self.time_column = array("i", (self.time_column[i] for i in order))
+
+        offsets = array("i", bytes(4 * (len(self.trips) + 1)))
+        for trip_index in self.trip_column:
+            offsets[trip_index + 1] += 1
+        for i in range(len(self.trips)):
+            offsets[i + 1] += offsets[i]
+        self.trip_offsets = offsets
+
+    def get(self, trip_id: str) -> TripStopTimes | None:
+        """get returns stop times of the provided trip, or None if it has no stop times"""
+        assert self.trip_offsets is not None, "StopTimesTable.freeze was not called"
+        trip_index = self.trips.indices.get(trip_id)
+        if trip_index is None:
+            return None
+        start, end = self.trip_offsets[trip_index], self.trip_offsets[trip_index + 1]
+        return TripStopTimes(
+            memoryview(self.stop_column)[start:end],
+            memoryview(self.time_column)[start:end],
+        )
+
+
+@lru_cache(maxsize=1 << 18)
+def parse_time(time_str: str) -> int:
+    """parse_time converts a GTFS time string (H:MM:SS) into seconds.
+
+    Results are cached - feeds repeat the same few thousand times millions of times,
+    and the cache is large enough to hold every second of a 72-hour service day."""
+    hours, minutes, seconds = time_str.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
@@ -0,0 +1,50 @@
+from datetime import date
+from typing import Iterable, NamedTuple
+
+from .horizon import weekday_count
+
+
+class CompactService(NamedTuple):
+    """CompactService describes the days a service runs on as a regular weekly calendar
+    with exceptions - like a row of calendar.txt with its calendar_dates.txt rows"""
+
+    start_date: date
+    end_date: date
+    weekdays: tuple[bool, bool, bool, bool, bool, bool, bool]  # Monday first
+    added: tuple[date, ...]
+    removed: tuple[date, ...]
+
+
+def compact_service(days: Iterable[int]) -> CompactService:
+    """compact_service converts an explicit list of service days (as date ordinals,
+    e.g. all calendar_dates.txt rows of a service without a calendar.txt row)
+    into a weekly calendar with the least possible number of exceptions.
+
+    The calendar spans from the first to the last service day. A weekday is included
+    if the service runs on more than half of its occurrences - as every weekday
+    is independent, this minimizes the number of exceptions.
+    """
+    day_set = set(days)
+    first, last = min(day_set), max(day_set)
+    start_date, end_date = date.fromordinal(first), date.fromordinal(last)
+
+    service_days = [0] * 7
+    for day in day_set:
+        # Ordinal 1 (0001-01-01) was a Monday
+        service_days[(day - 1) % 7] += 1
+    weekdays = tuple(
+        2 * service_days[weekday] > weekday_count(start_date, end_date, weekday)
+        for weekday in range(7)
+    )
+
+    return CompactService(
+        start_date,
+        end_date,
+        weekdays,  # type: ignore
+        tuple(date.fromordinal(day) for day in sorted(day_set) if not weekdays[(day - 1) % 7]),
+        tuple(
+            date.fromordinal(day)
+            for day in range(first, last + 1)
+            if weekdays[(day - 1) % 7] and day not in day_set
+        ),
+    )
@@ -0,0 +1,185 @@
+import struct
+import time
+import zlib
+from io import TextIOWrapper
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, Final, Iterable, NamedTuple, cast
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+# NOTE: This module must not depend on Django models
+
+SPOOLED_PART_SIZE: Final[int] = 16 << 20
+"""SPOOLED_PART_SIZE is the size of a (compressed, or buffered) part kept in memory,
+before it's moved to a temporary file"""
+
+COPY_BUFFER_SIZE: Final[int] = 1 << 20
+
+EMPTY_FINAL_BLOCK: Final[bytes] = zlib.compressobj(wbits=-zlib.MAX_WBITS).flush()
+"""EMPTY_FINAL_BLOCK ends a raw deflate stream made of concatenated parts"""
+
+DATA_DESCRIPTOR_FLAG: Final[int] = 0x08
+DATA_DESCRIPTOR_SIGNATURE: Final[int] = 0x08074B50
+
+
+class DeflatedPart(NamedTuple):
+    """DeflatedPart is a fragment of a zip member compressed on its own,
+    as a raw deflate stream which isn't finished - so that parts can be concatenated."""
+
+    data: IO[bytes]
+    crc: int
+    size: int
+    compressed_size: int
+
+
+class DeflateWriter:
+    """DeflateWriter compresses everything written into it into a DeflatedPart"""
+
+    def __init__(self) -> None:
+        self.compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS
+        )
+        self.data = cast(IO[bytes], SpooledTemporaryFile(max_size=SPOOLED_PART_SIZE, mode="w+b"))
+        self.crc = 0
+        self.size = 0
+
+    def write(self, b: bytes) -> int:
+        self.crc = zlib.crc32(b, self.crc)
+        self.size += len(b)
+        self.data.write(self.compressor.compress(b))
+        return len(b)
+
+    def finish(self) -> DeflatedPart:
+        """finish flushes the compressor, without finishing the deflate stream"""
+        self.data.write(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        compressed_size = self.data.tell()
+        self.data.seek(0)
+        return DeflatedPart(self.data, self.crc, self.size, compressed_size)
+
+
+class SpooledText:
+    """SpooledText is a text stream buffered in a spooled temporary file (kept in memory,
+    unless it's large), which is compressed into a DeflatedPart once it's written"""
+
+    def __init__(self) -> None:
+        self.data = cast(IO[bytes], SpooledTemporaryFile(max_size=SPOOLED_PART_SIZE, mode="w+b"))
+        self.text = TextIOWrapper(self.data, encoding="utf-8", newline="")
+
+    def deflate(self) -> DeflatedPart:
+        """deflate compresses the written text, and discards it"""
+        self.text.flush()
+        self.data.seek(0)
+        writer = DeflateWriter()
+        with self.text:
+            # Text is compressed in large blocks - zlib only releases the GIL for those
+            while chunk := self.data.read(COPY_BUFFER_SIZE):
+                writer.write(chunk)
+        return writer.finish()
+
+
+class DeflatedMember:
+    """DeflatedMember appends a member made of DeflatedParts to the archive, part by part -
+    so that parts can be written while the next ones are still being compressed.
+    Must be used as a context manager: leaving it finishes the member.
+
+    NOTE: ZipFile can't write compressed data as-is, so the member is appended the same way
+          ZipFile.open(name, "w", force_zip64=True) does it on unseekable files: its size
+          and CRC are written after the data (in a data descriptor), so the archive
+          is never seeked - and can be streamed.
+    """
+
+    def __init__(self, archive: ZipFile, name: str) -> None:
+        self.archive = archive
+        self.fp = cast(IO[bytes], archive.fp)
+        self.zinfo = ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        self.zinfo.compress_type = ZIP_DEFLATED
+        self.zinfo.external_attr = 0o600 << 16
+        self.zinfo.flag_bits |= DATA_DESCRIPTOR_FLAG
+        self.zinfo.file_size = 0
+        self.zinfo.compress_size = 0
+        self.zinfo.CRC = 0
+
+    def __enter__(self) -> "DeflatedMember":
+        self.zinfo.header_offset = self.fp.tell()
+        self.fp.write(self.zinfo.FileHeader(zip64=True))
+        return self
+
+    def append(self, part: DeflatedPart) -> None:
+        """append writes a part at the end of the member, and discards it"""
+        with part.data:
+            copyfileobj(part.data, self.fp, COPY_BUFFER_SIZE)
+        self.zinfo.CRC = crc32_combine(self.zinfo.CRC, part.crc, part.size)
+        self.zinfo.file_size += part.size
+        self.zinfo.compress_size += part.compressed_size
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if exc_info[0] is not None:
+            return
+
+        self.fp.write(EMPTY_FINAL_BLOCK)
+        self.zinfo.compress_size += len(EMPTY_FINAL_BLOCK)
+        self.fp.write(
+            struct.pack(
+                "<LLQQ",
+                DATA_DESCRIPTOR_SIGNATURE,
+                self.zinfo.CRC,
+                self.zinfo.compress_size,
+                self.zinfo.file_size,
+            )
+        )
+
+        self.archive.filelist.append(self.zinfo)
+        self.archive.NameToInfo[self.zinfo.filename] = self.zinfo
+        self.archive.start_dir = self.fp.tell()
+
+
+def write_deflated_member(archive: ZipFile, name: str, parts: Iterable[DeflatedPart]) -> None:
+    """write_deflated_member appends a member made of the provided parts to the archive"""
+    with DeflatedMember(archive, name) as member:
+        for part in parts:
+            member.append(part)
+
+
+def crc32_combine(crc1: int, crc2: int, len2: int) -> int:
+    """crc32_combine returns the CRC-32 of concatenated data, given CRC-32 of its first
+    and second part, and the length of the second part (port of zlib's crc32_combine)"""
+    if len2 <= 0:
+        return crc1
+
+    # Operator for a single zero bit, and for two zero bits
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = gf2_matrix_square(odd)
+    odd = gf2_matrix_square(even)
+
+    # Apply len2 zero bytes to crc1
+    while True:
+        even = gf2_matrix_square(odd)
+        if len2 & 1:
+            crc1 = gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+
+        odd = gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+
+    return crc1 ^ crc2
+
+
+def gf2_matrix_times(matrix: list[int], vector: int) -> int:
+    result = 0
+    for row in matrix:
+        if not vector:
+            break
+        if vector & 1:
+            result ^= row
+        vector >>= 1
+    return result
+
+
+def gf2_matrix_square(matrix: list[int]) -> list[int]:
+    return [gf2_matrix_times(matrix, row) for row in matrix]
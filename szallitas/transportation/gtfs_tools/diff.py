@@ -0,0 +1,52 @@
+from hashlib import blake2b
+from typing import Any, Generic, Hashable, Iterable, TypeVar
+
+from django.db.models import Model
+
+K = TypeVar("K", bound=Hashable)
+
+NOT_FINGERPRINTED_FIELDS = frozenset(("id", "source_id", "fingerprint", "namespace", "staged"))
+
+
+def fingerprint(*values: Any) -> str:
+    """fingerprint returns a short, stable hash of the provided values"""
+    return blake2b(repr(values).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def model_fingerprint(obj: Model) -> str:
+    """model_fingerprint hashes values of all concrete fields of an object,
+    except for its primary key, source_id, fingerprint, namespace and staged flag"""
+    return fingerprint(
+        *(
+            getattr(obj, field.attname)
+            for field in obj._meta.concrete_fields
+            if field.attname not in NOT_FINGERPRINTED_FIELDS
+        )
+    )
+
+
+class StoredObjects(Generic[K]):
+    """StoredObjects indexes objects already present in the database
+    by a key identifying them in the imported feed (e.g. GTFS ID),
+    together with a value used to detect changes (e.g. fingerprint).
+
+    Every object which was not matched with `match` is considered stale,
+    as it no longer appears in the feed.
+    """
+
+    def __init__(self, rows: Iterable[tuple[K | None, int, Any]]) -> None:
+        self.by_key: dict[K, tuple[int, Any]] = {}
+        self.stale: set[int] = set()
+
+        for key, pk, value in rows:
+            self.stale.add(pk)
+            if key is not None:
+                self.by_key[key] = (pk, value)
+
+    def match(self, key: K) -> tuple[int, Any] | None:
+        """match returns the (primary key, value) of an object with the provided key,
+        and marks that object as not stale"""
+        found = self.by_key.pop(key, None)
+        if found is not None:
+            self.stale.discard(found[0])
+        return found
@@ -0,0 +1,146 @@
+import csv
+import heapq
+from contextlib import ExitStack
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Any, Callable, Final, Generic, Iterable, Iterator, TypeVar
+
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
+StopTimeRow = tuple[str, int, str, int]
+"""StopTimeRow is a (trip_id, stop_sequence, stop_id, departure_time in seconds) tuple"""
+
+R = TypeVar("R", bound=tuple[Any, ...])
+
+
+class ExternalSorter(Generic[R]):
+    """ExternalSorter sorts rows by `sort_key` using bounded memory.
+
+    At most `buffer_size` rows are kept in memory. Whenever the buffer fills up,
+    it is sorted and spilled into a temporary CSV file (a "run"), from which rows
+    are restored by `decode`. The runs are then lazily k-way merged by `sorted_rows`.
+
+    The sorter must be used as a context manager, so that the runs are removed
+    once they are no longer needed.
+    """
+
+    MAX_OPEN_RUNS: Final[int] = 64
+    # Runs are pre-merged in groups if there are more of them, to avoid running
+    # out of file descriptors on very large feeds with small buffers.
+
+    def __init__(self, buffer_size: int, sort_key: Callable[[R], Any]) -> None:
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be positive")
+
+        self.buffer_size = buffer_size
+        self.sort_key = sort_key
+        self.buffer: list[R] = []
+        self.runs: list[Path] = []
+        self.runs_written: int = 0
+        self.temp_dir: TemporaryDirectory[str] | None = None
+
+    def decode(self, row: list[str]) -> R:
+        """decode converts a row read from a run back into a sorted row"""
+        raise NotImplementedError
+
+    def __enter__(self) -> "Self":
+        self.temp_dir = TemporaryDirectory(prefix="szallitas-sort-")
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.buffer.clear()
+        self.runs.clear()
+        if self.temp_dir:
+            self.temp_dir.cleanup()
+            self.temp_dir = None
+
+    def add(self, row: R) -> None:
+        self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_size:
+            self.spill()
+
+    def extend(self, rows: Iterable[R]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def new_run_path(self) -> Path:
+        """new_run_path reserves a path for a run, which is written by someone else
+        (e.g. a worker process) and later registered with `add_run`"""
+        assert self.temp_dir is not None, f"{type(self).__name__} used outside of a with block"
+        path = Path(self.temp_dir.name) / f"run-{self.runs_written:06}.csv"
+        self.runs_written += 1
+        return path
+
+    def add_run(self, path: Path) -> None:
+        """add_run registers a run previously written with `write_run`"""
+        self.runs.append(path)
+
+    def spill(self) -> None:
+        """spill writes the current buffer into a new sorted run"""
+        if not self.buffer:
+            return
+        self.buffer.sort(key=self.sort_key)
+        self.runs.append(self._write_run(self.buffer))
+        self.buffer.clear()
+
+    def sorted_rows(self) -> Iterator[R]:
+        """sorted_rows returns all added rows, ordered by `sort_key`"""
+        if not self.runs:
+            # Everything fits into memory - no need to touch the disk
+            self.buffer.sort(key=self.sort_key)
+            yield from self.buffer
+            return
+
+        self.spill()
+        while len(self.runs) > self.MAX_OPEN_RUNS:
+            group = self.runs[: self.MAX_OPEN_RUNS]
+            del self.runs[: self.MAX_OPEN_RUNS]
+            with ExitStack() as stack:
+                streams = self._open_runs(stack, group)
+                self.runs.append(self._write_run(heapq.merge(*streams, key=self.sort_key)))
+            for path in group:
+                path.unlink()
+
+        with ExitStack() as stack:
+            streams = self._open_runs(stack, self.runs)
+            yield from heapq.merge(*streams, key=self.sort_key)
+
+    def _write_run(self, rows: Iterable[R]) -> Path:
+        path = self.new_run_path()
+        write_run(path, rows)
+        return path
+
+    def _open_runs(self, stack: ExitStack, paths: Iterable[Path]) -> list[Iterator[R]]:
+        return [
+            map(
+                self.decode,
+                csv.reader(stack.enter_context(p.open("r", encoding="utf-8", newline=""))),
+            )
+            for p in paths
+        ]
+
+
+class StopTimesSorter(ExternalSorter[StopTimeRow]):
+    """StopTimesSorter sorts stop_times by (trip_id, stop_sequence) using bounded memory
+    (see ExternalSorter)"""
+
+    def __init__(self, buffer_size: int) -> None:
+        super().__init__(buffer_size, itemgetter(0, 1))
+
+    def decode(self, row: list[str]) -> StopTimeRow:
+        trip_id, stop_seq, stop_id, departure = row
+        return trip_id, int(stop_seq), stop_id, int(departure)
+
+    def by_trip(self) -> Iterator[tuple[str, list[StopTimeRow]]]:
+        """by_trip groups sorted rows by trip_id, holding only one trip in memory at a time"""
+        for trip_id, rows in groupby(self.sorted_rows(), key=itemgetter(0)):
+            yield trip_id, list(rows)
+
+
+def write_run(path: Path, rows: Iterable[tuple[Any, ...]]) -> None:
+    """write_run saves already-sorted rows into a run file"""
+    with path.open("w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
@@ -0,0 +1,84 @@
+from contextlib import contextmanager
+from typing import Callable, Final, Generator, Iterable
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Model
+
+FAST_LOAD_PRAGMAS: Final[dict[str, str]] = {
+    # Negative values are in KiB - use a 256 MiB page cache
+    "cache_size": "-262144",
+    "temp_store": "MEMORY",
+}
+# NOTE: journal_mode and synchronous can't be changed inside a transaction.
+#       Connections are switched to WAL when they're opened (see apps.py), in which mode
+#       nothing is synced before the commit anyway - and the commit stays fully durable.
+
+
+@contextmanager
+def sqlite_fast_load(
+    models: Iterable[type[Model]],
+    on_rebuild: Callable[[], None] | None = None,
+) -> Generator[None, None, None]:
+    """sqlite_fast_load speeds up loading lots of rows into the tables of the provided models
+    on SQLite. On other backends, it does nothing.
+
+    For the duration of the block, import-friendly pragmas are set, and secondary indexes
+    of the tables (e.g. indexes of foreign keys) are dropped. After the block, the indexes are
+    re-created and the tables are analyzed, so that the query planner has fresh statistics.
+
+    Must be used inside a transaction: if the block fails, rolling back the transaction
+    brings the dropped indexes back.
+
+    `on_rebuild` is called before the indexes are re-created.
+    """
+    if connection.vendor != "sqlite":
+        yield
+        return
+
+    if not connection.in_atomic_block:
+        raise transaction.TransactionManagementError("sqlite_fast_load requires a transaction")
+
+    tables = [model._meta.db_table for model in models]
+    quote = connection.ops.quote_name
+
+    with connection.cursor() as cursor:
+        previous_pragmas: dict[str, str] = {}
+        for pragma, value in FAST_LOAD_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}")
+            row = cursor.fetchone()
+            previous = str(row[0]) if row else ""
+            try:
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+            except DatabaseError:
+                # Some pragmas (e.g. temp_store) can't be changed once the transaction
+                # has written anything - they are only an optimization, so skip them
+                continue
+            previous_pragmas[pragma] = previous
+
+        # NOTE: Indexes without SQL are created implicitly by SQLite for PRIMARY KEY and UNIQUE
+        #       constraints declared in CREATE TABLE, and can't be dropped without rebuilding
+        #       the whole table. Unique constraints declared in Meta.constraints are declared
+        #       inline by Django, and are kept as well.
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            f"AND tbl_name IN ({', '.join(['%s'] * len(tables))})",
+            tables,
+        )
+        indexes: list[tuple[str, str]] = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {quote(name)}")
+
+    try:
+        yield
+
+        if on_rebuild:
+            on_rebuild()
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+            for table in tables:
+                cursor.execute(f"ANALYZE {quote(table)}")
+    finally:
+        with connection.cursor() as cursor:
+            for pragma, value in previous_pragmas.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
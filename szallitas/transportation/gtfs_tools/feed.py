@@ -0,0 +1,122 @@
+import io
+import mmap
+from pathlib import Path
+from typing import IO, Any
+from zipfile import ZipFile
+
+# NOTE: This module must not depend on Django models,
+#       as it's also used by the (Django-free) validator and worker processes.
+
+
+class MappedTable(io.RawIOBase):
+    """MappedTable is a read-only binary stream over a memory-mapped file.
+
+    Reads are sliced straight out of the page cache, without the extra copy
+    made by the buffer of a regular file. Wrap it in an io.TextIOWrapper to read text.
+    """
+
+    def __init__(self, path: Path) -> None:
+        super().__init__()
+        self.name = str(path)
+        with path.open("rb") as f:
+            # Empty files can't be memory-mapped
+            size = path.stat().st_size
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.view = memoryview(self.map) if self.map is not None else memoryview(b"")
+        self.position = 0
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def find(self, sub: bytes, start: int = 0) -> int:
+        """find returns the lowest index of `sub` in the file (not before `start`), or -1"""
+        return self.map.find(sub, start) if self.map is not None else -1
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size < 0 else self.position + size
+        chunk = self.view[self.position : end].tobytes()
+        self.position += len(chunk)
+        return chunk
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def readinto(self, buffer: Any) -> int:
+        chunk = self.view[self.position : self.position + len(buffer)]
+        size = len(chunk)
+        memoryview(buffer).cast("B")[:size] = chunk
+        self.position += size
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            self.view.release()
+            if self.map is not None:
+                self.map.close()
+        super().close()
+
+
+class DirectoryFeed:
+    """DirectoryFeed provides tables of an unpacked GTFS feed with the subset of the ZipFile
+    interface used by the importer and validator, so that both kinds of feeds
+    can be handled by the same code.
+
+    Tables are read through memory-mapped files, and `extract` returns paths
+    of the tables in place - so workers can parse byte ranges of large tables
+    without first copying them out of an archive.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        if not self.path.is_dir():
+            raise NotADirectoryError(str(self.path))
+
+    def __enter__(self) -> "DirectoryFeed":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def namelist(self) -> list[str]:
+        return sorted(p.name for p in self.path.iterdir() if p.is_file())
+
+    def open(self, name: str, mode: str = "r") -> MappedTable:
+        if mode != "r":
+            raise ValueError("DirectoryFeed is read-only")
+        path = self.path / name
+        if not path.is_file():
+            raise KeyError(name)
+        return MappedTable(path)
+
+    def extract(self, name: str, path: Any = None) -> str:
+        """extract returns the path of a table - without copying it anywhere"""
+        return str(self.path / name)
+
+
+Feed = ZipFile | DirectoryFeed
+"""Feed is an opened GTFS feed: either a zip archive, or an unpacked directory"""
+
+
+def open_feed(source: str | Path | IO[bytes]) -> Feed:
+    """open_feed opens a GTFS feed from a zip archive (given as a path or a file object),
+    or from a directory with unpacked tables"""
+    if isinstance(source, (str, Path)) and Path(source).is_dir():
+        return DirectoryFeed(source)
+    return ZipFile(source, "r")
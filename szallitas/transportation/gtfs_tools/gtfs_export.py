@@ -1,22 +1,56 @@
 import csv
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
-from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import IO, Any, Callable, Iterable
+from functools import partial
+from io import TextIOWrapper
+from itertools import groupby
+from operator import itemgetter
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
+from typing import IO, TYPE_CHECKING, Any, Callable, Final, Generator, Iterator, cast
 from zipfile import ZIP_DEFLATED, ZipFile
 
-from ..models import Agency, Calendar, CalendarException, Line, Pattern, Stop
+from django.db import connection, transaction
+from django.db.models import Count, QuerySet
 
+from ..models import (
+    Agency,
+    Calendar,
+    CalendarException,
+    Frequency,
+    Line,
+    Pattern,
+    PatternStop,
+    Stop,
+    TravelTimeProfile,
+    Trip,
+)
+from ..models.times import format_time
+from .deflate import DeflatedMember, DeflatedPart, SpooledText, write_deflated_member
 
-def seconds_to_gtfs_time(s: int) -> str:
-    """seconds_to_gtfs_time converts seconds-since-midnight into a GTFS-compliant string."""
-    m, s = divmod(s, 60)
-    h, m = divmod(m, 60)
-    return f"{h:0>2}:{m:0>2}:{s:0>2}"
+if TYPE_CHECKING:
+    from django.db.models.query import ValuesQuerySet
 
+# NOTE: Times are formatted by a cached helper shared with the models
+seconds_to_gtfs_time = format_time
 
-def open_table(path: Path) -> IO[str]:
-    return path.open(mode="w", encoding="utf-8", newline="")
+
+SPOOLED_TABLE_SIZE: Final[int] = 64 << 20
+"""SPOOLED_TABLE_SIZE is the size of trips.txt (in characters) kept in memory during export,
+before it's moved to a temporary file"""
+
+COPY_BUFFER_SIZE: Final[int] = 1 << 20
+
+EXPORT_CHUNK_SIZE: Final[int] = 4000
+"""EXPORT_CHUNK_SIZE is the number of rows fetched from the database at once during export"""
+
+RANGES_PER_WORKER: Final[int] = 2
+# Number of pattern ranges per worker in parallel exports, so that compression
+# of the first ranges starts while the later ones are being generated.
+
+PatternRange = tuple[int, int | None]
+"""PatternRange is a [first, end) range of Pattern IDs. The range is unbounded if end is None."""
 
 
 @dataclass(frozen=True)
@@ -39,23 +73,37 @@ class FieldMapping:
     converter: Callable[[Any], Any] | None = None
 
     def serialize_attribute(self, attr: Any) -> Any:
-        # NOTE: csv.writer automatically calls str on the result
+        return self.compile()(attr)
 
+    def compile(self) -> Callable[[Any], Any]:
+        """compile returns a function serializing values of the field,
+        so that the mapping doesn't have to be inspected for every row"""
+        # NOTE: csv.writer automatically calls str on the result
         if self.converter:
-            return self.converter(attr)
-        else:
-            return attr if attr is not None else self.fallback
+            return self.converter
+
+        fallback = self.fallback
+        return lambda attr: attr if attr is not None else fallback
 
 
 def export_simple_table(
     to: IO[str],
-    objects: Iterable[Any],
+    objects: "QuerySet[Any]",
     fields: list[FieldMapping],
 ) -> None:
-    """export_simple_table exports model objects into GTFS as per the provided FieldMappings"""
+    """export_simple_table exports model objects into GTFS as per the provided FieldMappings.
+
+    Only the mapped columns are read from the database, in chunks ordered by primary key -
+    no model instances are created.
+    """
     w = csv.writer(to)
     w.writerow(f.gtfs for f in fields)
-    w.writerows((f.serialize_attribute(getattr(obj, f.model)) for f in fields) for obj in objects)
+
+    converters = [f.compile() for f in fields]
+    if not objects.ordered:
+        objects = objects.order_by("pk")
+    rows = fetch_rows(objects.values_list(*(f.model for f in fields)))
+    w.writerows([convert(value) for convert, value in zip(converters, row)] for row in rows)
 
 
 def export_agencies(to: IO[str]) -> None:
@@ -155,92 +203,385 @@ def export_calendars_dates(to: IO[str]) -> None:
     )
 
 
-def export_trips_and_stop_times(f_trips: IO[str], f_times: IO[str]) -> None:
-    """export_trips_and_stop_times exports all patterns and their trips
-    into GTFS trips.txt and stop_times.txt tables."""
+@transaction.atomic(savepoint=False)
+def export_trips_and_stop_times(
+    f_trips: IO[str],
+    f_times: IO[str],
+    f_frequencies: IO[str] | None = None,
+    patterns: PatternRange | None = None,
+    header: bool = True,
+) -> None:
+    """export_trips_and_stop_times exports all patterns and trips of their travel time profiles
+    into GTFS trips.txt and stop_times.txt tables.
+
+    Frequencies are exported into frequencies.txt, with a single template trip
+    for every frequency. If `f_frequencies` is not provided, frequencies are expanded
+    into individual trips instead.
+
+    Every table is read by a single query ordered by pattern (see OrderedGroups),
+    and the queries are walked together - so the number of queries doesn't depend
+    on the number of patterns, and only rows of a single pattern are kept in memory.
+
+    If `patterns` are provided, only trips of patterns in that range are exported -
+    and if `header` isn't set, the tables are written without their header rows,
+    so that they can be appended to tables with other ranges.
+
+    The queries are walked inside a transaction, as on PostgreSQL their rows are streamed
+    through server-side cursors - which, outside of a transaction, are materialized in full.
+    """
     w_trips = csv.writer(f_trips)
-    w_trips.writerow(
-        (
-            "route_id",
-            "service_id",
-            "trip_id",
-            "trip_headsign",
-            "direction_id",
-            "wheelchair_accessible",
+    w_frequencies = csv.writer(f_frequencies) if f_frequencies else None
+    if header:
+        w_trips.writerow(
+            (
+                "route_id",
+                "service_id",
+                "trip_id",
+                "trip_headsign",
+                "direction_id",
+                "wheelchair_accessible",
+            )
         )
+        f_times.write("trip_id,stop_sequence,stop_id,arrival_time,departure_time\r\n")
+        if w_frequencies:
+            w_frequencies.writerow(
+                ("trip_id", "start_time", "end_time", "headway_secs", "exact_times")
+            )
+
+    pattern_rows = fetch_rows(
+        in_range(Pattern.objects, "id", patterns)
+        .order_by("id")
+        .values_list("id", "line_id", "headsign", "direction")
+    )
+    pattern_stops = OrderedGroups(
+        in_range(PatternStop.objects, "pattern_id", patterns)
+        .order_by("pattern_id", "index")
+        .values_list("pattern_id", "index", "stop_id"),
+        key_length=1,
+    )
+    profiles = OrderedGroups(
+        in_range(TravelTimeProfile.objects, "pattern_id", patterns)
+        .order_by("pattern_id", "id")
+        .values_list("pattern_id", "id", "travel_times"),
+        key_length=1,
+    )
+    trips = OrderedGroups(
+        in_range(Trip.objects, "profile__pattern_id", patterns)
+        .order_by("profile__pattern_id", "profile_id", "id")
+        .values_list(
+            "profile__pattern_id",
+            "profile_id",
+            "id",
+            "calendar_id",
+            "wheelchair_accessible",
+            "departure",
+        ),
+        key_length=2,
+    )
+    frequencies = OrderedGroups(
+        in_range(Frequency.objects, "profile__pattern_id", patterns)
+        .order_by("profile__pattern_id", "profile_id", "id")
+        .values_list(
+            "profile__pattern_id",
+            "profile_id",
+            "id",
+            "calendar_id",
+            "wheelchair_accessible",
+            "start_time",
+            "end_time",
+            "headway",
+            "exact_times",
+        ),
+        key_length=2,
     )
 
-    w_times = csv.writer(f_times)
-    w_times.writerow(("trip_id", "stop_sequence", "stop_id", "arrival_time", "departure_time"))
-
-    for pattern in Pattern.objects.all():
-        pattern_stops = list(pattern.pattern_stop_set.all())
-
-        for trip in pattern.trip_set.all():
-            w_trips.writerow(
-                (
-                    pattern.line_id,
-                    trip.calendar_id,
-                    trip.id,
-                    pattern.headsign or "",
-                    pattern.direction if pattern.direction is not None else "",
-                    trip.wheelchair_accessible,
+    for pattern_id, line_id, headsign, direction in pattern_rows:
+        headsign = headsign or ""
+        direction = direction if direction is not None else ""
+        stops = [
+            (f",{index},{stop_id},", index) for _, index, stop_id in pattern_stops.take(pattern_id)
+        ]
+
+        for _, profile_id, travel_times in profiles.take(pattern_id):
+            # (",stop_sequence,stop_id,", seconds from the departure) of every stop
+            # of the profile - a row of stop_times.txt is rendered by surrounding it
+            # with the trip_id and the time
+            stop_offsets = [(stop, travel_times[index]) for stop, index in stops]
+
+            def write_trip(
+                trip_id: str | int, calendar_id: int, wheelchair_accessible: int, departure: int
+            ) -> None:
+                w_trips.writerow(
+                    (line_id, calendar_id, trip_id, headsign, direction, wheelchair_accessible)
                 )
-            )
-
-            for pattern_stop in pattern_stops:
-                time_at_stop = trip.departure + pattern_stop.travel_time
-                gtfs_time_at_stop = seconds_to_gtfs_time(round(time_at_stop.total_seconds()))
-                w_times.writerow(
-                    (
-                        trip.id,
-                        pattern_stop.index,
-                        pattern_stop.stop_id,
-                        gtfs_time_at_stop,
-                        gtfs_time_at_stop,
+                # NOTE: None of the stop_times.txt columns ever need quoting,
+                #       so rows are rendered directly - without csv.writer
+                rows: list[str] = []
+                for stop, offset in stop_offsets:
+                    gtfs_time_at_stop = seconds_to_gtfs_time(departure + offset)
+                    rows.append(f"{trip_id}{stop}{gtfs_time_at_stop},{gtfs_time_at_stop}\r\n")
+                f_times.write("".join(rows))
+
+            key = (pattern_id, profile_id)
+            for _, _, trip_id, calendar_id, wheelchair_accessible, departure in trips.take(key):
+                write_trip(trip_id, calendar_id, wheelchair_accessible, departure)
+
+            # NOTE: Trip IDs of frequencies are prefixed, not to collide with IDs of Trips
+            for (
+                _,
+                _,
+                frequency_id,
+                calendar_id,
+                wheelchair_accessible,
+                start_time,
+                end_time,
+                headway,
+                exact_times,
+            ) in frequencies.take(key):
+                if w_frequencies:
+                    trip_id = f"F{frequency_id}"
+                    write_trip(trip_id, calendar_id, wheelchair_accessible, start_time)
+                    w_frequencies.writerow(
+                        (
+                            trip_id,
+                            seconds_to_gtfs_time(start_time),
+                            seconds_to_gtfs_time(end_time),
+                            headway,
+                            int(exact_times),
+                        )
                     )
-                )
+                elif headway > 0:
+                    for idx, departure in enumerate(range(start_time, end_time, headway)):
+                        write_trip(
+                            f"F{frequency_id}-{idx}", calendar_id, wheelchair_accessible, departure
+                        )
+
+
+def in_range(objects: Any, field: str, patterns: PatternRange | None) -> "QuerySet[Any]":
+    """in_range filters objects to the ones with `field` (a Pattern ID) in the range"""
+    if patterns is None:
+        return objects.all()
+    first, end = patterns
+    objects = objects.filter(**{f"{field}__gte": first})
+    return objects.filter(**{f"{field}__lt": end}) if end is not None else objects
+
+
+def fetch_rows(rows: "ValuesQuerySet[Any, Any]") -> Iterator[tuple[Any, ...]]:
+    """fetch_rows iterates over a values_list query in chunks, without caching its results.
+    On PostgreSQL, the rows are streamed through a server-side cursor."""
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
 
+class OrderedGroups:
+    """OrderedGroups walks rows of a values_list query in groups sharing the first
+    `key_length` columns, which the query must be ordered by.
 
-def export_all(to_zip: IO[bytes]) -> None:
+    Rows of tables ordered by the same keys can be joined in Python by taking their groups
+    in order - with a single query for every table, and without loading whole tables.
+    """
+
+    def __init__(self, rows: "ValuesQuerySet[Any, Any]", key_length: int) -> None:
+        key = itemgetter(0) if key_length == 1 else itemgetter(*range(key_length))
+        self.groups = groupby(fetch_rows(rows), key)
+        self.advance()
+
+    def advance(self) -> None:
+        self.key, self.rows = next(self.groups, (None, iter(())))
+
+    def take(self, key: Any) -> list[tuple[Any, ...]]:
+        """take returns rows of the group with the provided key. Groups with preceding keys
+        (e.g. of objects which aren't exported) are skipped, so keys must be taken in order."""
+        while self.key is not None and self.key < key:
+            self.advance()
+        if self.key != key:
+            return []
+        rows = list(self.rows)
+        self.advance()
+        return rows
+
+
+SIMPLE_TABLES: Final[tuple[tuple[str, Callable[[IO[str]], None]], ...]] = (
+    ("agency.txt", export_agencies),
+    ("routes.txt", export_routes),
+    ("stops.txt", export_stops),
+    ("calendar.txt", export_calendars),
+    ("calendar_dates.txt", export_calendars_dates),
+)
+
+
+def export_all(to_zip: IO[bytes], workers: int = 1) -> None:
     """export_all exports currently stored data as GTFS.
     The resulting ZIP archive is written to the provided handle.
+
+    Tables are compressed straight into the archive as they're generated.
+    trips.txt and frequencies.txt are generated together with stop_times.txt, so they're
+    buffered in spooled temporary files (kept in memory, unless they're large)
+    and added after stop_times.txt - which is never buffered.
+
+    All tables are read from a single snapshot of the database (see snapshot).
+    With more than one worker, tables are compressed in parallel instead
+    (see export_parallel).
+    """
+    if workers > 1:
+        export_parallel(to_zip, workers)
+        return
+
+    with snapshot(), ZipFile(to_zip, mode="w", compression=ZIP_DEFLATED) as archive:
+        for file_name, exporter in SIMPLE_TABLES:
+            with open_member(archive, file_name) as f:
+                exporter(f)
+
+        has_frequencies = Frequency.objects.exists()
+        with spooled_table() as f_trips, spooled_table() as f_frequencies:
+            with open_member(archive, "stop_times.txt") as f_times:
+                export_trips_and_stop_times(
+                    f_trips, f_times, f_frequencies if has_frequencies else None
+                )
+
+            copy_member(archive, "trips.txt", f_trips)
+            if has_frequencies:
+                copy_member(archive, "frequencies.txt", f_frequencies)
+
+
+@contextmanager
+def snapshot() -> Generator[None, None, None]:
+    """snapshot makes all queries inside the block read the same committed state
+    of the database, by running them in a single transaction.
+
+    On PostgreSQL, the transaction is switched to REPEATABLE READ - under the default
+    READ COMMITTED, every query would see all changes committed before it started.
+    SQLite transactions always read a single snapshot.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic(savepoint=False):
+        # NOTE: The isolation level can only be set before the first query of a transaction
+        if outermost and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        yield
+
+
+def export_parallel(to_zip: IO[bytes], workers: int) -> None:
+    """export_parallel exports currently stored data as GTFS, compressing trips,
+    stop times and frequencies in a pool of worker threads, and writes the resulting
+    ZIP archive to the provided handle.
+
+    The archive is written as it's generated, from a single snapshot of the database.
+    Simple tables are compressed straight into the archive, like in export_all.
+    Trips, stop times and frequencies are then generated in ranges of patterns
+    with similar numbers of stop times - every generated range is buffered,
+    and compressed by a worker on its own while the next ones are generated.
+    Compressed ranges of stop_times.txt are appended to the archive in order,
+    as soon as they're ready; trips.txt and frequencies.txt follow once all ranges are done.
+
+    NOTE: Workers don't query the database, as queries through their own connections
+          could read different committed states of the data. Compression is done
+          without holding the GIL.
     """
+    with ThreadPoolExecutor(workers, thread_name_prefix="gtfs-export-worker") as pool:
+        with snapshot(), ZipFile(to_zip, mode="w", compression=ZIP_DEFLATED) as archive:
+            for file_name, exporter in SIMPLE_TABLES:
+                with open_member(archive, file_name) as f:
+                    exporter(f)
+
+            has_frequencies = Frequency.objects.exists()
+            trip_tables: "list[list[Future[DeflatedPart]]]" = []
+            with DeflatedMember(archive, "stop_times.txt") as stop_times:
+                appended = 0
+                for i, patterns in enumerate(pattern_ranges(workers * RANGES_PER_WORKER)):
+                    trip_tables.append(
+                        export_parts(
+                            pool,
+                            partial(export_trips_and_stop_times, patterns=patterns, header=i == 0),
+                            3 if has_frequencies else 2,
+                        )
+                    )
+                    # Append stop times of the ranges which are already compressed,
+                    # without waiting for the ones still being compressed
+                    while appended < len(trip_tables) and trip_tables[appended][1].done():
+                        stop_times.append(trip_tables[appended][1].result())
+                        appended += 1
+
+                for ranged in trip_tables[appended:]:
+                    stop_times.append(ranged[1].result())
+
+            write_deflated_member(
+                archive, "trips.txt", (ranged[0].result() for ranged in trip_tables)
+            )
+            if has_frequencies:
+                write_deflated_member(
+                    archive, "frequencies.txt", (ranged[2].result() for ranged in trip_tables)
+                )
+
+
+def export_parts(
+    pool: ThreadPoolExecutor, export: Callable[..., None], tables: int
+) -> "list[Future[DeflatedPart]]":
+    """export_parts calls an exporter writing the provided number of tables,
+    and submits compression of every table to the pool"""
+    outputs = [SpooledText() for _ in range(tables)]
+    export(*(output.text for output in outputs))
+    return [pool.submit(output.deflate) for output in outputs]
+
+
+def pattern_ranges(parts: int) -> list[PatternRange | None]:
+    """pattern_ranges splits all patterns into at most `parts` ranges,
+    with similar numbers of stop times"""
+    trips = dict(
+        Trip.objects.values_list("profile__pattern_id")
+        .annotate(Count("id"))
+        .order_by("profile__pattern_id")
+    )
+    stops = (
+        PatternStop.objects.values_list("pattern_id").annotate(Count("id")).order_by("pattern_id")
+    )
+    splits = balanced_splits(
+        [(pattern_id, trips.get(pattern_id, 0) * count) for pattern_id, count in stops], parts
+    )
+    if not splits:
+        return [None]
+    return list(zip([0, *splits], [*splits, None]))
+
+
+def balanced_splits(weights: list[tuple[int, int]], parts: int) -> list[int]:
+    """balanced_splits splits (ID, weight) pairs, ordered by ID, into at most `parts` groups
+    with similar sums of weights. Returns the first ID of every group but the first one."""
+    total = sum(weight for _, weight in weights)
+    splits: list[int] = []
+    if total <= 0:
+        return splits
+
+    cumulative = 0
+    for id, weight in weights:
+        if len(splits) < parts - 1 and cumulative >= total * (len(splits) + 1) / parts:
+            splits.append(id)
+        cumulative += weight
+    return splits
+
+
+def open_member(archive: ZipFile, file_name: str) -> IO[str]:
+    """open_member opens a new member of the archive for writing text.
+    Its size isn't known up front, so it's always allowed to exceed 2 GiB."""
+    return TextIOWrapper(
+        archive.open(file_name, mode="w", force_zip64=True), encoding="utf-8", newline=""
+    )
+
+
+def spooled_table() -> IO[str]:
+    return cast(
+        IO[str],
+        SpooledTemporaryFile(
+            max_size=SPOOLED_TABLE_SIZE,
+            mode="w+",
+            encoding="utf-8",
+            newline="",
+            prefix="szallitas-gtfs-export-",
+        ),
+    )
+
 
-    # NOTE: TemporaryDirectory necessary for simultaneous opening
-    #       of trips.txt and stop_times.txt
-
-    with TemporaryDirectory(prefix="szallitas-gtfs-export") as temp_dir_str:
-        temp_dir = Path(temp_dir_str)
-
-        # Export files
-        with open_table(temp_dir / "agency.txt") as f:
-            export_agencies(f)
-        with open_table(temp_dir / "routes.txt") as f:
-            export_routes(f)
-        with open_table(temp_dir / "stops.txt") as f:
-            export_stops(f)
-        with open_table(temp_dir / "calendar.txt") as f:
-            export_calendars(f)
-        with open_table(temp_dir / "calendar_dates.txt") as f:
-            export_calendars_dates(f)
-        with (
-            open_table(temp_dir / "trips.txt") as f_trips,
-            open_table(temp_dir / "stop_times.txt") as f_times,
-        ):
-            export_trips_and_stop_times(f_trips, f_times)
-
-        # Export to GTFS zip
-        with ZipFile(to_zip, mode="w", compression=ZIP_DEFLATED) as archive:
-            file_names = [
-                "agency.txt",
-                "routes.txt",
-                "stops.txt",
-                "calendar.txt",
-                "calendar_dates.txt",
-                "trips.txt",
-                "stop_times.txt",
-            ]
-
-            for file_name in file_names:
-                archive.write(temp_dir / file_name, file_name)
+def copy_member(archive: ZipFile, file_name: str, table: IO[str]) -> None:
+    """copy_member writes a spooled table into a new member of the archive"""
+    table.seek(0)
+    with open_member(archive, file_name) as f:
+        copyfileobj(table, f, COPY_BUFFER_SIZE)
@@ -1,278 +1,1028 @@
-import csv
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+from array import array
+from concurrent.futures import Executor, Future
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import date
 from io import TextIOWrapper
-from itertools import islice
+from itertools import chain
 from pathlib import Path
-from typing import IO, Final, Iterable, Mapping
-from zipfile import ZipFile
+from tempfile import TemporaryDirectory
+from typing import (
+    IO,
+    Any,
+    Callable,
+    ContextManager,
+    Generator,
+    Iterable,
+    Mapping,
+    Sequence,
+    TypeVar,
+)
 
 from django.db import connection, transaction
-from django.db.models import Max
+from django.db.models import Model
 
-from ..models import Agency, Calendar, CalendarException, Line, Pattern, PatternStop, Stop, Trip
+from ..models import (
+    Agency,
+    Calendar,
+    CalendarException,
+    DataVersion,
+    Frequency,
+    Line,
+    Pattern,
+    PatternStop,
+    Stop,
+    TravelTimeProfile,
+    Trip,
+)
+from ..models.imported import ImportedModel
+from .bulk_writer import BulkWriter, bulk_writer
+from .checkpoints import (
+    CHECKPOINT_TRIPS,
+    Checkpoints,
+    feed_digest,
+    publish_staged,
+    start_checkpoint,
+)
+from .columnar import (
+    Interner,
+    StopTimesTable,
+    TripStopTimes,
+    parse_time,
+    travel_times,
+    trip_stop_times,
+)
+from .compaction import CompactService, compact_service
+from .diff import StoredObjects, fingerprint, model_fingerprint
+from .external_sort import StopTimeRow, StopTimesSorter
+from .fast_load import sqlite_fast_load
+from .feed import Feed, open_feed
+from .horizon import (
+    CALENDAR_COLUMNS,
+    CALENDAR_DATES_COLUMNS,
+    DateWindow,
+    active_services,
+    parse_date,
+)
+from .parsing import (
+    CHUNKS_PER_WORKER,
+    TripRow,
+    TripsSorter,
+    estimate_rows,
+    iter_stop_times,
+    iter_trips,
+    parse_stop_times_chunk,
+    parse_trips_chunk,
+    read_columns,
+    sort_stop_times_chunk,
+    sort_trips_chunk,
+    split_table,
+    worker_pool,
+)
+from .progress import ImportProgress
+
+M = TypeVar("M", bound=Model)
 
 
 class CalendarFileNotFound(Exception):
     """Calendar file was not found in gtfs zip"""
 
 
-@dataclass
-class Stoptime:
-    stop_id: str
-    stop_seq: int
-    departure: str
+FrequencyWindow = tuple[int, int, int, bool]
+"""FrequencyWindow is a (start_time, end_time, headway_secs, exact_times) row
+of frequencies.txt, with times in seconds"""
+
+FAST_LOADED_MODELS = (Pattern, PatternStop, TravelTimeProfile, Trip, Frequency)
+"""FAST_LOADED_MODELS are models with the most rows, whose indexes are dropped
+for the duration of a fast-load import"""
+
+PatternKey = tuple[str, int | None, str, bytes]
+"""PatternKey identifies a pattern by its headsign, direction, GTFS route_id
+and interned stop indices (as bytes of an int array)"""
 
+ProfileKey = tuple[int, bytes]
+"""ProfileKey identifies a travel time profile by the ID of its pattern
+and travel times (as bytes of an int array)"""
 
-@dataclass(frozen=True)
-class PatternStopData:
-    stop_id: str
-    travel_time: timedelta
 
+@dataclass
+class ParsingPatterns:
+    """ParsingPatterns holds chunks of trips.txt and stop_times.txt
+    being parsed by worker processes.
+
+    Both tables are either parsed into lists (`trips` and `stop_times`),
+    or sorted into runs of the `trips_sorter` and `sorter` (`trip_runs` and `runs`).
+    """
 
-@dataclass(frozen=True)
-class PatternData:
-    headsign: str
-    direction: int | None
-    line_id: str
-    stops: tuple[PatternStopData, ...]
+    trips: list["Future[list[TripRow]]"] = field(default_factory=list["Future[list[TripRow]]"])
+    stop_times: list["Future[list[StopTimeRow]]"] = field(
+        default_factory=list["Future[list[StopTimeRow]]"]
+    )
+    trip_runs: list["Future[tuple[Path, int]]"] = field(
+        default_factory=list["Future[tuple[Path, int]]"]
+    )
+    runs: list["Future[tuple[Path, int]]"] = field(
+        default_factory=list["Future[tuple[Path, int]]"]
+    )
+    trips_sorter: TripsSorter | None = None
+    sorter: StopTimesSorter | None = None
 
 
 class GTFSLoader:
-    BATCH_SIZE: Final[int] = 999
-    # According to https://docs.djangoproject.com/en/4.2/ref/models/querysets/#bulk-create
-    # sqlite can handle at most 999 rows inserted at one time.
+    def __init__(
+        self,
+        stop_times_buffer: int | None = None,
+        workers: int = 1,
+        incremental: bool = False,
+        replace: bool = False,
+        progress: ImportProgress | None = None,
+        namespace: str = "",
+        writer: BulkWriter | None = None,
+        fast_load: bool = False,
+        resumable: bool = False,
+        horizon: DateWindow | None = None,
+    ):
+        # If set, trips.txt and stop_times.txt are streamed through on-disk external sorts,
+        # with at most that many trips (and stop times) held in memory at once.
+        # Otherwise, both tables are loaded into memory.
+        self.stop_times_buffer = stop_times_buffer
+
+        # Number of processes parsing trips.txt and stop_times.txt in from_zip.
+        # Database writes are always performed by the calling process.
+        self.workers = workers
+
+        # If set, objects already stored in the database are matched with the feed
+        # (by GTFS ID or, for patterns, by content). Only new, changed and removed objects
+        # are written, and primary keys of matched objects are preserved.
+        self.incremental = incremental
+        self.stored: dict[type[Model], StoredObjects[Any]] = {}
+
+        # If set, all previously imported data is removed in the same transaction
+        # the feed is loaded in. Readers keep seeing the old data until the import
+        # is committed, and the old data is kept if the import fails.
+        if incremental and replace:
+            raise ValueError("incremental and replace imports are mutually exclusive")
+        self.replace = replace
+
+        self.progress = progress or ImportProgress()
+
+        # If set, source IDs of imported objects are prefixed with "{namespace}:",
+        # so that multiple feeds using the same GTFS IDs can be stored side by side.
+        # Incremental imports only match (and remove) objects from the same namespace -
+        # which is stored in its own column, as GTFS IDs may contain ":" themselves.
+        self.namespace = namespace
+
+        # If set, on SQLite, indexes of large tables are dropped for the duration of the import
+        # and re-created at its end (see sqlite_fast_load)
+        self.fast_load = fast_load
+
+        # If set, from_zip commits the feed in stages (reference tables, then batches of trips),
+        # staging the objects (see ImportedModel.staged), which hides them from readers.
+        # An interrupted import of the same feed continues from the last committed stage.
+        # Once the whole feed is loaded, the staged objects atomically replace
+        # the previously imported objects of the namespace (see publish_staged).
+        if resumable and (incremental or replace or fast_load):
+            raise ValueError("resumable imports can't be incremental, replacing or fast-loaded")
+        self.resumable = resumable
+        self.checkpoints: Checkpoints | None = None
+        self.trips_loaded = 0
+
+        # If set, the feed is trimmed to the provided date window: calendars without any
+        # service days in the window are skipped, together with their trips (and patterns
+        # only used by them), and calendar exceptions outside of the window are skipped.
+        self.horizon = horizon
+        self.active_services: set[str] | None = None
 
-    def __init__(self):
         self.agency_mapping: dict[str, int] = dict()
         self.stop_mapping: dict[str, int] = dict()
         self.line_mapping: dict[str, int] = dict()
         self.calendar_mapping: dict[str, int] = dict()
-        self.stop_times: dict[str, list[Stoptime]] = {}
-        self.pattern_ids: dict[PatternData, int] = {}
+        self.stop_names: dict[str, str] = dict()
+
+        # Stop times are kept in arrays of ints, with stop_ids interned into stop indices
+        self.stop_indices = Interner()
+        self.stop_times = StopTimesTable(self.stop_indices)
+        self.pattern_ids: dict[PatternKey, int] = {}
+        self.profile_ids: dict[ProfileKey, int] = {}
+        self.pattern_fingerprints: dict[int, str] = {}
 
-        # Temporary caches for bulk-insertion of trips
-        self.patterns_to_add: list[Pattern] = []
-        self.pattern_data_to_add: list[tuple[int, PatternData]] = []
-        self.trips_to_add: list[Trip] = []
+        # Trips from frequencies.txt are stored as Frequency rows, instead of Trips
+        self.frequencies: dict[str, list[FrequencyWindow]] = {}
 
-        # Counters for generating Pattern IDs. These need to be eagerly generated
-        # for PatternStop insertion. Otherwise, after a Pattern has been inserted,
-        # and before its PatternStops are inserted; a fetch to the database for the ID
-        # would need to be performed.
-        self.pattern_id_counter: int = (Pattern.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+        # IDs of Agencies, Stops, Lines, Calendars, Patterns and profiles are eagerly generated
+        # by the writer, so that rows referencing them can be created without fetching
+        # the IDs back from the database. On PostgreSQL, rows are written with COPY.
+        # Loaders of multiple feeds imported together share a single writer.
+        self.writer = writer or bulk_writer(
+            [
+                Agency,
+                Stop,
+                Line,
+                Calendar,
+                CalendarException,
+                Pattern,
+                PatternStop,
+                TravelTimeProfile,
+                Trip,
+                Frequency,
+            ],
+            on_batch=self.progress.add_batch,
+        )
 
-    @transaction.atomic
     def from_zip(self, zip_path: str | Path | IO[bytes]) -> None:
-        with ZipFile(zip_path, "r") as zip:
-            if "calendar.txt" not in zip.namelist() and "calendar_dates.txt" not in zip.namelist():
-                raise CalendarFileNotFound()
-            with zip.open("agency.txt", "r") as stream:
-                self.import_agencies(TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
-            with zip.open("routes.txt", "r") as stream:
-                self.import_lines(TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
-            with zip.open("stops.txt", "r") as stream:
-                self.import_stops(TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
-            if "calendar.txt" in zip.namelist():
-                with zip.open("calendar.txt", "r") as stream:
-                    self.import_calendars(TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
-            if "calendar_dates.txt" in zip.namelist():
-                with zip.open("calendar_dates.txt", "r") as stream:
-                    self.import_calendar_exceptions(
-                        TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        """from_zip imports a GTFS feed from a zip archive, or from a directory
+        with unpacked tables (see open_feed)"""
+        with self.profiled(), self.transaction(zip_path), self.fast_loaded(), open_feed(
+            zip_path
+        ) as zip, ExitStack() as stack:
+            check_calendar_files(zip)
+            parsing = None
+            if self.workers > 1:
+                pool = stack.enter_context(worker_pool(self.workers))
+                parsing = self.parse_patterns(zip, pool, stack)
+            self.import_feed(zip, parsing)
+            # NOTE: Resumable imports bump the version when they're published
+            if self.writer.changes and not self.resumable:
+                DataVersion.bump()
+        self.progress.finish()
+
+    def import_feed(self, zip: Feed, parsing: ParsingPatterns | None = None) -> None:
+        """import_feed imports all tables of an opened GTFS feed.
+        If provided, trips and stop_times are taken from chunks parsed by worker processes."""
+        if self.replace:
+            self.start_stage("removing previous data")
+            clear_tables()
+        if self.incremental:
+            self.start_stage("loading stored objects")
+            self.load_stored_objects()
+        if self.horizon is not None:
+            self.start_stage("trimming")
+            self.active_services = self.read_active_services(zip, self.horizon)
+        self.import_table(zip, "agency.txt", self.import_agencies)
+        self.import_table(zip, "routes.txt", self.import_lines)
+        self.import_table(zip, "stops.txt", self.import_stops)
+        # Calendars compacted from calendar_dates.txt can be shared by multiple services,
+        # so their mapping can't be restored from source IDs - both tables are matched
+        # with the committed objects when resuming instead
+        if "calendar.txt" in zip.namelist():
+            self.import_table(zip, "calendar.txt", self.import_calendars, skip_finished=False)
+        if "calendar_dates.txt" in zip.namelist():
+            self.import_table(
+                zip, "calendar_dates.txt", self.import_calendar_exceptions, skip_finished=False
+            )
+        if "frequencies.txt" in zip.namelist():
+            # Nothing is written until trips are loaded, so it's read even when resuming
+            with zip.open("frequencies.txt", "r") as stream:
+                self.import_frequencies(TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        if not self.finished("trips"):
+            if parsing is not None:
+                self.import_patterns_parallel(parsing)
+            else:
+                with zip.open("trips.txt", "r") as trips_stream, zip.open(
+                    "stop_times.txt", "r"
+                ) as stop_times_stream:
+                    self.import_patterns(
+                        TextIOWrapper(trips_stream, encoding="utf-8-sig", newline=""),
+                        TextIOWrapper(stop_times_stream, encoding="utf-8-sig", newline=""),
                     )
-            with zip.open("trips.txt", "r") as trips_stream, zip.open(
-                "stop_times.txt", "r"
-            ) as stop_times_stream:
-                self.import_patterns(
-                    TextIOWrapper(trips_stream, encoding="utf-8-sig", newline=""),
-                    TextIOWrapper(stop_times_stream, encoding="utf-8-sig", newline=""),
+            self.checkpoint("trips")
+
+        if self.incremental:
+            self.start_stage("deleting removed objects")
+            self.delete_stale_objects()
+
+    def import_table(
+        self,
+        zip: Feed,
+        name: str,
+        importer: Callable[[Iterable[str]], None],
+        skip_finished: bool = True,
+    ) -> None:
+        """import_table imports a table of the feed with the provided method -
+        unless the table was already committed by an interrupted resumable import
+        and `skip_finished` is set. Otherwise, already committed objects are matched
+        with the feed instead of being written again."""
+        stage = name.removesuffix(".txt")
+        if skip_finished and self.finished(stage):
+            return
+        with zip.open(name, "r") as stream:
+            importer(TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        self.checkpoint(stage)
+
+    def read_active_services(self, zip: Feed, horizon: DateWindow) -> set[str]:
+        """read_active_services returns service_ids of the feed
+        with at least one service day in the horizon"""
+        with ExitStack() as stack:
+            tables: list[Iterable[tuple[str, ...]]] = []
+            for name, columns in (
+                ("calendar.txt", CALENDAR_COLUMNS),
+                ("calendar_dates.txt", CALENDAR_DATES_COLUMNS),
+            ):
+                if name in zip.namelist():
+                    stream = stack.enter_context(zip.open(name, "r"))
+                    fh = TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+                    tables.append(read_columns(fh, columns))
+                else:
+                    tables.append(())
+            calendar_rows, calendar_dates_rows = tables
+            return active_services(calendar_rows, calendar_dates_rows, horizon)
+
+    def in_horizon(self, service_id: str) -> bool:
+        return self.active_services is None or service_id in self.active_services
+
+    def start_stage(self, stage: str) -> None:
+        self.progress.start_stage(f"{self.namespace}: {stage}" if self.namespace else stage)
+
+    def source_id(self, gtfs_id: str) -> str:
+        """source_id returns the identifier, under which an object with the provided GTFS ID
+        is stored in the database"""
+        return f"{self.namespace}:{gtfs_id}" if self.namespace else gtfs_id
+
+    def transaction(self, zip_path: str | Path | IO[bytes]) -> ContextManager[object]:
+        """transaction returns the transaction from_zip loads the feed in"""
+        if not self.resumable:
+            return transaction.atomic()
+        return self.checkpointed(zip_path)
+
+    @contextmanager
+    def checkpointed(self, zip_path: str | Path | IO[bytes]) -> Generator[None, None, None]:
+        """checkpointed commits everything loaded inside the block in stages
+        (see checkpoint), and publishes the staged objects at its end"""
+        self.start_stage("checking checkpoint")
+        record, resumed = start_checkpoint(self.namespace, feed_digest(zip_path))
+        if resumed:
+            self.start_stage("restoring staged objects")
+            self.restore_mappings()
+            self.load_stored_objects()
+
+        with Checkpoints(record) as self.checkpoints:
+            yield
+
+        self.start_stage("publishing")
+        publish_staged(self.namespace)
+        self.checkpoints = None
+
+    def checkpoint(self, stage: str | None = None) -> None:
+        """checkpoint durably commits all objects loaded so far, in resumable mode.
+        If provided, the stage is recorded as finished."""
+        if self.checkpoints is None:
+            return
+        self.writer.flush()
+        self.checkpoints.commit(stage, self.trips_loaded)
+
+    def finished(self, stage: str) -> bool:
+        """finished checks if the stage was committed by an interrupted resumable import"""
+        return self.checkpoints is not None and self.checkpoints.finished(stage)
+
+    def checkpoint_trip(self) -> None:
+        """checkpoint_trip commits trips in batches of CHECKPOINT_TRIPS, in resumable mode"""
+        self.trips_loaded += 1
+        if self.trips_loaded % CHECKPOINT_TRIPS == 0:
+            self.checkpoint()
+
+    def restore_mappings(self) -> None:
+        """restore_mappings maps GTFS IDs of objects committed by an interrupted resumable import
+        to their primary keys, as their tables aren't read again"""
+        prefix = self.source_id("")
+        for model, mapping in (
+            (Agency, self.agency_mapping),
+            (Line, self.line_mapping),
+            (Stop, self.stop_mapping),
+        ):
+            for source_id, pk in model._default_manager.filter(
+                namespace=self.namespace, staged=True
+            ).values_list("source_id", "pk"):
+                mapping[source_id[len(prefix) :]] = pk
+        for source_id, name in Stop.all_objects.filter(
+            namespace=self.namespace, staged=True
+        ).values_list("source_id", "name"):
+            self.stop_names[source_id[len(prefix) :]] = name
+
+    def profiled(self) -> ContextManager[object]:
+        """profiled measures SQL queries of the import, if it's being profiled"""
+        if self.progress.profiler is None:
+            return nullcontext()
+        return connection.execute_wrapper(self.progress.profiler)
+
+    def fast_loaded(self) -> ContextManager[object]:
+        if not self.fast_load:
+            return nullcontext()
+        return sqlite_fast_load(
+            FAST_LOADED_MODELS, on_rebuild=lambda: self.progress.start_stage("rebuilding indexes")
+        )
+
+    def load_stored_objects(self) -> None:
+        """load_stored_objects indexes all objects present in the database,
+        so that they can be matched with the feed in incremental mode.
+        Resumed imports match the objects they have staged instead."""
+        staged = self.resumable
+        models: tuple[type[ImportedModel], ...] = (Agency, Stop, Line, Calendar, Trip, Frequency)
+        for model in models:
+            self.stored[model] = StoredObjects(
+                model.all_objects.filter(namespace=self.namespace, staged=staged).values_list(
+                    "source_id", "pk", "fingerprint"
                 )
+            )
+        self.stored[Pattern] = StoredObjects(
+            Pattern.all_objects.filter(
+                line__namespace=self.namespace, line__staged=staged
+            ).values_list("fingerprint", "pk", "fingerprint")
+        )
+        self.stored[TravelTimeProfile] = StoredObjects(
+            TravelTimeProfile.objects.filter(
+                pattern__line__namespace=self.namespace, pattern__line__staged=staged
+            ).values_list("fingerprint", "pk", "fingerprint")
+        )
+        self.stored[CalendarException] = StoredObjects(
+            ((calendar_id, day), pk, added)
+            for calendar_id, day, pk, added in CalendarException.all_objects.filter(
+                calendar__namespace=self.namespace, calendar__staged=staged
+            ).values_list("calendar_id", "day", "pk", "added")
+        )
+
+    def delete_stale_objects(self) -> None:
+        """delete_stale_objects removes all stored objects which were not present in the feed"""
+        self.writer.flush()
+        for model in (
+            Frequency,
+            Trip,
+            CalendarException,
+            TravelTimeProfile,
+            Pattern,
+            Calendar,
+            Line,
+            Stop,
+            Agency,
+        ):
+            self.writer.delete(model, self.stored[model].stale)
+
+    def save(self, obj: M, source_id: str) -> M:
+        """save queues an object from the feed for insertion. In incremental mode,
+        an object stored with the same source_id is updated instead, if it has changed."""
+        model = type(obj)
+        source_id = self.source_id(source_id)
+        setattr(obj, "source_id", source_id)
+        setattr(obj, "namespace", self.namespace)
+        setattr(obj, "staged", self.resumable)
+        setattr(obj, "fingerprint", model_fingerprint(obj))
+
+        if self.incremental and model not in self.stored:
+            self.load_stored_objects()
+        # Resumed imports match objects committed before they were interrupted
+        if model in self.stored and (stored := self.stored[model].match(source_id)):
+            obj.pk, stored_fingerprint = stored
+            if stored_fingerprint != getattr(obj, "fingerprint"):
+                self.writer.update(obj)
+            return obj
+
+        obj.pk = self.writer.next_id(model)
+        return self.writer.add(obj)
 
     def import_agencies(self, file_handler: Iterable[str]) -> None:
-        for row in csv.DictReader(file_handler):
-            agency_id = row["agency_id"]
-            name = row["agency_name"]
-            website = row["agency_url"]
-            timezone = row["agency_timezone"]
-            telephone = row.get("agency_phone")
-            new_agency = Agency.objects.create(
-                name=name, website=website, timezone=timezone, telephone=telephone
+        self.start_stage("agency")
+        rows = read_columns(
+            file_handler,
+            ("agency_id", "agency_name", "agency_url", "agency_timezone"),
+            ("agency_phone",),
+        )
+        for agency_id, name, website, timezone, telephone in self.progress.count("agency", rows):
+            new_agency = self.save(
+                Agency(
+                    name=name,
+                    website=website,
+                    timezone=timezone,
+                    telephone=telephone or None,
+                ),
+                agency_id,
             )
             self.agency_mapping[agency_id] = new_agency.id
+        self.writer.flush()
 
     def import_stops(self, file_handler: Iterable[str]) -> None:
-        for row in csv.DictReader(file_handler):
-            stop_id = row["stop_id"]
-            code = row.get("stop_code")
-            name = row["stop_name"]
-            lat = row["stop_lat"]
-            lon = row["stop_lon"]
-            wheelchair_accessible = int(row.get("wheelchair_boarding") or 0)
-
-            new_stop = Stop.objects.create(
-                name=name, code=code, lat=lat, lon=lon, wheelchair_accessible=wheelchair_accessible
+        self.start_stage("stops")
+        rows = read_columns(
+            file_handler,
+            ("stop_id", "stop_name", "stop_lat", "stop_lon"),
+            ("stop_code", "wheelchair_boarding"),
+        )
+        for stop_id, name, lat, lon, code, wheelchair in self.progress.count("stops", rows):
+            new_stop = self.save(
+                Stop(
+                    name=name,
+                    code=code or None,
+                    lat=lat,
+                    lon=lon,
+                    wheelchair_accessible=int(wheelchair or 0),
+                ),
+                stop_id,
             )
             self.stop_mapping[stop_id] = new_stop.id
+            self.stop_names[stop_id] = name
+        self.writer.flush()
 
     def import_lines(self, file_handler: Iterable[str]) -> None:
-        for row in csv.DictReader(file_handler):
-            line_id = row["route_id"]
-            code = row["route_short_name"]
-            description = row["route_long_name"]
-            line_type = int(row["route_type"])
-            agency_id = row["agency_id"]
-            new_line = Line.objects.create(
-                code=code,
-                description=description,
-                line_type=line_type,
-                agency_id=self.agency_mapping[agency_id],
+        self.start_stage("routes")
+        rows = read_columns(
+            file_handler,
+            ("route_id", "route_short_name", "route_long_name", "route_type", "agency_id"),
+        )
+        for line_id, code, description, line_type, agency_id in self.progress.count(
+            "routes", rows
+        ):
+            new_line = self.save(
+                Line(
+                    code=code,
+                    description=description,
+                    line_type=int(line_type),
+                    agency_id=self.agency_mapping[agency_id],
+                ),
+                line_id,
             )
             self.line_mapping[line_id] = new_line.id
+        self.writer.flush()
 
     def import_calendars(self, file_handler: Iterable[str]) -> None:
-        for row in csv.DictReader(file_handler):
-            service_id = row["service_id"]
-            desc = row.get("service_desc") or service_id
-            start_date = datetime.strptime(row["start_date"], "%Y%m%d")
-            end_date = datetime.strptime(row["end_date"], "%Y%m%d")
-            monday = row["monday"]
-            tuesday = row["tuesday"]
-            wednesday = row["wednesday"]
-            thursday = row["thursday"]
-            friday = row["friday"]
-            saturday = row["saturday"]
-            sunday = row["sunday"]
-            new_calendar = Calendar.objects.create(
-                name=desc,
-                start_date=start_date,
-                end_date=end_date,
-                monday=monday,
-                tuesday=tuesday,
-                wednesday=wednesday,
-                thursday=thursday,
-                friday=friday,
-                saturday=saturday,
-                sunday=sunday,
+        self.start_stage("calendar")
+        rows = read_columns(
+            file_handler,
+            (
+                "service_id",
+                "start_date",
+                "end_date",
+                "monday",
+                "tuesday",
+                "wednesday",
+                "thursday",
+                "friday",
+                "saturday",
+                "sunday",
+            ),
+            ("service_desc",),
+        )
+        for (
+            service_id,
+            start_date,
+            end_date,
+            monday,
+            tuesday,
+            wednesday,
+            thursday,
+            friday,
+            saturday,
+            sunday,
+            desc,
+        ) in self.progress.count("calendar", rows):
+            if not self.in_horizon(service_id):
+                continue
+            new_calendar = self.save(
+                Calendar(
+                    name=desc or service_id,
+                    start_date=parse_date(start_date),
+                    end_date=parse_date(end_date),
+                    monday=monday,
+                    tuesday=tuesday,
+                    wednesday=wednesday,
+                    thursday=thursday,
+                    friday=friday,
+                    saturday=saturday,
+                    sunday=sunday,
+                ),
+                service_id,
             )
             self.calendar_mapping[service_id] = new_calendar.id
+        self.writer.flush()
 
     def import_calendar_exceptions(self, file_handler: Iterable[str]) -> None:
-        for row in csv.DictReader(file_handler):
-            service_id = row["service_id"]
-            day = datetime.strptime(row["date"], "%Y%m%d")
-            added = row["exception_type"] == "1"
-            if service_id not in self.calendar_mapping.keys():
-                calendar = Calendar.objects.create(
-                    name=service_id,
-                    start_date="2000-01-01",
-                    monday=0,
-                    tuesday=0,
-                    wednesday=0,
-                    thursday=0,
-                    friday=0,
-                    saturday=0,
-                    sunday=0,
+        self.start_stage("calendar_dates")
+        # Days (as ordinals) of services without calendar.txt rows, which are added
+        # or removed - the latter only matter for services which are never added
+        dates_only: dict[str, tuple[array[int], array[int]]] = {}
+
+        rows = read_columns(file_handler, CALENDAR_DATES_COLUMNS)
+        for service_id, date_str, exception_type in self.progress.count("calendar_dates", rows):
+            day = parse_date(date_str)
+            added = exception_type == "1"
+            if not self.in_horizon(service_id) or (
+                self.horizon is not None and not self.horizon[0] <= day <= self.horizon[1]
+            ):
+                continue
+
+            if (calendar_id := self.calendar_mapping.get(service_id)) is not None:
+                self.save_calendar_exception(
+                    CalendarException(day=day, added=added, calendar_id=calendar_id)
                 )
-                self.calendar_mapping[service_id] = calendar.id
-                calendar_id = calendar.id
             else:
-                calendar_id = self.calendar_mapping[service_id]
-            CalendarException.objects.create(day=day, added=added, calendar_id=calendar_id)
-
-    def load_stop_times(self, stop_times_fh: Iterable[str]) -> None:
-        self.stop_times.clear()
-        for row in csv.DictReader(stop_times_fh):
-            pickup_type = row.get("pickup_type")
-            drop_off_type = row.get("drop_off_type")
-            if pickup_type == "1" and drop_off_type == "1":
+                days = dates_only.setdefault(service_id, (array("i"), array("i")))
+                days[0 if added else 1].append(day.toordinal())
+
+        self.compact_calendars(dates_only)
+        self.writer.flush()
+
+    def compact_calendars(self, dates_only: dict[str, tuple["array[int]", "array[int]"]]) -> None:
+        """compact_calendars saves calendars of services defined only by calendar_dates.txt.
+
+        Instead of storing every service day as an exception, a weekly calendar with
+        the fewest exceptions is inferred (see compact_service). Services running
+        on exactly the same days share a single calendar.
+        Services which are never added get an empty calendar with their removed days.
+        """
+        compacted: dict[CompactService, int] = {}
+        for service_id, (added_days, removed_days) in dates_only.items():
+            if not added_days:
+                calendar = self.save(
+                    Calendar(
+                        name=service_id,
+                        start_date="2000-01-01",
+                        monday=0,
+                        tuesday=0,
+                        wednesday=0,
+                        thursday=0,
+                        friday=0,
+                        saturday=0,
+                        sunday=0,
+                    ),
+                    service_id,
+                )
+                self.calendar_mapping[service_id] = calendar.id
+                for day in sorted(set(removed_days)):
+                    self.save_calendar_exception(
+                        CalendarException(
+                            day=date.fromordinal(day), added=False, calendar_id=calendar.id
+                        )
+                    )
                 continue
-            trip_id = row["trip_id"]
-            stop_id = row["stop_id"]
-            stop_seq = int(row["stop_sequence"])
-            departure = row["departure_time"]
-            if trip_id not in self.stop_times:
-                self.stop_times[trip_id] = [Stoptime(stop_id, stop_seq, departure)]
-            else:
-                self.stop_times[trip_id].append(Stoptime(stop_id, stop_seq, departure))
-
-        for stop_time in self.stop_times.values():
-            stop_time.sort(key=lambda x: x.stop_seq)
-
-    def load_trip(self, row: Mapping[str, str]) -> None:
-        line_id = row["route_id"]
-        service_id = row["service_id"]
-        trip_id = row["trip_id"]
-        headsign = (
-            row.get("trip_headsign")
-            or Stop.objects.get(id=self.stop_mapping[self.stop_times[trip_id][-1].stop_id]).name
+
+            service = compact_service(added_days)
+            if (calendar_id := compacted.get(service)) is not None:
+                self.calendar_mapping[service_id] = calendar_id
+                continue
+
+            monday, tuesday, wednesday, thursday, friday, saturday, sunday = service.weekdays
+            calendar = self.save(
+                Calendar(
+                    name=service_id,
+                    start_date=service.start_date,
+                    end_date=service.end_date,
+                    monday=monday,
+                    tuesday=tuesday,
+                    wednesday=wednesday,
+                    thursday=thursday,
+                    friday=friday,
+                    saturday=saturday,
+                    sunday=sunday,
+                ),
+                service_id,
+            )
+            compacted[service] = self.calendar_mapping[service_id] = calendar.id
+            for days, added in ((service.added, True), (service.removed, False)):
+                for day in days:
+                    self.save_calendar_exception(
+                        CalendarException(day=day, added=added, calendar_id=calendar.id)
+                    )
+
+    def save_calendar_exception(self, exception: CalendarException) -> None:
+        if self.incremental and CalendarException not in self.stored:
+            self.load_stored_objects()
+        key = (exception.calendar_id, exception.day)
+        if CalendarException in self.stored and (
+            stored := self.stored[CalendarException].match(key)
+        ):
+            exception.pk, stored_added = stored
+            if stored_added != exception.added:
+                self.writer.update(exception)
+            return
+
+        self.writer.add(exception)
+
+    def import_frequencies(self, file_handler: Iterable[str]) -> None:
+        """import_frequencies reads frequencies.txt. It must be called before trips are loaded,
+        as trips with frequencies are saved as Frequency rows by load_trip."""
+        self.start_stage("frequencies")
+        rows = read_columns(
+            file_handler,
+            ("trip_id", "start_time", "end_time", "headway_secs"),
+            ("exact_times",),
         )
-        direction = int(row["direction_id"]) if "direction_id" in row else None
-        wheelchair_accessible = int(row.get("wheelchair_accessible") or 0)
+        for trip_id, start, end, headway, exact_times in self.progress.count("frequencies", rows):
+            self.frequencies.setdefault(trip_id, []).append(
+                (parse_time(start), parse_time(end), int(headway), exact_times == "1")
+            )
+
+    def load_stop_times(self, stop_times: Iterable[StopTimeRow]) -> None:
+        self.stop_times = StopTimesTable(self.stop_indices)
+        for trip_id, stop_seq, stop_id, departure in stop_times:
+            self.stop_times.append(trip_id, stop_seq, stop_id, departure)
+        self.stop_times.freeze()
+
+    def load_trip(self, trip: TripRow, stop_times: TripStopTimes) -> None:
+        if not self.in_horizon(trip.service_id):
+            return
+
+        line_id = trip.route_id
+        service_id = trip.service_id
+        headsign = trip.headsign or self.stop_names[self.stop_indices.values[stop_times.stops[-1]]]
+        direction = trip.direction
+        wheelchair_accessible = trip.wheelchair_accessible
 
-        pattern_stops: list[PatternStopData] = []
-        trip_start_time = get_time_as_timedelta(self.stop_times[trip_id][0].departure)
-        for elem in self.stop_times[trip_id]:
-            travel_time = get_time_as_timedelta(elem.departure) - trip_start_time
-            pattern_stops.append(PatternStopData(elem.stop_id, travel_time))
+        trip_start_time = stop_times.times[0]
+        offsets = travel_times(stop_times.times)
 
-        pattern_data = PatternData(headsign, direction, line_id, tuple(pattern_stops))
-        pattern_id = self.pattern_ids.get(pattern_data)
+        pattern_key = (headsign, direction, line_id, stop_times.stops.tobytes())
+        pattern_id = self.pattern_ids.get(pattern_key)
         if not pattern_id:
-            pattern_id = self.pattern_id_counter
-            self.pattern_id_counter += 1
-
-            self.pattern_ids[pattern_data] = pattern_id
-            self.patterns_to_add.append(
-                Pattern(
-                    id=pattern_id,
-                    headsign=headsign,
-                    direction=direction,
-                    line_id=self.line_mapping[line_id],
+            pattern_id = self.load_pattern(pattern_key, stop_times.stops)
+
+        profile_key = (pattern_id, offsets.tobytes())
+        profile_id = self.profile_ids.get(profile_key)
+        if not profile_id:
+            profile_id = self.load_profile(profile_key, offsets)
+
+        if windows := self.frequencies.pop(trip.trip_id, None):
+            # Stop times of the trip only provide travel times between stops
+            for idx, (start_time, end_time, headway, exact_times) in enumerate(windows):
+                self.save(
+                    Frequency(
+                        profile_id=profile_id,
+                        calendar_id=self.calendar_mapping[service_id],
+                        start_time=start_time,
+                        end_time=end_time,
+                        headway=headway,
+                        exact_times=exact_times,
+                        wheelchair_accessible=wheelchair_accessible,
+                    ),
+                    f"{trip.trip_id}#{idx}",
                 )
-            )
-            self.pattern_data_to_add.append((pattern_id, pattern_data))
+            return
 
-        self.trips_to_add.append(
+        self.save(
             Trip(
                 wheelchair_accessible=wheelchair_accessible,
-                departure=get_time_as_timedelta(self.stop_times[trip_id][0].departure),
-                pattern_id=pattern_id,
+                departure=trip_start_time,
+                profile_id=profile_id,
                 calendar_id=self.calendar_mapping[service_id],
+            ),
+            trip.trip_id,
+        )
+
+    def load_pattern(self, key: PatternKey, stops: Sequence[int]) -> int:
+        headsign, direction, line_id, _ = key
+        stop_ids = [self.stop_indices.values[stop] for stop in stops]
+
+        # Interned stop indices depend on the order of stops in the feed,
+        # so the fingerprint must use GTFS stop_ids instead.
+        pattern_fingerprint = fingerprint(headsign, direction, self.source_id(line_id), stop_ids)
+
+        if self.incremental and Pattern not in self.stored:
+            self.load_stored_objects()
+        if Pattern in self.stored and (stored := self.stored[Pattern].match(pattern_fingerprint)):
+            self.pattern_ids[key] = stored[0]
+            self.pattern_fingerprints[stored[0]] = pattern_fingerprint
+            return stored[0]
+
+        pattern_id = self.writer.next_id(Pattern)
+        self.pattern_ids[key] = pattern_id
+        self.pattern_fingerprints[pattern_id] = pattern_fingerprint
+        self.writer.add(
+            Pattern(
+                id=pattern_id,
+                headsign=headsign,
+                direction=direction,
+                line_id=self.line_mapping[line_id],
+                fingerprint=pattern_fingerprint,
             )
         )
+        for idx, stop_id in enumerate(stop_ids):
+            self.writer.add(
+                PatternStop(pattern_id=pattern_id, stop_id=self.stop_mapping[stop_id], index=idx)
+            )
+        return pattern_id
+
+    def load_profile(self, key: ProfileKey, offsets: Sequence[int]) -> int:
+        pattern_id, _ = key
+        profile_fingerprint = fingerprint(self.pattern_fingerprints[pattern_id], list(offsets))
+
+        if TravelTimeProfile in self.stored and (
+            stored := self.stored[TravelTimeProfile].match(profile_fingerprint)
+        ):
+            self.profile_ids[key] = stored[0]
+            return stored[0]
 
-    def insert_current_batch(self) -> None:
-        Pattern.objects.bulk_create(self.patterns_to_add)
-        Trip.objects.bulk_create(self.trips_to_add)
-        PatternStop.objects.bulk_create(
-            PatternStop(
+        profile_id = self.writer.next_id(TravelTimeProfile)
+        self.profile_ids[key] = profile_id
+        self.writer.add(
+            TravelTimeProfile(
+                id=profile_id,
                 pattern_id=pattern_id,
-                stop_id=self.stop_mapping[pattern_stop.stop_id],
-                travel_time=pattern_stop.travel_time,
-                index=idx,
+                travel_times=list(offsets),
+                fingerprint=profile_fingerprint,
             )
-            for pattern_id, pattern_data in self.pattern_data_to_add
-            for idx, pattern_stop in enumerate(pattern_data.stops)
         )
-
-        self.patterns_to_add.clear()
-        self.pattern_data_to_add.clear()
-        self.trips_to_add.clear()
+        return profile_id
 
     def import_patterns(self, trips_fh: Iterable[str], stop_times_fh: Iterable[str]) -> None:
-        self.load_stop_times(stop_times_fh)
+        if self.stop_times_buffer is None:
+            self.start_stage("stop_times")
+            self.load_stop_times(self.progress.count("stop_times", iter_stop_times(stop_times_fh)))
+            self.start_stage("trips")
+            self.load_trips(self.progress.count("trips", iter_trips(trips_fh)))
+            return
+
+        with TripsSorter(self.stop_times_buffer) as trips, StopTimesSorter(
+            self.stop_times_buffer
+        ) as sorter:
+            self.start_stage("trips")
+            trips.extend(self.progress.count("trips", iter_trips(trips_fh)))
+            self.start_stage("stop_times")
+            sorter.extend(self.progress.count("stop_times", iter_stop_times(stop_times_fh)))
+            self.start_stage("patterns")
+            self.stream_patterns(trips.sorted_rows(), sorter)
+
+    def parse_patterns(self, zip: Feed, pool: Executor, stack: ExitStack) -> ParsingPatterns:
+        """parse_patterns extracts trips.txt and stop_times.txt from the feed, and submits
+        their chunks for parsing to a pool of worker processes - without waiting for results.
+        Temporary files are removed when the provided stack is closed.
+        Tables of unpacked feeds are parsed in place, without being copied."""
+        temp_dir = stack.enter_context(TemporaryDirectory(prefix="szallitas-gtfs-import-"))
+        trips_path = Path(zip.extract("trips.txt", temp_dir))
+        stop_times_path = Path(zip.extract("stop_times.txt", temp_dir))
+        chunks = self.workers * CHUNKS_PER_WORKER
 
-        trips = csv.DictReader(trips_fh)
-        while batch := list(islice(trips, self.BATCH_SIZE)):
-            for trip in batch:
-                self.load_trip(trip)
-            self.insert_current_batch()
+        parsing = ParsingPatterns()
+
+        if self.stop_times_buffer is None:
+            header, ranges = split_table(trips_path, chunks)
+            parsing.trips = [pool.submit(parse_trips_chunk, trips_path, header, r) for r in ranges]
+            header, ranges = split_table(stop_times_path, chunks)
+            parsing.stop_times = [
+                pool.submit(parse_stop_times_chunk, stop_times_path, header, r) for r in ranges
+            ]
+            return parsing
+
+        # Every worker sorts its chunk into a separate run.
+        # Chunks are sized to contain about stop_times_buffer rows each.
+        trip_chunks = max(chunks, estimate_rows(trips_path) // self.stop_times_buffer + 1)
+        header, ranges = split_table(trips_path, trip_chunks)
+        parsing.trips_sorter = stack.enter_context(TripsSorter(self.stop_times_buffer))
+        parsing.trip_runs = [
+            pool.submit(
+                sort_trips_chunk, trips_path, header, r, parsing.trips_sorter.new_run_path()
+            )
+            for r in ranges
+        ]
+
+        chunks = max(chunks, estimate_rows(stop_times_path) // self.stop_times_buffer + 1)
+        header, ranges = split_table(stop_times_path, chunks)
+        parsing.sorter = stack.enter_context(StopTimesSorter(self.stop_times_buffer))
+        parsing.runs = [
+            pool.submit(
+                sort_stop_times_chunk, stop_times_path, header, r, parsing.sorter.new_run_path()
+            )
+            for r in ranges
+        ]
+        return parsing
+
+    def import_patterns_parallel(self, parsing: ParsingPatterns) -> None:
+        """import_patterns_parallel imports trips.txt and stop_times.txt
+        from chunks parsed by worker processes (see parse_patterns)."""
+        self.start_stage("stop_times")
+        if parsing.sorter is None or parsing.trips_sorter is None:
+            trips = self.progress.count(
+                "trips", chain.from_iterable(chunk.result() for chunk in parsing.trips)
+            )
+            self.load_stop_times(
+                self.progress.count(
+                    "stop_times",
+                    chain.from_iterable(chunk.result() for chunk in parsing.stop_times),
+                )
+            )
+            self.start_stage("trips")
+            self.load_trips(trips)
+            return
+
+        for sorter, runs, table in (
+            (parsing.trips_sorter, parsing.trip_runs, "trips"),
+            (parsing.sorter, parsing.runs, "stop_times"),
+        ):
+            for run_result in runs:
+                run, rows = run_result.result()
+                sorter.add_run(run)
+                self.progress.add_rows(table, rows)
+
+        self.start_stage("patterns")
+        self.stream_patterns(parsing.trips_sorter.sorted_rows(), parsing.sorter)
+
+    def load_trips(self, trips: Iterable[TripRow]) -> None:
+        """load_trips imports trips, with all stop times already loaded into memory"""
+        for trip in trips:
+            stop_times = self.stop_times.get(trip.trip_id)
+            if stop_times is None:
+                raise KeyError(f"trip {trip.trip_id!r} has no stop_times")
+            self.load_trip(trip, stop_times)
+            self.checkpoint_trip()
+        self.writer.flush()
+
+    def stream_patterns(self, trips: Iterable[TripRow], sorter: StopTimesSorter) -> None:
+        """stream_patterns imports trips with bounded memory usage: trips (sorted by trip_id)
+        are joined with stop_times externally sorted by (trip_id, stop_sequence),
+        so that only a single trip and its stop times are kept in memory at a time.
+
+        Trips without any stop times, and stop times of unknown trips are skipped.
+        """
+        trips = iter(trips)
+        trip = next(trips, None)
+        for trip_id, rows in sorter.by_trip():
+            while trip is not None and trip.trip_id < trip_id:
+                trip = next(trips, None)
+            if trip is None or trip.trip_id != trip_id:
+                continue
+
+            stops = (self.stop_indices(stop_id) for _, _, stop_id, _ in rows)
+            times = (departure for _, _, _, departure in rows)
+            self.load_trip(trip, trip_stop_times(stops, times))
+            self.checkpoint_trip()
+            trip = next(trips, None)
+
+        self.writer.flush()
+
+
+@transaction.atomic
+def import_feeds(
+    feeds: Mapping[str, str | Path],
+    workers: int = 1,
+    stop_times_buffer: int | None = None,
+    incremental: bool = False,
+    replace: bool = False,
+    progress: ImportProgress | None = None,
+    fast_load: bool = False,
+    horizon: DateWindow | None = None,
+) -> dict[str, GTFSLoader]:
+    """import_feeds imports multiple GTFS feeds, provided as a mapping from namespaces
+    to paths of zip archives or unpacked directories, in a single transaction.
+    Returns the loader used for every feed.
+
+    With more than one worker, trips.txt and stop_times.txt of all feeds are submitted
+    to the worker pool up front, so that later feeds are parsed while earlier ones
+    are being written into the database by a single, shared writer.
+    """
+    progress = progress or ImportProgress()
+    loaders: dict[str, GTFSLoader] = {}
+    writer: BulkWriter | None = None
+    for namespace in feeds:
+        loader = GTFSLoader(
+            stop_times_buffer=stop_times_buffer,
+            workers=workers,
+            incremental=incremental,
+            progress=progress,
+            namespace=namespace,
+            writer=writer,
+            fast_load=fast_load,
+            horizon=horizon,
+        )
+        writer = loader.writer
+        loaders[namespace] = loader
+
+    if not loaders:
+        return loaders
+
+    first_loader = next(iter(loaders.values()))
+    with first_loader.profiled(), first_loader.fast_loaded(), ExitStack() as stack:
+        zips = {
+            namespace: stack.enter_context(open_feed(path)) for namespace, path in feeds.items()
+        }
+        for zip in zips.values():
+            check_calendar_files(zip)
+
+        parsing: dict[str, ParsingPatterns] = {}
+        if workers > 1:
+            pool = stack.enter_context(worker_pool(workers))
+            for namespace, loader in loaders.items():
+                parsing[namespace] = loader.parse_patterns(zips[namespace], pool, stack)
+
+        if replace:
+            progress.start_stage("removing previous data")
+            clear_tables()
+        for namespace, loader in loaders.items():
+            loader.import_feed(zips[namespace], parsing.get(namespace))
+        if first_loader.writer.changes:
+            DataVersion.bump()
+
+    progress.finish()
+    return loaders
+
+
+def check_calendar_files(zip: Feed) -> None:
+    if "calendar.txt" not in zip.namelist() and "calendar_dates.txt" not in zip.namelist():
+        raise CalendarFileNotFound()
 
 
 def clear_tables() -> None:
+    """clear_tables removes all imported data, including objects staged by resumable imports.
+    Prefer GTFSLoader(replace=True), which does that atomically with the import."""
     cur = connection.cursor()
+    cur.execute('DELETE FROM "transportation_importcheckpoint";')
+    cur.execute('DELETE FROM "transportation_frequency";')
     cur.execute('DELETE FROM "transportation_trip";')
+    cur.execute('DELETE FROM "transportation_traveltimeprofile";')
     cur.execute('DELETE FROM "transportation_patternstop";')
     cur.execute('DELETE FROM "transportation_pattern";')
     cur.execute('DELETE FROM "transportation_calendarexception";')
@@ -280,8 +1030,4 @@ def clear_tables() -> None:
     cur.execute('DELETE FROM "transportation_line";')
     cur.execute('DELETE FROM "transportation_stop";')
     cur.execute('DELETE FROM "transportation_agency";')
-
-
-def get_time_as_timedelta(time_str: str) -> timedelta:
-    hours, minutes, seconds = time_str.split(":")
-    return timedelta(hours=int(hours), minutes=int(minutes), seconds=int(seconds))
+    DataVersion.bump()
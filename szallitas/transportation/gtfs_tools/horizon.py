@@ -0,0 +1,72 @@
+from datetime import date, datetime, timedelta
+from typing import Final, Iterable
+
+DateWindow = tuple[date, date]
+"""DateWindow is a (first day, last day) range of dates, both inclusive"""
+
+CALENDAR_COLUMNS: Final = (
+    "service_id",
+    "start_date",
+    "end_date",
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+)
+CALENDAR_DATES_COLUMNS: Final = ("service_id", "date", "exception_type")
+
+
+def parse_date(date_str: str) -> date:
+    """parse_date converts a GTFS date (YYYYMMDD) into a date"""
+    return datetime.strptime(date_str, "%Y%m%d").date()
+
+
+def weekday_count(first: date, last: date, weekday: int) -> int:
+    """weekday_count returns how many times a weekday (0 = Monday) occurs between two dates"""
+    first_occurrence = first + timedelta(days=(weekday - first.weekday()) % 7)
+    if first_occurrence > last:
+        return 0
+    return (last - first_occurrence).days // 7 + 1
+
+
+def active_services(
+    calendar_rows: Iterable[tuple[str, ...]],
+    calendar_dates_rows: Iterable[tuple[str, ...]],
+    window: DateWindow,
+) -> set[str]:
+    """active_services returns service_ids which operate on at least one day of the window.
+
+    `calendar_rows` are (service_id, start_date, end_date, monday, ..., sunday) rows
+    of calendar.txt, and `calendar_dates_rows` are (service_id, date, exception_type) rows
+    of calendar_dates.txt.
+    """
+    window_start, window_end = window
+    regular: dict[str, tuple[date, date, tuple[bool, ...]]] = {}
+    service_days: dict[str, int] = {}
+
+    for service_id, start_date, end_date, *days in calendar_rows:
+        first = max(parse_date(start_date), window_start)
+        last = min(parse_date(end_date), window_end)
+        weekdays = tuple(day == "1" for day in days)
+        regular[service_id] = (first, last, weekdays)
+        service_days[service_id] = sum(
+            weekday_count(first, last, weekday) for weekday, runs in enumerate(weekdays) if runs
+        )
+
+    active: set[str] = set()
+    for service_id, date_str, exception_type in calendar_dates_rows:
+        day = parse_date(date_str)
+        if not window_start <= day <= window_end:
+            continue
+        if exception_type == "1":
+            active.add(service_id)
+        elif service_id in regular:
+            first, last, weekdays = regular[service_id]
+            if first <= day <= last and weekdays[day.weekday()]:
+                service_days[service_id] -= 1
+
+    active.update(service_id for service_id, days in service_days.items() if days > 0)
+    return active
@@ -0,0 +1,275 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import StringIO
+from multiprocessing import get_all_start_methods, get_context
+from operator import itemgetter
+from pathlib import Path
+from sys import intern
+from typing import Callable, Final, Generator, Iterable, Iterator, NamedTuple, Sequence
+
+from .columnar import parse_time
+from .external_sort import ExternalSorter, StopTimeRow, write_run
+from .feed import MappedTable
+
+# NOTE: This module must not depend on Django models,
+#       as its functions are executed in worker processes.
+
+
+class TripRow(NamedTuple):
+    trip_id: str
+    route_id: str
+    service_id: str
+    headsign: str | None
+    direction: int | None
+    wheelchair_accessible: int
+
+
+class TripsSorter(ExternalSorter[TripRow]):
+    """TripsSorter sorts trips by trip_id using bounded memory (see ExternalSorter),
+    so that they can be joined with stop_times sorted by a StopTimesSorter"""
+
+    def __init__(self, buffer_size: int) -> None:
+        super().__init__(buffer_size, itemgetter(0))
+
+    def decode(self, row: list[str]) -> TripRow:
+        trip_id, route_id, service_id, headsign, direction, wheelchair = row
+        return TripRow(
+            trip_id,
+            route_id,
+            service_id,
+            headsign or None,
+            int(direction) if direction else None,
+            int(wheelchair),
+        )
+
+
+ByteRange = tuple[int, int]
+
+CHUNKS_PER_WORKER: Final[int] = 4
+# Tables are split into more chunks than there are workers,
+# so that a single slow chunk doesn't leave other workers idle.
+
+
+def read_columns(
+    fh: Iterable[str],
+    required: Sequence[str],
+    optional: Sequence[str] = (),
+) -> Iterator[tuple[str, ...]]:
+    """read_columns yields a tuple with values of the `required` columns,
+    followed by values of the `optional` columns, for every non-empty row of a CSV table.
+
+    Column indices are resolved from the header once, instead of building a dict
+    for every row like csv.DictReader. Optional columns missing from the table
+    (and values missing from short rows) are yielded as empty strings.
+    Raises KeyError if any of the required columns is missing.
+    """
+    reader = csv.reader(fh)
+    header = [column.strip() for column in next(reader, list[str]())]
+    for column in required:
+        if column not in header:
+            raise KeyError(column)
+
+    # Missing optional columns point past the end of the header, at the padding
+    indices = [header.index(column) for column in required] + [
+        header.index(column) if column in header else len(header) for column in optional
+    ]
+    width = max(indices, default=-1) + 1
+    project: Callable[[list[str]], tuple[str, ...]] = (
+        itemgetter(*indices) if len(indices) > 1 else lambda row: tuple(row[i] for i in indices)
+    )
+
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < width:
+            row += [""] * (width - len(row))
+        yield project(row)
+
+
+def trip_parser(header: list[str]) -> Callable[[list[str]], TripRow]:
+    """trip_parser returns a function converting trips.txt rows into TripRows"""
+    trip_id = header.index("trip_id")
+    route_id = header.index("route_id")
+    service_id = header.index("service_id")
+    headsign = _optional_index(header, "trip_headsign")
+    direction = _optional_index(header, "direction_id")
+    wheelchair = _optional_index(header, "wheelchair_accessible")
+
+    def parse(row: list[str]) -> TripRow:
+        direction_str = row[direction] if direction is not None else ""
+        wheelchair_str = row[wheelchair] if wheelchair is not None else ""
+        return TripRow(
+            intern(row[trip_id]),
+            intern(row[route_id]),
+            intern(row[service_id]),
+            (row[headsign] or None) if headsign is not None else None,
+            int(direction_str) if direction_str else None,
+            int(wheelchair_str or 0),
+        )
+
+    return parse
+
+
+def stop_time_parser(header: list[str]) -> Callable[[list[str]], StopTimeRow | None]:
+    """stop_time_parser returns a function converting stop_times.txt rows into StopTimeRows.
+    The function returns None for stop times without any passenger exchange.
+
+    Trip and stop IDs are interned, as every one of them is repeated in many rows.
+    Interned strings are also pickled only once per chunk parsed by a worker process."""
+    trip_id = header.index("trip_id")
+    stop_id = header.index("stop_id")
+    stop_sequence = header.index("stop_sequence")
+    departure_time = header.index("departure_time")
+    pickup_type = _optional_index(header, "pickup_type")
+    drop_off_type = _optional_index(header, "drop_off_type")
+
+    def parse(row: list[str]) -> StopTimeRow | None:
+        if (
+            pickup_type is not None
+            and drop_off_type is not None
+            and row[pickup_type] == "1"
+            and row[drop_off_type] == "1"
+        ):
+            return None
+        return (
+            intern(row[trip_id]),
+            int(row[stop_sequence]),
+            intern(row[stop_id]),
+            parse_time(row[departure_time]),
+        )
+
+    return parse
+
+
+def iter_trips(trips_fh: Iterable[str]) -> Iterator[TripRow]:
+    """iter_trips yields a TripRow for every trip from a GTFS trips.txt table"""
+    reader = csv.reader(trips_fh)
+    parse = trip_parser([column.strip() for column in next(reader)])
+    for row in reader:
+        if row:
+            yield parse(row)
+
+
+def iter_stop_times(stop_times_fh: Iterable[str]) -> Iterator[StopTimeRow]:
+    """iter_stop_times yields (trip_id, stop_sequence, stop_id, departure_time in seconds)
+    for every stop time from a GTFS stop_times.txt table, at which vehicles
+    actually pick up or drop off passengers."""
+    reader = csv.reader(stop_times_fh)
+    parse = stop_time_parser([column.strip() for column in next(reader)])
+    for row in reader:
+        if row and (stop_time := parse(row)):
+            yield stop_time
+
+
+def worker_pool(workers: int) -> ProcessPoolExecutor:
+    """worker_pool creates a process pool for parsing GTFS tables.
+
+    The "fork" start method is preferred - other methods re-import this package
+    in the workers, which requires a configured Django project.
+    """
+    context = get_context("fork") if "fork" in get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def estimate_rows(path: Path, sample_size: int = 1 << 16) -> int:
+    """estimate_rows estimates the number of lines in a file,
+    based on the average line length in its first `sample_size` bytes"""
+    with path.open("rb") as f:
+        sample = f.read(sample_size)
+    lines = sample.count(b"\n") or 1
+    return path.stat().st_size * lines // max(len(sample), 1)
+
+
+def split_table(path: Path, chunks: int) -> tuple[list[str], list[ByteRange]]:
+    """split_table reads the header of a CSV file, and splits the rest of the file
+    into at most `chunks` byte ranges of similar size, aligned to line boundaries.
+
+    NOTE: Quoted fields with embedded line breaks are not supported,
+          as chunks could start in the middle of such fields.
+    """
+    with mapped(path) as data:
+        size = len(data)
+        header_end = data.find(b"\n") + 1 or size
+        header = next(csv.reader([str(data.view[:header_end], "utf-8-sig")]), list[str]())
+
+        boundaries = [header_end]
+        for i in range(1, chunks):
+            position = header_end + (size - header_end) * i // chunks
+            if position <= boundaries[-1]:
+                continue
+
+            # Move the boundary to the start of the next line
+            position = data.find(b"\n", position - 1) + 1 or size
+
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+
+    boundaries.append(size)
+    return [column.strip() for column in header], list(zip(boundaries, boundaries[1:]))
+
+
+def read_chunk(path: Path, byte_range: ByteRange) -> Iterator[list[str]]:
+    """read_chunk yields all non-empty CSV rows from the provided byte range of a file"""
+    start, end = byte_range
+    with mapped(path) as data:
+        # Decoding a slice of a memoryview doesn't copy the bytes first
+        text = str(data.view[start:end], "utf-8")
+    return (row for row in csv.reader(StringIO(text, newline="")) if row)
+
+
+def parse_trips_chunk(path: Path, header: list[str], byte_range: ByteRange) -> list[TripRow]:
+    parse = trip_parser(header)
+    return [parse(row) for row in read_chunk(path, byte_range)]
+
+
+def parse_stop_times_chunk(
+    path: Path,
+    header: list[str],
+    byte_range: ByteRange,
+) -> list[StopTimeRow]:
+    parse = stop_time_parser(header)
+    return [stop_time for row in read_chunk(path, byte_range) if (stop_time := parse(row))]
+
+
+def sort_trips_chunk(
+    path: Path,
+    header: list[str],
+    byte_range: ByteRange,
+    run_path: Path,
+) -> tuple[Path, int]:
+    """sort_trips_chunk parses a chunk of trips.txt, and saves it as a sorted run
+    for a TripsSorter. Returns the path to the run and the number of trips in it."""
+    trips = parse_trips_chunk(path, header, byte_range)
+    trips.sort(key=itemgetter(0))
+    write_run(run_path, trips)
+    return run_path, len(trips)
+
+
+def sort_stop_times_chunk(
+    path: Path,
+    header: list[str],
+    byte_range: ByteRange,
+    run_path: Path,
+) -> tuple[Path, int]:
+    """sort_stop_times_chunk parses a chunk of stop_times.txt,
+    and saves it as a sorted run for a StopTimesSorter.
+    Returns the path to the run and the number of stop times in it."""
+    stop_times = parse_stop_times_chunk(path, header, byte_range)
+    stop_times.sort(key=itemgetter(0, 1))
+    write_run(run_path, stop_times)
+    return run_path, len(stop_times)
+
+
+@contextmanager
+def mapped(path: Path) -> Generator[MappedTable, None, None]:
+    """mapped memory-maps a whole file for the duration of the context"""
+    table = MappedTable(path)
+    try:
+        yield table
+    finally:
+        table.close()
+
+
+def _optional_index(header: list[str], column: str) -> int | None:
+    return header.index(column) if column in header else None
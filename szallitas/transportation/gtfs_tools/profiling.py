@@ -0,0 +1,119 @@
+import sys
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Any, Callable
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None  # type: ignore
+
+
+def peak_rss() -> int | None:
+    """peak_rss returns the highest resident set size (in KiB) of this process
+    and its finished child processes, or None if that's not supported by the platform"""
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # NOTE: macOS reports ru_maxrss in bytes, other platforms in kilobytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+@dataclass
+class StageMetrics:
+    stage: str
+    wall_time: float = 0.0
+    rows: int = 0
+    queries: int = 0
+    query_time: float = 0.0
+    peak_rss: int | None = None
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.wall_time if self.wall_time > 0 else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self) | {"rows_per_second": self.rows_per_second}
+
+
+class ImportProfiler:
+    """ImportProfiler measures every stage of a GTFS import: wall time, number of parsed rows,
+    number and total time of SQL queries, and the peak RSS at the end of the stage.
+
+    Stages are switched by an ImportProgress the profiler is attached to.
+    To measure SQL queries, the profiler must be installed with `connection.execute_wrapper`.
+    """
+
+    def __init__(self) -> None:
+        self.stages: list[StageMetrics] = []
+        self.current: StageMetrics | None = None
+        self.stage_start = 0.0
+        self.stage_start_rows = 0
+
+    def start_stage(self, stage: str, total_rows: int) -> None:
+        self.finish(total_rows)
+        self.current = StageMetrics(stage)
+        self.stage_start = perf_counter()
+        self.stage_start_rows = total_rows
+
+    def finish(self, total_rows: int) -> None:
+        """finish closes the current stage, if there is one"""
+        if self.current is None:
+            return
+        self.current.wall_time = perf_counter() - self.stage_start
+        self.current.rows = total_rows - self.stage_start_rows
+        self.current.peak_rss = peak_rss()
+        self.stages.append(self.current)
+        self.current = None
+
+    def __call__(
+        self,
+        execute: Callable[..., Any],
+        sql: str,
+        params: Any,
+        many: bool,
+        context: dict[str, Any],
+    ) -> Any:
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if self.current is not None:
+                self.current.queries += 1
+                self.current.query_time += perf_counter() - start
+
+    def total(self) -> StageMetrics:
+        peaks = [stage.peak_rss for stage in self.stages if stage.peak_rss is not None]
+        return StageMetrics(
+            "total",
+            wall_time=sum(stage.wall_time for stage in self.stages),
+            rows=sum(stage.rows for stage in self.stages),
+            queries=sum(stage.queries for stage in self.stages),
+            query_time=sum(stage.query_time for stage in self.stages),
+            peak_rss=max(peaks) if peaks else None,
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "stages": [stage.as_dict() for stage in self.stages],
+            "total": self.total().as_dict(),
+        }
+
+    def report(self) -> str:
+        """report formats all measured stages as a text table"""
+        lines = [
+            f"{'stage':<26}{'time [s]':>10}{'rows':>11}{'rows/s':>11}"
+            f"{'queries':>9}{'SQL [s]':>10}{'peak RSS [MiB]':>16}"
+        ]
+        for stage in (*self.stages, self.total()):
+            rss = f"{stage.peak_rss / 1024:.1f}" if stage.peak_rss is not None else "-"
+            lines.append(
+                f"{stage.stage:<26}{stage.wall_time:>10.3f}{stage.rows:>11}"
+                f"{stage.rows_per_second:>11.0f}{stage.queries:>9}{stage.query_time:>10.3f}"
+                f"{rss:>16}"
+            )
+        return "\n".join(lines)
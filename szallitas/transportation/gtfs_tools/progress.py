@@ -0,0 +1,89 @@
+from time import monotonic
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from django.db.models import Model
+
+from .profiling import ImportProfiler
+
+T = TypeVar("T")
+
+
+class ImportProgress:
+    """ImportProgress collects counters of a running GTFS import:
+    the current stage, rows parsed from every table, and batches and rows written
+    into every database table.
+
+    If `on_update` is provided, it is called with `as_dict()` whenever the counters
+    change - but not more often than every `interval` seconds.
+
+    If `profiler` is provided, it measures every stage of the import.
+    """
+
+    def __init__(
+        self,
+        on_update: Callable[[dict[str, Any]], None] | None = None,
+        interval: float = 1.0,
+        profiler: ImportProfiler | None = None,
+    ) -> None:
+        self.on_update = on_update
+        self.profiler = profiler
+        self.interval = interval
+        self.last_update = 0.0
+
+        self.stage = ""
+        self.rows_parsed: dict[str, int] = {}
+        self.batches_written = 0
+        self.rows_written: dict[str, int] = {}
+
+    def start_stage(self, stage: str) -> None:
+        self.stage = stage
+        if self.profiler is not None:
+            self.profiler.start_stage(stage, self.total_rows_parsed)
+        self.changed(force=True)
+
+    def finish(self) -> None:
+        """finish marks the import as done"""
+        if self.profiler is not None:
+            self.profiler.finish(self.total_rows_parsed)
+        self.stage = "done"
+        self.changed(force=True)
+
+    @property
+    def total_rows_parsed(self) -> int:
+        return sum(self.rows_parsed.values())
+
+    def add_rows(self, table: str, rows: int = 1) -> None:
+        self.rows_parsed[table] = self.rows_parsed.get(table, 0) + rows
+        self.changed()
+
+    def count(self, table: str, rows: Iterable[T]) -> Iterator[T]:
+        """count yields all provided rows, counting them as parsed from the table"""
+        counter = 0
+        for counter, row in enumerate(rows, 1):
+            yield row
+            if counter % 1000 == 0:
+                self.add_rows(table, 1000)
+        self.add_rows(table, counter % 1000)
+
+    def add_batch(self, model: type[Model], rows: int) -> None:
+        """add_batch records a batch of rows written into the table of a model"""
+        table = model._meta.db_table
+        self.batches_written += 1
+        self.rows_written[table] = self.rows_written.get(table, 0) + rows
+        self.changed()
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "stage": self.stage,
+            "rows_parsed": dict(self.rows_parsed),
+            "batches_written": self.batches_written,
+            "rows_written": dict(self.rows_written),
+        }
+
+    def changed(self, force: bool = False) -> None:
+        if self.on_update is None:
+            return
+        now = monotonic()
+        if force or now - self.last_update >= self.interval:
+            self.last_update = now
+            self.on_update(self.as_dict())
@@ -0,0 +1,110 @@
+from datetime import date
+from pathlib import Path
+from unittest import skipUnless
+
+from django.core.management.color import no_style
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from ..models import Agency, Calendar, Line, Pattern, PatternStop, Stop, Trip
+from .bulk_writer import BulkWriter, CopyBulkWriter, backend_batch_size, bulk_writer, copy_rows
+from .gtfs_import import GTFSLoader
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+class BulkWriterTestCase(TestCase):
+    def test_next_id_continues_existing_ids(self) -> None:
+        Agency.objects.create(id=41, name="Existing", website="https://example.com")
+        writer = BulkWriter([Agency])
+        self.assertEqual(writer.next_id(Agency), 42)
+        self.assertEqual(writer.next_id(Agency), 43)
+
+    def test_batches_inserts(self) -> None:
+        writer = BulkWriter([Agency, Line])
+        agency_id = writer.next_id(Agency)
+        writer.add(Agency(id=agency_id, name="A", website="https://example.com"))
+        for i in range(10):
+            writer.add(
+                Line(id=writer.next_id(Line), code=str(i), line_type=3, agency_id=agency_id)
+            )
+
+        self.assertEqual(Line.objects.count(), 0)
+        # A single INSERT per model, and resets of sequences (if the backend has them)
+        sequence_resets = connection.ops.sequence_reset_sql(no_style(), [Agency, Line])
+        with self.assertNumQueries(2 + len(sequence_resets)):
+            writer.flush()
+        self.assertEqual(Agency.objects.count(), 1)
+        self.assertEqual(Line.objects.count(), 10)
+
+    def test_full_queue_flushes_referenced_models(self) -> None:
+        writer = BulkWriter([Agency, Line])
+        writer.batch_sizes[Line] = 2
+        agency_id = writer.next_id(Agency)
+        writer.add(Agency(id=agency_id, name="A", website="https://example.com"))
+        writer.add(Line(code="1", line_type=3, agency_id=agency_id))
+        writer.add(Line(code="2", line_type=3, agency_id=agency_id))
+
+        self.assertEqual(Agency.objects.count(), 1)
+        self.assertEqual(Line.objects.count(), 2)
+
+    def test_backend_batch_size(self) -> None:
+        self.assertGreater(backend_batch_size(Line), 1)
+        self.assertLessEqual(backend_batch_size(Line), BulkWriter.MAX_BATCH_SIZE)
+
+    def test_bulk_writer_for_backend(self) -> None:
+        writer = bulk_writer([Agency])
+        self.assertIs(
+            type(writer), BulkWriter if connection.vendor != "postgresql" else CopyBulkWriter
+        )
+
+
+class CopyRowsTestCase(SimpleTestCase):
+    def test_escapes_values(self) -> None:
+        agency = Agency(id=1, name="Tab\tNew\nline\\", website="https://example.com")
+        self.assertListEqual(
+            list(copy_rows(Agency, [agency])),
+            ["1\t\\N\t\\N\t\tf\tTab\\tNew\\nline\\\\\thttps://example.com\t\\N\t\\N\n"],
+        )
+
+    def test_converts_values(self) -> None:
+        calendar = Calendar(
+            id=2,
+            name="Sat",
+            monday=False,
+            tuesday=False,
+            wednesday=False,
+            thursday=False,
+            friday=False,
+            saturday=True,
+            sunday=False,
+            start_date=date(2023, 4, 1),
+            end_date=date(2023, 12, 31),
+        )
+        row = next(copy_rows(Calendar, [calendar])).rstrip("\n").split("\t")
+        self.assertListEqual(
+            row[6:15], ["2023-04-01", "2023-12-31", "f", "f", "f", "f", "f", "t", "f"]
+        )
+
+        trip = Trip(id=3, wheelchair_accessible=0, profile_id=1, calendar_id=2, departure=120)
+        self.assertListEqual(
+            next(copy_rows(Trip, [trip])).split("\t")[:8],
+            ["3", "\\N", "\\N", "", "f", "0", "120", "1"],
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY requires PostgreSQL")
+class CopyBulkWriterTestCase(TestCase):
+    def test_load_zip(self) -> None:
+        loader = GTFSLoader()
+        self.assertIsInstance(loader.writer, CopyBulkWriter)
+        loader.from_zip(FIXTURES_DIR / "lomianki.zip")
+
+        self.assertEqual(Stop.objects.count(), 75)
+        self.assertEqual(Pattern.objects.count(), 18)
+        self.assertEqual(PatternStop.objects.count(), 332)
+        self.assertEqual(Trip.objects.count(), 61)
+
+        # Sequences must be reset after rows with explicit IDs were copied
+        agency = Agency.objects.create(name="New", website="https://example.com")
+        self.assertGreater(agency.id, loader.agency_mapping["0"])
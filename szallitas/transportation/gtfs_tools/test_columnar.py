@@ -0,0 +1,48 @@
+from django.test import SimpleTestCase
+
+from .columnar import Interner, StopTimesTable, parse_time, travel_times, trip_stop_times
+
+
+class InternerTestCase(SimpleTestCase):
+    def test(self) -> None:
+        interner = Interner()
+        self.assertEqual(interner("A"), 0)
+        self.assertEqual(interner("B"), 1)
+        self.assertEqual(interner("A"), 0)
+        self.assertEqual(len(interner), 2)
+        self.assertListEqual(interner.values, ["A", "B"])
+
+
+class ParseTimeTestCase(SimpleTestCase):
+    def test(self) -> None:
+        self.assertEqual(parse_time("08:15:30"), 8 * 3600 + 15 * 60 + 30)
+        self.assertEqual(parse_time("5:00:00"), 5 * 3600)
+        self.assertEqual(parse_time("25:48:20"), 25 * 3600 + 48 * 60 + 20)
+
+
+class StopTimesTableTestCase(SimpleTestCase):
+    def test_unsorted(self) -> None:
+        stops = Interner()
+        table = StopTimesTable(stops)
+        table.append("T2", 2, "B", 200)
+        table.append("T1", 3, "C", 130)
+        table.append("T2", 1, "A", 100)
+        table.append("T1", 1, "A", 110)
+        table.append("T1", 2, "B", 120)
+        table.freeze()
+
+        t1 = table.get("T1")
+        assert t1 is not None
+        self.assertListEqual([stops.values[i] for i in t1.stops], ["A", "B", "C"])
+        self.assertListEqual(t1.times.tolist(), [110, 120, 130])
+
+        t2 = table.get("T2")
+        assert t2 is not None
+        self.assertListEqual([stops.values[i] for i in t2.stops], ["A", "B"])
+        self.assertListEqual(t2.times.tolist(), [100, 200])
+
+        self.assertIsNone(table.get("T3"))
+
+    def test_travel_times(self) -> None:
+        stop_times = trip_stop_times([0, 1, 2], [3600, 3660, 3780])
+        self.assertListEqual(travel_times(stop_times.times).tolist(), [0, 60, 180])
@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase
+
+from .compaction import CompactService, compact_service
+
+
+def ordinals(first: date, last: date, weekdays: set[int]) -> list[int]:
+    return [
+        day
+        for day in range(first.toordinal(), last.toordinal() + 1)
+        if date.fromordinal(day).weekday() in weekdays
+    ]
+
+
+class CompactionTestCase(SimpleTestCase):
+    def test_compact_service_weekly(self) -> None:
+        # Weekends of May 2023 - starting on Saturday 2023-05-06
+        days = ordinals(date(2023, 5, 6), date(2023, 5, 28), {5, 6})
+        self.assertEqual(
+            compact_service(days),
+            CompactService(
+                date(2023, 5, 6),
+                date(2023, 5, 28),
+                (False, False, False, False, False, True, True),
+                (),
+                (),
+            ),
+        )
+
+    def test_compact_service_exceptions(self) -> None:
+        # Weekdays of May 2023 without Labour Day, and one Sunday
+        days = ordinals(date(2023, 5, 2), date(2023, 5, 31), {0, 1, 2, 3, 4})
+        days.append(date(2023, 5, 14).toordinal())
+        days.append(date(2023, 5, 1).toordinal() + 1)  # duplicates are ignored
+        service = compact_service(reversed(days))
+
+        self.assertEqual(service.start_date, date(2023, 5, 2))
+        self.assertEqual(service.end_date, date(2023, 5, 31))
+        self.assertTupleEqual(service.weekdays, (True, True, True, True, True, False, False))
+        self.assertTupleEqual(service.added, (date(2023, 5, 14),))
+        self.assertTupleEqual(service.removed, ())
+
+        # Removed days are only listed inside the range
+        days.remove(date(2023, 5, 17).toordinal())
+        service = compact_service(days)
+        self.assertTupleEqual(service.removed, (date(2023, 5, 17),))
+
+    def test_compact_service_irregular(self) -> None:
+        # A single day, and days without a weekly pattern
+        day = date(2023, 5, 3)
+        self.assertEqual(
+            compact_service([day.toordinal()]),
+            CompactService(day, day, (False, False, True, False, False, False, False), (), ()),
+        )
+
+        days = [day + timedelta(days=offset) for offset in (0, 8, 16)]
+        service = compact_service(d.toordinal() for d in days)
+        self.assertFalse(any(service.weekdays))
+        self.assertTupleEqual(service.added, tuple(days))
@@ -0,0 +1,46 @@
+import zlib
+from io import BytesIO
+from zipfile import ZipFile
+
+from django.test import SimpleTestCase
+
+from .deflate import DeflateWriter, SpooledText, crc32_combine, write_deflated_member
+
+
+class CRC32CombineTestCase(SimpleTestCase):
+    def test(self) -> None:
+        first, second = "Warszawa Śródmieście WKD".encode(), "Podkowa Leśna Główna".encode() * 100
+        self.assertEqual(
+            crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second)),
+            zlib.crc32(first + second),
+        )
+
+    def test_empty(self) -> None:
+        self.assertEqual(crc32_combine(0, 0, 0), 0)
+        self.assertEqual(crc32_combine(zlib.crc32(b"foo"), 0, 0), zlib.crc32(b"foo"))
+        self.assertEqual(crc32_combine(0, zlib.crc32(b"foo"), 3), zlib.crc32(b"foo"))
+
+
+class WriteDeflatedMemberTestCase(SimpleTestCase):
+    def test(self) -> None:
+        texts = [SpooledText() for _ in range(3)]
+        texts[0].text.write("trip_id,stop_sequence\r\n")
+        texts[1].text.write("1,0\r\n" * 10_000)
+        texts[2].text.write("Zażółć gęślą jaźń\r\n")
+
+        empty = DeflateWriter()
+
+        buffer = BytesIO()
+        with ZipFile(buffer, mode="w") as archive:
+            archive.writestr("agency.txt", "agency_id\r\n")
+            write_deflated_member(archive, "stop_times.txt", [t.deflate() for t in texts])
+            write_deflated_member(archive, "empty.txt", [empty.finish()])
+
+        with ZipFile(buffer) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read("agency.txt"), b"agency_id\r\n")
+            self.assertEqual(
+                archive.read("stop_times.txt").decode("utf-8"),
+                "trip_id,stop_sequence\r\n" + "1,0\r\n" * 10_000 + "Zażółć gęślą jaźń\r\n",
+            )
+            self.assertEqual(archive.read("empty.txt"), b"")
@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+
+from .external_sort import StopTimesSorter
+from .parsing import TripRow, TripsSorter
+
+
+class StopTimesSorterTestCase(SimpleTestCase):
+    ROWS = [
+        ("2", 3, "C", 29400),
+        ("1", 10, "B", 25500),
+        ("2", 1, "A", 28800),
+        ("10", 1, "A", 32400),
+        ("1", 2, "A", 25200),
+        ("2", 2, "B", 29100),
+    ]
+
+    def test_in_memory(self) -> None:
+        with StopTimesSorter(buffer_size=100) as sorter:
+            sorter.extend(self.ROWS)
+            self.assertListEqual(sorter.runs, [])
+            self.assertListEqual(list(sorter.sorted_rows()), sorted(self.ROWS))
+
+    def test_spills_to_disk(self) -> None:
+        with StopTimesSorter(buffer_size=2) as sorter:
+            sorter.extend(self.ROWS)
+            self.assertEqual(len(sorter.runs), 3)
+            self.assertListEqual(list(sorter.sorted_rows()), sorted(self.ROWS))
+
+    def test_many_runs(self) -> None:
+        rows = [(f"{i % 7}", i, "A", 0) for i in range(200)]
+        with StopTimesSorter(buffer_size=1) as sorter:
+            sorter.extend(reversed(rows))
+            self.assertEqual(len(sorter.runs), 200)
+            self.assertListEqual(list(sorter.sorted_rows()), sorted(rows))
+
+    def test_by_trip(self) -> None:
+        with StopTimesSorter(buffer_size=2) as sorter:
+            sorter.extend(self.ROWS)
+            trips = list(sorter.by_trip())
+
+        self.assertListEqual([trip_id for trip_id, _ in trips], ["1", "10", "2"])
+        self.assertListEqual([seq for _, seq, _, _ in trips[0][1]], [2, 10])
+        self.assertListEqual([stop for _, _, stop, _ in trips[2][1]], ["A", "B", "C"])
+
+
+class TripsSorterTestCase(SimpleTestCase):
+    ROWS = [
+        TripRow("2", "A", "Weekdays", "Center", 0, 1),
+        TripRow("10", "A", "Weekdays", None, None, 0),
+        TripRow("1", "B", "Sundays", "Airport", 1, 2),
+    ]
+
+    def test_spills_to_disk(self) -> None:
+        with TripsSorter(buffer_size=1) as sorter:
+            sorter.extend(self.ROWS)
+            self.assertEqual(len(sorter.runs), 3)
+            self.assertListEqual(list(sorter.sorted_rows()), sorted(self.ROWS))
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test import TestCase, skipUnlessDBFeature
+
+from ..models import PatternStop, Trip
+from .fast_load import sqlite_fast_load
+from .gtfs_import import GTFSLoader
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def table_indexes(model: type[PatternStop] | type[Trip]) -> set[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+            [model._meta.db_table],
+        )
+        return {name for name, in cursor.fetchall()}
+
+
+@skipUnlessDBFeature("can_rollback_ddl")
+class SQLiteFastLoadTestCase(TestCase):
+    def setUp(self) -> None:
+        if connection.vendor != "sqlite":
+            self.skipTest("fast load is only implemented for SQLite")
+
+    def test_drops_and_rebuilds_indexes(self) -> None:
+        indexes = table_indexes(PatternStop)
+        self.assertIn("transportation_patternstop_stop_id_530c62ae", indexes)
+
+        with sqlite_fast_load([PatternStop, Trip]):
+            # Indexes implicitly created for unique constraints are kept
+            self.assertSetEqual(
+                table_indexes(PatternStop), {"sqlite_autoindex_transportation_patternstop_1"}
+            )
+            self.assertSetEqual(table_indexes(Trip), set())
+
+        self.assertSetEqual(table_indexes(PatternStop), indexes)
+
+    def test_load_zip(self) -> None:
+        GTFSLoader(fast_load=True).from_zip(FIXTURES_DIR / "lomianki.zip")
+        self.assertEqual(PatternStop.objects.count(), 332)
+        self.assertEqual(Trip.objects.count(), 61)
+
+        # Tables are analyzed
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_stat1 WHERE tbl = 'transportation_patternstop'")
+            self.assertIsNotNone(cursor.fetchone())
+
+    def test_restores_indexes_on_rollback(self) -> None:
+        indexes = table_indexes(PatternStop)
+        with self.assertRaises(ValueError), transaction.atomic():
+            with sqlite_fast_load([PatternStop]):
+                raise ValueError()
+        self.assertSetEqual(table_indexes(PatternStop), indexes)
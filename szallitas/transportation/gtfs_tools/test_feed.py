@@ -0,0 +1,56 @@
+from io import TextIOWrapper
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile
+
+from django.test import SimpleTestCase
+
+from .feed import DirectoryFeed, MappedTable, open_feed
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+class FeedTestCase(SimpleTestCase):
+    def test_mapped_table(self) -> None:
+        with TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "stops.txt"
+            path.write_bytes("﻿stop_id,stop_name\r\n1,Łomianki\r\n".encode("utf-8"))
+
+            with MappedTable(path) as table:
+                self.assertEqual(len(table), path.stat().st_size)
+                self.assertEqual(table.find(b"\n"), 21)
+                self.assertEqual(table.read(3), b"\xef\xbb\xbf")
+                self.assertEqual(table.seek(-2, 2), len(table) - 2)
+                self.assertEqual(table.read(), b"\r\n")
+                self.assertEqual(table.read(), b"")
+
+            with MappedTable(path) as table:
+                text = TextIOWrapper(table, encoding="utf-8-sig", newline="").read()
+            self.assertEqual(text, "stop_id,stop_name\r\n1,Łomianki\r\n")
+
+            empty = Path(temp_dir) / "empty.txt"
+            empty.touch()
+            with MappedTable(empty) as table:
+                self.assertEqual(len(table), 0)
+                self.assertEqual(table.read(), b"")
+                self.assertEqual(table.find(b"\n"), -1)
+
+    def test_directory_feed(self) -> None:
+        with TemporaryDirectory() as temp_dir, ZipFile(FIXTURES_DIR / "lomianki.zip") as zip:
+            zip.extractall(temp_dir)
+
+            with open_feed(temp_dir) as feed:
+                self.assertIsInstance(feed, DirectoryFeed)
+                self.assertListEqual(feed.namelist(), sorted(zip.namelist()))
+                with feed.open("agency.txt") as stream:
+                    self.assertEqual(stream.read(), zip.read("agency.txt"))
+
+                # Tables are used in place, instead of being copied
+                self.assertEqual(
+                    feed.extract("stop_times.txt", "/nonexistent"),
+                    str(Path(temp_dir) / "stop_times.txt"),
+                )
+                with self.assertRaises(KeyError):
+                    feed.open("transfers.txt")
+
+        self.assertIsInstance(open_feed(FIXTURES_DIR / "lomianki.zip"), ZipFile)
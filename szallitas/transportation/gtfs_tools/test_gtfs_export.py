@@ -1,11 +1,14 @@
 from datetime import date
-from io import StringIO
+from io import BytesIO, StringIO
 from tempfile import TemporaryFile
+from typing import Any
+from unittest.mock import patch
 from zipfile import ZipFile
 
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from ..management.commands.load_sample_data import load_wkd_fixture_database
+from ..models import Frequency, Pattern
 from . import gtfs_export
 
 
@@ -137,6 +140,60 @@ class GTFSExportTestCase(TestCase):
         self.assertEqual(times[19], "1,18,19,05:46:00,05:46:00")
         self.assertEqual(times[20], "2,0,1,05:40:00,05:40:00")
 
+    def test_export_trips_and_stop_times_queries(self) -> None:
+        # Every table is read by a single query, regardless of the number of patterns
+        f_trips, f_times, f_frequencies = StringIO(), StringIO(), StringIO()
+        with self.assertNumQueries(5):
+            gtfs_export.export_trips_and_stop_times(f_trips, f_times, f_frequencies)
+
+        with self.assertNumQueries(1):
+            gtfs_export.export_stops(StringIO())
+
+    def test_export_trips_and_stop_times_ranges(self) -> None:
+        f_trips, f_times = StringIO(), StringIO()
+        gtfs_export.export_trips_and_stop_times(f_trips, f_times)
+
+        ranges = gtfs_export.pattern_ranges(3)
+        self.assertGreater(len(ranges), 1)
+        ranged_trips, ranged_times = StringIO(), StringIO()
+        for i, patterns in enumerate(ranges):
+            gtfs_export.export_trips_and_stop_times(
+                ranged_trips, ranged_times, patterns=patterns, header=i == 0
+            )
+
+        self.assertEqual(ranged_trips.getvalue(), f_trips.getvalue())
+        self.assertEqual(ranged_times.getvalue(), f_times.getvalue())
+
+    def test_export_frequencies(self) -> None:
+        pattern = Pattern.objects.get(id=1)
+        frequency = Frequency.objects.create(
+            profile=pattern.profile_set.get(),
+            calendar_id=1,
+            start_time=10 * 3600,
+            end_time=11 * 3600,
+            headway=20 * 60,
+            wheelchair_accessible=1,
+        )
+
+        f_trips, f_times, f_frequencies = StringIO(), StringIO(), StringIO()
+        gtfs_export.export_trips_and_stop_times(f_trips, f_times, f_frequencies)
+
+        self.assertIn(
+            f"{pattern.line_id},1,F{frequency.id},{pattern.headsign},0,1\r\n", f_trips.getvalue()
+        )
+        self.assertIn(f"F{frequency.id},0,1,10:00:00,10:00:00\r\n", f_times.getvalue())
+        self.assertEqual(
+            f_frequencies.getvalue(),
+            "trip_id,start_time,end_time,headway_secs,exact_times\r\n"
+            f"F{frequency.id},10:00:00,11:00:00,1200,0\r\n",
+        )
+
+        # Without frequencies.txt, trips are expanded
+        f_trips, f_times = StringIO(), StringIO()
+        gtfs_export.export_trips_and_stop_times(f_trips, f_times)
+        self.assertEqual(len(f_trips.getvalue().split("\r\n")), 378 + 3)
+        self.assertIn(f"F{frequency.id}-2,0,1,10:40:00,10:40:00\r\n", f_times.getvalue())
+
     def test_export_all(self) -> None:
         with TemporaryFile(mode="w+b") as zip_buffer:
             # Export to GTFS data
@@ -157,3 +214,108 @@ class GTFSExportTestCase(TestCase):
                         "stop_times.txt",
                     },
                 )
+
+    def test_export_all_streamed(self) -> None:
+        Frequency.objects.create(
+            profile=Pattern.objects.get(id=1).profile_set.get(),
+            calendar_id=1,
+            start_time=10 * 3600,
+            end_time=11 * 3600,
+            headway=20 * 60,
+            wheelchair_accessible=1,
+        )
+        f_trips, f_times, f_frequencies = StringIO(), StringIO(), StringIO()
+        gtfs_export.export_trips_and_stop_times(f_trips, f_times, f_frequencies)
+
+        # Archives can be streamed into handles which can't seek, like HTTP responses
+        zip_buffer = BytesIO()
+        gtfs_export.export_all(UnseekableWriter(zip_buffer))  # type: ignore
+
+        with ZipFile(zip_buffer) as archive:
+            self.assertEqual(archive.read("trips.txt").decode("utf-8"), f_trips.getvalue())
+            self.assertEqual(archive.read("stop_times.txt").decode("utf-8"), f_times.getvalue())
+            self.assertEqual(
+                archive.read("frequencies.txt").decode("utf-8"), f_frequencies.getvalue()
+            )
+
+
+class UnseekableWriter:
+    def __init__(self, to: BytesIO) -> None:
+        self.to = to
+
+    def write(self, data: bytes) -> int:
+        return self.to.write(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class BalancedSplitsTestCase(SimpleTestCase):
+    def test(self) -> None:
+        weights = [(1, 10), (2, 10), (5, 10), (7, 10)]
+        self.assertEqual(gtfs_export.balanced_splits(weights, 2), [5])
+        self.assertEqual(gtfs_export.balanced_splits(weights, 4), [2, 5, 7])
+        self.assertEqual(gtfs_export.balanced_splits(weights, 8), [2, 5, 7])
+        self.assertEqual(gtfs_export.balanced_splits(weights, 1), [])
+
+    def test_uneven(self) -> None:
+        weights = [(1, 100), (2, 10), (3, 10), (4, 10)]
+        self.assertEqual(gtfs_export.balanced_splits(weights, 2), [2])
+        self.assertEqual(gtfs_export.balanced_splits(weights, 3), [2, 3])
+
+    def test_empty(self) -> None:
+        self.assertEqual(gtfs_export.balanced_splits([], 4), [])
+        self.assertEqual(gtfs_export.balanced_splits([(1, 0), (2, 0)], 4), [])
+
+
+class ParallelExportTestCase(TestCase):
+    # NOTE: Workers only compress tables - the data is read through the connection
+    #       of the test, so it doesn't have to be committed.
+
+    def setUp(self) -> None:
+        load_wkd_fixture_database()
+
+    def assertSameExport(self) -> None:
+        serial = BytesIO()
+        gtfs_export.export_all(serial)
+
+        parallel = BytesIO()
+        gtfs_export.export_all(UnseekableWriter(parallel), workers=3)  # type: ignore
+
+        with ZipFile(serial) as expected, ZipFile(parallel) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), expected.namelist())
+            for name in expected.namelist():
+                self.assertEqual(archive.read(name), expected.read(name), name)
+
+    def test(self) -> None:
+        self.assertSameExport()
+
+    def test_frequencies(self) -> None:
+        Frequency.objects.create(
+            profile=Pattern.objects.get(id=1).profile_set.get(),
+            calendar_id=1,
+            start_time=10 * 3600,
+            end_time=11 * 3600,
+            headway=20 * 60,
+            wheelchair_accessible=1,
+        )
+        self.assertSameExport()
+
+    def test_streamed(self) -> None:
+        parallel = BytesIO()
+        written_before_trips: list[bytes] = []
+        pattern_ranges = gtfs_export.pattern_ranges
+
+        def recording_pattern_ranges(parts: int) -> Any:
+            written_before_trips.append(parallel.getvalue())
+            return pattern_ranges(parts)
+
+        with patch.object(gtfs_export, "pattern_ranges", recording_pattern_ranges):
+            gtfs_export.export_all(UnseekableWriter(parallel), workers=3)  # type: ignore
+
+        # Simple tables are written before trips are generated
+        [written] = written_before_trips
+        self.assertIn(b"agency.txt", written)
+        self.assertIn(b"calendar_dates.txt", written)
+        self.assertEqual(parallel.getvalue()[: len(written)], written)
@@ -1,9 +1,15 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-from io import StringIO
+from io import BytesIO, StringIO
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+from unittest.mock import patch
+from zipfile import ZipFile
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from ..models import *
 from . import gtfs_import
@@ -11,6 +17,27 @@ from . import gtfs_import
 FIXTURES_DIR = Path(__file__).with_name("fixtures")
 
 
+def modified_fixture(
+    added: dict[str, str] | None = None,
+    **replacements: tuple[str, str],
+) -> BytesIO:
+    """modified_fixture returns the lomianki.zip fixture, with (old, new) text replacements
+    applied to the provided tables (table name without .txt suffix),
+    and with `added` tables (file name to content)"""
+    buffer = BytesIO()
+    with ZipFile(FIXTURES_DIR / "lomianki.zip") as src, ZipFile(buffer, "w") as dst:
+        for name in src.namelist():
+            content = src.read(name).decode("utf-8")
+            if (replacement := replacements.get(name.removesuffix(".txt"))) is not None:
+                assert replacement[0] in content
+                content = content.replace(*replacement)
+            dst.writestr(name, content)
+        for name, content in (added or {}).items():
+            dst.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
 class GTFSImportTestCase(TestCase):
     def setUp(self) -> None:
         return super().setUp()
@@ -161,13 +188,391 @@ Robocze,20230410,2"""
         assert patternstop is not None
         self.assertEqual(patternstop.pattern.id, 1)
         self.assertEqual(patternstop.stop.name, "Dziekanów Leśny 01")
-        self.assertEqual(patternstop.travel_time, timedelta(0))
         self.assertEqual(patternstop.index, 0)
 
+        self.assertEqual(TravelTimeProfile.objects.count(), 18)
+        profile = TravelTimeProfile.objects.first()
+        assert profile is not None
+        self.assertEqual(profile.pattern.id, 1)
+        self.assertEqual(len(profile.travel_times), profile.pattern.pattern_stop_set.count())
+        self.assertEqual(profile.travel_times[0], 0)
+        self.assertEqual(profile.travel_times[1], 120)
+
         self.assertEqual(Trip.objects.count(), 61)
         trip = Trip.objects.first()
         assert trip is not None
         self.assertEqual(trip.wheelchair_accessible, 0)
-        self.assertEqual(trip.departure, timedelta(seconds=23220))
-        self.assertEqual(trip.pattern.id, 1)
+        self.assertEqual(trip.departure, 23220)
+        self.assertEqual(trip.profile.pattern.id, 1)
+        self.assertEqual(trip.calendar.name, "Robocze")
+
+    def test_load_zip_shared_pattern(self):
+        # Trips 1 and 2 visit the same stops, but now with different running times
+        feed = modified_fixture(
+            stop_times=("\n1,125-1,2,06:29:00,06:29:00", "\n1,125-1,2,06:30:00,06:30:00")
+        )
+        gtfs_import.GTFSLoader().from_zip(feed)
+
+        self.assertEqual(Pattern.objects.count(), 18)
+        self.assertEqual(PatternStop.objects.count(), 332)
+        self.assertEqual(TravelTimeProfile.objects.count(), 19)
+
+        first, second = Trip.objects.filter(source_id__in=("1", "2")).order_by("source_id")
+        self.assertNotEqual(first.profile_id, second.profile_id)
+        self.assertEqual(first.profile.pattern_id, second.profile.pattern_id)
+        self.assertEqual(first.profile.travel_times[1], 180)
+        self.assertEqual(second.profile.travel_times[1], 120)
+
+    def test_load_zip_streaming(self):
+        loader = gtfs_import.GTFSLoader(stop_times_buffer=100)
+        loader.from_zip(FIXTURES_DIR / "lomianki.zip")
+
+        self.assertEqual(Pattern.objects.count(), 18)
+        self.assertEqual(PatternStop.objects.count(), 332)
+        self.assertEqual(Trip.objects.count(), 61)
+
+        # Trips are processed in trip_id order, "1" being the first one
+        trip = Trip.objects.order_by("id").first()
+        assert trip is not None
+        self.assertEqual(trip.departure, 23220)
+        self.assertEqual(trip.departure_display(), "06:27:00")
+        self.assertEqual(trip.profile.pattern.headsign, "Osiedle Równoległa")
         self.assertEqual(trip.calendar.name, "Robocze")
+
+    def test_load_zip_streaming_unmatched(self):
+        # Trips without stop times, and stop times of unknown trips are skipped
+        feed = modified_fixture(
+            trips=("\r\n1,1,", "\r\n1,0,Robocze,0,1,\r\n1,10a,Robocze,0,1,\r\n1,1,"),
+            stop_times=("\r\n1,126-1,", "\r\n00,126-1,1,06:00:00,06:00:00\r\n1,126-1,"),
+        )
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                gtfs_import.clear_tables()
+                gtfs_import.GTFSLoader(stop_times_buffer=5, workers=workers).from_zip(feed)
+                feed.seek(0)
+
+                self.assertEqual(Trip.objects.count(), 61)
+                self.assertFalse(Trip.objects.filter(source_id__in=("0", "00", "10a")).exists())
+
+    def test_import_calendar_exceptions_batched(self):
+        test_csv = "service_id,date,exception_type\n" + "".join(
+            f"Robocze,202304{day:02},1\n" for day in range(1, 31)
+        )
+        importer = gtfs_import.GTFSLoader()
+        # Next Calendar ID and Calendar inserts - every day is covered by the compacted calendar
+        with self.assertNumQueries(2):
+            importer.import_calendar_exceptions(StringIO(test_csv))
+        self.assertEqual(CalendarException.objects.count(), 0)
+
+    def test_import_calendar_exceptions_compacted(self):
+        # Weekdays of 2023-04-03 - 2023-04-28, except Easter Monday (2023-04-10) and with
+        # an additional Saturday, for two identical services, and a removed-only service
+        days = [date(2023, 4, 3) + timedelta(days=i) for i in range(26)]
+        service_days = [d for d in days if d.weekday() < 5 and d.day != 10] + [date(2023, 4, 15)]
+        test_csv = "service_id,date,exception_type\n" + "".join(
+            f"{service_id},{d:%Y%m%d},1\n" for service_id in ("A", "B") for d in service_days
+        )
+        test_csv += "C,20230410,2\n"
+
+        importer = gtfs_import.GTFSLoader()
+        importer.import_calendar_exceptions(StringIO(test_csv))
+
+        self.assertEqual(importer.calendar_mapping["A"], importer.calendar_mapping["B"])
+        self.assertEqual(Calendar.objects.count(), 2)
+        calendar = Calendar.objects.get(id=importer.calendar_mapping["A"])
+        self.assertEqual(calendar.name, "A")
+        self.assertEqual(calendar.start_date, date(2023, 4, 3))
+        self.assertEqual(calendar.end_date, date(2023, 4, 28))
+        self.assertListEqual(
+            [
+                calendar.monday,
+                calendar.tuesday,
+                calendar.wednesday,
+                calendar.thursday,
+                calendar.friday,
+                calendar.saturday,
+                calendar.sunday,
+            ],
+            [True, True, True, True, True, False, False],
+        )
+        self.assertListEqual(
+            list(calendar.calendar_exception_set.order_by("day").values_list("day", "added")),
+            [(date(2023, 4, 10), False), (date(2023, 4, 15), True)],
+        )
+        self.assertEqual(CalendarException.objects.count(), 3)
+
+    def test_load_zip_parallel(self):
+        gtfs_import.GTFSLoader().from_zip(FIXTURES_DIR / "lomianki.zip")
+        expected_departures = sorted(Trip.objects.values_list("departure", flat=True))
+
+        for stop_times_buffer in (None, 100):
+            with self.subTest(stop_times_buffer=stop_times_buffer):
+                gtfs_import.clear_tables()
+                loader = gtfs_import.GTFSLoader(stop_times_buffer=stop_times_buffer, workers=2)
+                loader.from_zip(FIXTURES_DIR / "lomianki.zip")
+
+                self.assertEqual(Pattern.objects.count(), 18)
+                self.assertEqual(PatternStop.objects.count(), 332)
+                self.assertEqual(Trip.objects.count(), 61)
+                self.assertListEqual(
+                    sorted(Trip.objects.values_list("departure", flat=True)),
+                    expected_departures,
+                )
+
+    def test_load_directory(self):
+        gtfs_import.GTFSLoader().from_zip(FIXTURES_DIR / "lomianki.zip")
+        expected_trips = sorted(Trip.objects.values_list("source_id", "departure"))
+
+        with TemporaryDirectory() as temp_dir, ZipFile(FIXTURES_DIR / "lomianki.zip") as zip:
+            zip.extractall(temp_dir)
+            for workers in (1, 2):
+                with self.subTest(workers=workers):
+                    gtfs_import.clear_tables()
+                    gtfs_import.GTFSLoader(workers=workers).from_zip(temp_dir)
+
+                    self.assertEqual(Stop.objects.count(), 75)
+                    self.assertEqual(PatternStop.objects.count(), 332)
+                    self.assertListEqual(
+                        sorted(Trip.objects.values_list("source_id", "departure")), expected_trips
+                    )
+
+    def test_load_zip_incremental_unchanged(self):
+        gtfs_import.GTFSLoader().from_zip(FIXTURES_DIR / "lomianki.zip")
+        stop_ids = set(Stop.objects.values_list("id", flat=True))
+        trip_ids = set(Trip.objects.values_list("id", flat=True))
+        pattern_ids = set(Pattern.objects.values_list("id", flat=True))
+
+        version = DataVersion.current().version
+        self.assertGreater(version, 0)
+
+        # Only reads should be performed when nothing has changed
+        loader = gtfs_import.GTFSLoader(incremental=True)
+        with CaptureQueriesContext(connection) as queries:
+            loader.from_zip(FIXTURES_DIR / "lomianki.zip")
+        self.assertListEqual(
+            [q["sql"] for q in queries if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))],
+            [],
+        )
+        self.assertEqual(DataVersion.current().version, version)
+
+        self.assertSetEqual(set(Stop.objects.values_list("id", flat=True)), stop_ids)
+        self.assertSetEqual(set(Trip.objects.values_list("id", flat=True)), trip_ids)
+        self.assertSetEqual(set(Pattern.objects.values_list("id", flat=True)), pattern_ids)
+        self.assertEqual(CalendarException.objects.count(), 16)
+        self.assertEqual(PatternStop.objects.count(), 332)
+
+    def test_load_zip_replace(self):
+        gtfs_import.GTFSLoader().from_zip(FIXTURES_DIR / "lomianki.zip")
+        gtfs_import.GTFSLoader(replace=True).from_zip(FIXTURES_DIR / "lomianki.zip")
+
+        self.assertEqual(Agency.objects.count(), 1)
+        self.assertEqual(Stop.objects.count(), 75)
+        self.assertEqual(Pattern.objects.count(), 18)
+        self.assertEqual(PatternStop.objects.count(), 332)
+        self.assertEqual(Trip.objects.count(), 61)
+
+    def test_load_zip_replace_keeps_data_on_failure(self):
+        gtfs_import.GTFSLoader().from_zip(FIXTURES_DIR / "lomianki.zip")
+
+        # Trip referencing an unknown route fails the import after previous data was removed
+        broken = modified_fixture(trips=("1,2,Szkolne", "unknown,2,Szkolne"))
+        with self.assertRaises(KeyError):
+            gtfs_import.GTFSLoader(replace=True).from_zip(broken)
+
+        self.assertEqual(Stop.objects.count(), 75)
+        self.assertEqual(Trip.objects.count(), 61)
+
+    def test_load_zip_incremental_changes(self):
+        first_loader = gtfs_import.GTFSLoader()
+        first_loader.from_zip(FIXTURES_DIR / "lomianki.zip")
+        stop_id = first_loader.stop_mapping["114-3"]
+        trip_id = Trip.objects.get(source_id="1").id
+
+        loader = gtfs_import.GTFSLoader(incremental=True)
+        loader.from_zip(
+            modified_fixture(
+                stops=("Łomianki Buraków 03", "Łomianki Buraków Trzy"),
+                trips=("1,2,Szkolne,0,1,Osiedle Równoległa\r\n", ""),
+                calendar_dates=("Robocze,20230410,2", "Robocze,20230410,2\r\nRobocze,20230411,2"),
+            )
+        )
+
+        stop = Stop.objects.get(source_id="114-3")
+        self.assertEqual(stop.id, stop_id)
+        self.assertEqual(stop.name, "Łomianki Buraków Trzy")
+        self.assertEqual(Stop.objects.count(), 75)
+
+        self.assertEqual(Trip.objects.get(source_id="1").id, trip_id)
+        self.assertFalse(Trip.objects.filter(source_id="2").exists())
+        self.assertEqual(Trip.objects.count(), 60)
+
+        self.assertEqual(CalendarException.objects.count(), 17)
+        self.assertEqual(Pattern.objects.count(), 18)
+
+    def test_import_feeds(self):
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                loaders = gtfs_import.import_feeds(
+                    {"a": FIXTURES_DIR / "lomianki.zip", "b": FIXTURES_DIR / "lomianki.zip"},
+                    workers=workers,
+                    replace=True,
+                )
+
+                self.assertEqual(Stop.objects.count(), 150)
+                self.assertEqual(Pattern.objects.count(), 36)
+                self.assertEqual(Trip.objects.count(), 122)
+                self.assertEqual(Stop.objects.filter(source_id="a:114-3").count(), 1)
+                self.assertEqual(Stop.objects.filter(source_id="b:114-3").count(), 1)
+                self.assertNotEqual(
+                    loaders["a"].stop_mapping["114-3"], loaders["b"].stop_mapping["114-3"]
+                )
+
+    def test_load_zip_incremental_namespace(self):
+        gtfs_import.import_feeds(
+            {"a": FIXTURES_DIR / "lomianki.zip", "b": FIXTURES_DIR / "lomianki.zip"}
+        )
+        b_trips = set(Trip.objects.filter(source_id__startswith="b:").values_list("id", flat=True))
+
+        loader = gtfs_import.GTFSLoader(incremental=True, namespace="a")
+        loader.from_zip(modified_fixture(trips=("1,2,Szkolne,0,1,Osiedle Równoległa\r\n", "")))
+
+        self.assertFalse(Trip.objects.filter(source_id="a:2").exists())
+        self.assertEqual(Trip.objects.filter(source_id__startswith="a:").count(), 60)
+        self.assertSetEqual(
+            set(Trip.objects.filter(source_id__startswith="b:").values_list("id", flat=True)),
+            b_trips,
+        )
+        self.assertEqual(Pattern.objects.count(), 36)
+
+    def test_load_zip_incremental_without_namespace(self):
+        gtfs_import.import_feeds({"a": FIXTURES_DIR / "lomianki.zip"})
+        a_trips = set(Trip.objects.values_list("id", flat=True))
+
+        loader = gtfs_import.GTFSLoader(incremental=True)
+        loader.from_zip(modified_fixture(trips=("1,2,Szkolne,0,1,Osiedle Równoległa\r\n", "")))
+
+        self.assertEqual(Trip.objects.filter(namespace="").count(), 60)
+        self.assertSetEqual(
+            set(Trip.objects.filter(namespace="a").values_list("id", flat=True)), a_trips
+        )
+        self.assertEqual(Stop.objects.count(), 150)
+        self.assertEqual(Pattern.objects.count(), 36)
+
+    def test_load_zip_frequencies(self):
+        frequencies = (
+            "trip_id,start_time,end_time,headway_secs,exact_times\r\n"
+            "1,05:00:00,07:00:00,600,1\r\n"
+            "1,07:00:00,08:00:00,900,1\r\n"
+        )
+        loader = gtfs_import.GTFSLoader()
+        loader.from_zip(modified_fixture({"frequencies.txt": frequencies}))
+
+        self.assertEqual(Trip.objects.count(), 60)
+        self.assertFalse(Trip.objects.filter(source_id="1").exists())
+        self.assertEqual(Frequency.objects.count(), 2)
+
+        frequency = Frequency.objects.get(source_id="1#0")
+        self.assertEqual(frequency.start_time, 5 * 3600)
+        self.assertEqual(frequency.end_time, 7 * 3600)
+        self.assertEqual(frequency.headway, 600)
+        self.assertEqual(frequency.start_time_display(), "05:00:00")
+        self.assertTrue(frequency.exact_times)
+        self.assertEqual(frequency.calendar_id, loader.calendar_mapping["Robocze"])
+        self.assertEqual(len(list(frequency.departures())), 12)
+
+        # Travel times of the profile come from stop_times.txt of the template trip
+        self.assertListEqual(frequency.profile.travel_times[:2], [0, 120])
+
+    def test_load_zip_resumable(self):
+        gtfs_import.GTFSLoader().from_zip(FIXTURES_DIR / "lomianki.zip")
+        published_trips = set(Trip.objects.values_list("id", flat=True))
+
+        class InterruptedLoader(gtfs_import.GTFSLoader):
+            def load_trip(self, *args: Any, **kwargs: Any) -> None:
+                if self.trips_loaded == 25:
+                    raise MemoryError()
+                super().load_trip(*args, **kwargs)
+
+        with patch.object(gtfs_import, "CHECKPOINT_TRIPS", 10):
+            with self.assertRaises(MemoryError):
+                InterruptedLoader(resumable=True).from_zip(FIXTURES_DIR / "lomianki.zip")
+
+            # Committed stages are kept, but hidden from readers
+            checkpoint = ImportCheckpoint.objects.get(namespace="")
+            self.assertListEqual(
+                checkpoint.finished_stages,
+                ["agency", "routes", "stops", "calendar", "calendar_dates"],
+            )
+            self.assertEqual(checkpoint.trips, 20)
+            self.assertEqual(Trip.all_objects.filter(staged=True).count(), 20)
+            self.assertSetEqual(set(Trip.objects.values_list("id", flat=True)), published_trips)
+            self.assertEqual(Stop.objects.count(), 75)
+            self.assertEqual(Pattern.objects.count(), 18)
+            staged_trips = set(Trip.all_objects.filter(staged=True).values_list("id", flat=True))
+
+            # Finished tables are not imported again, and committed trips are kept
+            loader = gtfs_import.GTFSLoader(resumable=True)
+            loader.from_zip(FIXTURES_DIR / "lomianki.zip")
+
+        self.assertFalse(ImportCheckpoint.objects.exists())
+        self.assertEqual(Agency.all_objects.count(), 1)
+        self.assertEqual(Stop.all_objects.count(), 75)
+        self.assertEqual(Pattern.all_objects.count(), 18)
+        self.assertEqual(PatternStop.objects.count(), 332)
+        self.assertEqual(Trip.all_objects.count(), 61)
+        self.assertEqual(CalendarException.all_objects.count(), 16)
+        self.assertFalse(Trip.all_objects.filter(staged=True).exists())
+        self.assertTrue(staged_trips <= set(Trip.objects.values_list("id", flat=True)))
+        self.assertTrue(Trip.objects.filter(source_id="1").exists())
+        self.assertEqual(Stop.objects.get(source_id="114-3").id, loader.stop_mapping["114-3"])
+
+    def test_load_zip_resumable_other_feed(self):
+        with patch.object(gtfs_import, "CHECKPOINT_TRIPS", 10):
+            broken = modified_fixture(trips=("1,2,Szkolne", "unknown,2,Szkolne"))
+            with self.assertRaises(KeyError):
+                gtfs_import.GTFSLoader(resumable=True, namespace="a").from_zip(broken)
+            self.assertTrue(Stop.all_objects.filter(namespace="a", staged=True).exists())
+
+            # Objects staged from a different feed are discarded
+            loader = gtfs_import.GTFSLoader(resumable=True, namespace="a")
+            loader.from_zip(FIXTURES_DIR / "lomianki.zip")
+
+        self.assertEqual(Stop.all_objects.count(), 75)
+        self.assertEqual(Trip.all_objects.count(), 61)
+        self.assertEqual(Trip.objects.filter(source_id__startswith="a:").count(), 61)
+
+    def test_load_zip_tilde_ids(self):
+        gtfs_import.GTFSLoader().from_zip(
+            modified_fixture(agency=("\n0,", "\n~0,"), routes=("\n0,", "\n~0,"))
+        )
+
+        self.assertEqual(Agency.objects.get().source_id, "~0")
+        self.assertEqual(Line.objects.count(), Line.all_objects.count())
+        self.assertEqual(Pattern.objects.count(), 18)
+
+    def test_load_zip_horizon(self):
+        # Both services run on weekdays, with 2023-05-01 and 2023-05-03 removed
+        loader = gtfs_import.GTFSLoader(horizon=(date(2023, 5, 1), date(2023, 5, 3)))
+        loader.from_zip(
+            modified_fixture(calendar=("Szkolne,20230126,20240117", "Szkolne,20230126,20230430"))
+        )
+
+        self.assertListEqual(
+            list(Calendar.objects.values_list("source_id", flat=True)), ["Robocze"]
+        )
+        self.assertSetEqual(
+            set(CalendarException.objects.values_list("day", flat=True)),
+            {date(2023, 5, 1), date(2023, 5, 3)},
+        )
+        self.assertEqual(Trip.objects.count(), 16)
+        self.assertFalse(Pattern.objects.filter(profile_set__isnull=True).exists())
+        self.assertFalse(TravelTimeProfile.objects.filter(trip__isnull=True).exists())
+        self.assertEqual(Stop.objects.count(), 75)
+
+        # Nothing runs on Christmas
+        gtfs_import.GTFSLoader(
+            replace=True, horizon=(date(2023, 12, 25), date(2023, 12, 26))
+        ).from_zip(FIXTURES_DIR / "lomianki.zip")
+        self.assertFalse(Calendar.objects.exists())
+        self.assertFalse(Trip.objects.exists())
+        self.assertFalse(Pattern.objects.exists())
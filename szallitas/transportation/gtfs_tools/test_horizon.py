@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.test import SimpleTestCase
+
+from .horizon import active_services, weekday_count
+
+CALENDAR = [
+    # Mon-Fri and weekends of the first half of 2023
+    ("weekdays", "20230101", "20230630", "1", "1", "1", "1", "1", "0", "0"),
+    ("weekends", "20230101", "20230630", "0", "0", "0", "0", "0", "1", "1"),
+    ("expired", "20220101", "20221231", "1", "1", "1", "1", "1", "1", "1"),
+]
+
+
+class HorizonTestCase(SimpleTestCase):
+    def test_weekday_count(self) -> None:
+        # 2023-05-01 is a Monday
+        self.assertEqual(weekday_count(date(2023, 5, 1), date(2023, 5, 31), 0), 5)
+        self.assertEqual(weekday_count(date(2023, 5, 1), date(2023, 5, 31), 6), 4)
+        self.assertEqual(weekday_count(date(2023, 5, 2), date(2023, 5, 7), 0), 0)
+        self.assertEqual(weekday_count(date(2023, 5, 2), date(2023, 5, 1), 1), 0)
+
+    def test_active_services(self) -> None:
+        # Saturday and Sunday
+        weekend = (date(2023, 5, 6), date(2023, 5, 7))
+        self.assertSetEqual(active_services(CALENDAR, [], weekend), {"weekends"})
+
+        # All regular service days removed, or service added by calendar_dates.txt
+        calendar_dates = [
+            ("weekends", "20230506", "2"),
+            ("weekends", "20230507", "2"),
+            ("weekdays", "20230507", "1"),
+            ("holidays", "20230506", "1"),
+            ("holidays", "20231224", "1"),
+        ]
+        self.assertSetEqual(
+            active_services(CALENDAR, calendar_dates, weekend), {"weekdays", "holidays"}
+        )
+
+        # Window outside of all services
+        self.assertSetEqual(
+            active_services(CALENDAR, [], (date(2024, 1, 1), date(2024, 12, 31))), set()
+        )
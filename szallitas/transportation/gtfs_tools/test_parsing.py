@@ -0,0 +1,91 @@
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase
+
+from . import parsing
+
+STOP_TIMES = """﻿trip_id,stop_id,stop_sequence,departure_time,pickup_type,drop_off_type
+1,A,1,06:00:00,0,0
+1,B,2,06:05:00,1,1
+1,C,3,06:10:00,0,1
+2,A,1,07:00:00,,
+2,C,2,07:10:00,,
+"""
+
+
+class ParsingTestCase(SimpleTestCase):
+    def test_read_columns(self) -> None:
+        table = "stop_id, stop_name ,stop_lat\nA,Foo,1.0\n\nB,Bar\n"
+        self.assertListEqual(
+            list(parsing.read_columns(StringIO(table), ("stop_name", "stop_id"), ("stop_lat",))),
+            [("Foo", "A", "1.0"), ("Bar", "B", "")],
+        )
+        self.assertListEqual(
+            list(parsing.read_columns(StringIO(table), ("stop_id",), ("stop_code",))),
+            [("A", ""), ("B", "")],
+        )
+        self.assertListEqual(
+            list(parsing.read_columns(StringIO(table), ("stop_id",))),
+            [("A",), ("B",)],
+        )
+        with self.assertRaises(KeyError):
+            list(parsing.read_columns(StringIO(table), ("stop_id", "stop_code")))
+
+    def test_iter_trips(self) -> None:
+        trips = list(
+            parsing.iter_trips(
+                StringIO(
+                    "route_id,trip_id,service_id,direction_id,trip_headsign\n"
+                    "1,T1,S,0,Foo\n"
+                    "1,T2,S,,\n"
+                )
+            )
+        )
+        self.assertListEqual(
+            trips,
+            [
+                parsing.TripRow("T1", "1", "S", "Foo", 0, 0),
+                parsing.TripRow("T2", "1", "S", None, None, 0),
+            ],
+        )
+
+    def test_iter_stop_times(self) -> None:
+        stop_times = list(parsing.iter_stop_times(StringIO(STOP_TIMES.lstrip("﻿"))))
+        self.assertListEqual(
+            stop_times,
+            [
+                ("1", 1, "A", 21600),
+                ("1", 3, "C", 22200),
+                ("2", 1, "A", 25200),
+                ("2", 2, "C", 25800),
+            ],
+        )
+
+    def test_split_table(self) -> None:
+        with TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "stop_times.txt"
+            path.write_text(STOP_TIMES, encoding="utf-8")
+
+            for chunks in range(1, 10):
+                header, ranges = parsing.split_table(path, chunks)
+                self.assertEqual(header[0], "trip_id")
+                self.assertLessEqual(len(ranges), chunks)
+
+                # Chunks must be contiguous, cover the whole file and start at line boundaries
+                data = path.read_bytes()
+                self.assertEqual(ranges[-1][1], len(data))
+                for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                    self.assertEqual(end, start)
+                    self.assertEqual(data[start - 1 : start], b"\n")
+
+                stop_times = [
+                    stop_time
+                    for byte_range in ranges
+                    for stop_time in parsing.parse_stop_times_chunk(path, header, byte_range)
+                ]
+                self.assertListEqual(
+                    stop_times,
+                    list(parsing.iter_stop_times(StringIO(STOP_TIMES.lstrip("﻿")))),
+                )
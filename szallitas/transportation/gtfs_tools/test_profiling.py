@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from django.test import TestCase
+
+from .gtfs_import import GTFSLoader
+from .profiling import ImportProfiler
+from .progress import ImportProgress
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+class ImportProfilerTestCase(TestCase):
+    def test_profiles_import_stages(self) -> None:
+        profiler = ImportProfiler()
+        GTFSLoader(progress=ImportProgress(profiler=profiler)).from_zip(
+            FIXTURES_DIR / "lomianki.zip"
+        )
+
+        stages = {stage.stage: stage for stage in profiler.stages}
+        self.assertListEqual(
+            list(stages),
+            ["agency", "routes", "stops", "calendar", "calendar_dates", "stop_times", "trips"],
+        )
+        self.assertEqual(stages["stops"].rows, 75)
+        self.assertEqual(stages["trips"].rows, 61)
+        self.assertGreater(stages["trips"].queries, 0)
+        self.assertEqual(stages["stop_times"].queries, 0)
+
+        total = profiler.total()
+        self.assertEqual(total.queries, sum(stage.queries for stage in stages.values()))
+        self.assertGreater(total.wall_time, 0)
+
+        report = profiler.report()
+        self.assertIn("calendar_dates", report)
+        self.assertTrue(report.splitlines()[-1].startswith("total"))
+
+    def test_without_stages(self) -> None:
+        profiler = ImportProfiler()
+        profiler.finish(0)
+        self.assertDictEqual(
+            profiler.as_dict()["total"],
+            {
+                "stage": "total",
+                "wall_time": 0.0,
+                "rows": 0,
+                "queries": 0,
+                "query_time": 0.0,
+                "peak_rss": None,
+                "rows_per_second": 0.0,
+            },
+        )
@@ -0,0 +1,97 @@
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from zipfile import BadZipFile, ZipFile
+
+from django.test import SimpleTestCase
+
+from .test_gtfs_import import modified_fixture
+from .validation import MAX_ISSUES_PER_TABLE, validate_feed
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+class ValidationTestCase(SimpleTestCase):
+    def test_valid_feed(self) -> None:
+        report = validate_feed(FIXTURES_DIR / "lomianki.zip")
+        self.assertTrue(report.ok, report.summary())
+        self.assertEqual(report.rows["stop_times.txt"], 1064)
+        self.assertListEqual(report.issues, [])
+
+    def test_valid_directory(self) -> None:
+        with TemporaryDirectory() as temp_dir, ZipFile(FIXTURES_DIR / "lomianki.zip") as zip:
+            zip.extractall(temp_dir)
+            report = validate_feed(temp_dir)
+        self.assertTrue(report.ok, report.summary())
+        self.assertEqual(report.rows["stop_times.txt"], 1064)
+
+    def test_broken_references(self) -> None:
+        report = validate_feed(
+            modified_fixture(
+                trips=("1,2,Szkolne", "unknown,2,Szkolne"),
+                stop_times=("2,125-1,2,", "2,unknown,2,"),
+            )
+        )
+        self.assertFalse(report.ok)
+        messages = [(issue.table, issue.message) for issue in report.errors]
+        self.assertIn(("trips.txt", "route_id 'unknown' is not defined in routes.txt"), messages)
+        self.assertIn(
+            ("stop_times.txt", "stop_id 'unknown' is not defined in stops.txt"), messages
+        )
+
+    def test_stop_times_order(self) -> None:
+        report = validate_feed(
+            modified_fixture(stop_times=("2,125-1,2,06:49:00,06:49:00", "2,125-1,2,06:49:00,6:49"))
+        )
+        self.assertEqual(len(report.errors), 1)
+        self.assertEqual(report.errors[0].message, "departure_time '6:49' is not a H:MM:SS time")
+        self.assertEqual(report.errors[0].table, "stop_times.txt")
+
+        # Departures decreasing along the trip
+        report = validate_feed(
+            modified_fixture(
+                stop_times=("2,125-1,2,06:49:00,06:49:00", "2,125-1,2,06:49:00,01:49:00")
+            )
+        )
+        self.assertEqual(len(report.errors), 1)
+        self.assertIn("departure_time of trip", report.errors[0].message)
+
+    def test_skipped_stop_times(self) -> None:
+        # Stop times without any passenger exchange aren't imported, so their times aren't needed
+        report = validate_feed(
+            modified_fixture(
+                stop_times=(
+                    "departure_time\r\n1,126-1,1,06:27:00,06:27:00",
+                    "departure_time,pickup_type,drop_off_type\r\n1,126-1,1,,,1,1",
+                )
+            )
+        )
+        self.assertTrue(report.ok, report.summary())
+
+        report = validate_feed(
+            modified_fixture(
+                stop_times=(
+                    "departure_time\r\n1,126-1,1,06:27:00,06:27:00",
+                    "departure_time,pickup_type,drop_off_type\r\n1,126-1,1,,,0,1",
+                )
+            )
+        )
+        self.assertEqual(report.errors[0].message, "departure_time '' is not a H:MM:SS time")
+
+    def test_missing_tables_and_columns(self) -> None:
+        report = validate_feed(
+            modified_fixture(stops=("stop_lat", "latitude"), trips=("trip_id", "id"))
+        )
+        self.assertFalse(report.ok)
+        messages = [(issue.table, issue.message) for issue in report.errors]
+        self.assertIn(("stops.txt", "required column 'stop_lat' is missing"), messages)
+        self.assertIn(("trips.txt", "required column 'trip_id' is missing"), messages)
+
+        with self.assertRaises(BadZipFile):
+            validate_feed(BytesIO(b"abcd"))
+
+    def test_issue_limit(self) -> None:
+        report = validate_feed(modified_fixture(stop_times=(":", ";")))
+        self.assertEqual(len(report.issues), MAX_ISSUES_PER_TABLE)
+        self.assertGreater(report.issue_counts["stop_times.txt"], MAX_ISSUES_PER_TABLE)
+        self.assertIn("more issue(s) in stop_times.txt", report.summary())
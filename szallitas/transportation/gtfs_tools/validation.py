@@ -0,0 +1,402 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from io import TextIOWrapper
+from pathlib import Path
+from typing import IO, Any, Callable, Final, Iterable
+
+from .feed import Feed, open_feed
+from .parsing import read_columns
+
+# NOTE: This module must not depend on Django models, so that feeds can be validated
+#       before anything is written into the database.
+
+MAX_ISSUES_PER_TABLE: Final[int] = 50
+# Only that many issues are listed for every table - the rest is only counted.
+
+TIME_PATTERN: Final = re.compile(r"\d{1,3}:[0-5]\d:[0-5]\d")
+
+REQUIRED_TABLES: Final = ("agency.txt", "routes.txt", "stops.txt", "trips.txt", "stop_times.txt")
+
+DEFINED_IN: Final[dict[str, str]] = {
+    "agency": "agency.txt",
+    "routes": "routes.txt",
+    "stops": "stops.txt",
+    "services": "calendar.txt or calendar_dates.txt",
+    "trips": "trips.txt",
+}
+
+
+class InvalidFeed(Exception):
+    """InvalidFeed is raised for feeds with errors, with the summary of their validation"""
+
+
+@dataclass
+class Issue:
+    severity: str  # "error" or "warning"
+    table: str
+    row: int | None  # 1-based number of the data row, not counting the header
+    message: str
+
+    def __str__(self) -> str:
+        location = f"{self.table}:{self.row}" if self.row is not None else self.table
+        return f"{self.severity.upper()} {location}: {self.message}"
+
+
+@dataclass
+class TableScan:
+    """TableScan holds the outcome of checking a single table: IDs defined by the table,
+    first rows referencing IDs from other tables, and issues found in the table"""
+
+    table: str
+    rows: int = 0
+    ids: set[str] = field(default_factory=set[str])
+    # (defined by, column) -> referenced ID -> first row referencing it
+    references: dict[tuple[str, str], dict[str, int]] = field(
+        default_factory=dict[tuple[str, str], dict[str, int]]
+    )
+    # Trips which have stop times (only for stop_times.txt)
+    trips_with_stop_times: set[str] = field(default_factory=set[str])
+    issues: list[Issue] = field(default_factory=list[Issue])
+    issue_count: int = 0
+
+    def issue(self, row: int | None, message: str, severity: str = "error") -> None:
+        self.issue_count += 1
+        if len(self.issues) < MAX_ISSUES_PER_TABLE:
+            self.issues.append(Issue(severity, self.table, row, message))
+
+    def define(self, row: int, column: str, value: str) -> None:
+        if not value:
+            self.issue(row, f"{column} is empty")
+        elif value in self.ids:
+            self.issue(row, f"duplicate {column} {value!r}")
+        else:
+            self.ids.add(value)
+
+    def reference(self, row: int, target: str, column: str, value: str) -> None:
+        self.references.setdefault((target, column), {}).setdefault(value, row)
+
+    def check_int(self, row: int, column: str, value: str, allowed: Iterable[int] = ()) -> None:
+        try:
+            number = int(value)
+        except ValueError:
+            self.issue(row, f"{column} {value!r} is not an integer")
+            return
+        allowed = tuple(allowed)
+        if allowed and number not in allowed:
+            self.issue(row, f"{column} {value!r} is not one of {', '.join(map(str, allowed))}")
+
+    def check_decimal(self, row: int, column: str, value: str) -> None:
+        try:
+            Decimal(value)
+        except InvalidOperation:
+            self.issue(row, f"{column} {value!r} is not a number")
+
+    def check_date(self, row: int, column: str, value: str) -> None:
+        try:
+            datetime.strptime(value, "%Y%m%d")
+        except ValueError:
+            self.issue(row, f"{column} {value!r} is not a YYYYMMDD date")
+
+    def check_time(self, row: int, column: str, value: str) -> bool:
+        if TIME_PATTERN.fullmatch(value.strip()) is None:
+            self.issue(row, f"{column} {value!r} is not a H:MM:SS time")
+            return False
+        return True
+
+
+@dataclass
+class ValidationReport:
+    """ValidationReport lists issues found in a feed. The feed can be imported
+    if there are no errors - warnings are informational."""
+
+    rows: dict[str, int] = field(default_factory=dict[str, int])
+    issues: list[Issue] = field(default_factory=list[Issue])
+    # Number of issues in every table, including issues which weren't listed
+    issue_counts: dict[str, int] = field(default_factory=dict[str, int])
+
+    @property
+    def errors(self) -> list[Issue]:
+        return [issue for issue in self.issues if issue.severity == "error"]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def add(self, issue: Issue) -> None:
+        self.issues.append(issue)
+        self.issue_counts[issue.table] = self.issue_counts.get(issue.table, 0) + 1
+
+    def add_scan(self, scan: TableScan) -> None:
+        self.rows[scan.table] = scan.rows
+        self.issues.extend(scan.issues)
+        self.issue_counts[scan.table] = self.issue_counts.get(scan.table, 0) + scan.issue_count
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self) | {"ok": self.ok}
+
+    def summary(self) -> str:
+        """summary formats the report as text, one issue per line"""
+        errors = len(self.errors)
+        lines = [
+            f"Feed is {'valid' if self.ok else 'invalid'}: {errors} error(s), "
+            f"{len(self.issues) - errors} warning(s)"
+        ]
+        lines.extend(str(issue) for issue in self.issues)
+        listed = {table: 0 for table in self.issue_counts}
+        for issue in self.issues:
+            listed[issue.table] += 1
+        for table, count in self.issue_counts.items():
+            if count > listed[table]:
+                lines.append(f"... and {count - listed[table]} more issue(s) in {table}")
+        return "\n".join(lines)
+
+
+def scan_agency(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    for row, (agency_id, name, url, timezone) in enumerate(rows, 1):
+        scan.rows += 1
+        scan.define(row, "agency_id", agency_id)
+        if not name:
+            scan.issue(row, "agency_name is empty")
+        if not url:
+            scan.issue(row, "agency_url is empty")
+        if not timezone:
+            scan.issue(row, "agency_timezone is empty")
+
+
+def scan_routes(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    for row, (route_id, _, _, route_type, agency_id) in enumerate(rows, 1):
+        scan.rows += 1
+        scan.define(row, "route_id", route_id)
+        scan.reference(row, "agency", "agency_id", agency_id)
+        scan.check_int(row, "route_type", route_type)
+
+
+def scan_stops(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    for row, (stop_id, name, lat, lon, wheelchair) in enumerate(rows, 1):
+        scan.rows += 1
+        scan.define(row, "stop_id", stop_id)
+        if not name:
+            scan.issue(row, "stop_name is empty")
+        scan.check_decimal(row, "stop_lat", lat)
+        scan.check_decimal(row, "stop_lon", lon)
+        if wheelchair:
+            scan.check_int(row, "wheelchair_boarding", wheelchair, (0, 1, 2))
+
+
+def scan_calendar(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    for row, (service_id, start_date, end_date, *days) in enumerate(rows, 1):
+        scan.rows += 1
+        scan.define(row, "service_id", service_id)
+        scan.check_date(row, "start_date", start_date)
+        scan.check_date(row, "end_date", end_date)
+        for day in days:
+            if day not in ("0", "1"):
+                scan.issue(row, f"day of week {day!r} is not 0 or 1")
+
+
+def scan_calendar_dates(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    for row, (service_id, date, exception_type) in enumerate(rows, 1):
+        scan.rows += 1
+        # Services without calendar.txt entries can be defined by calendar_dates.txt alone
+        if not service_id:
+            scan.issue(row, "service_id is empty")
+        scan.ids.add(service_id)
+        scan.check_date(row, "date", date)
+        scan.check_int(row, "exception_type", exception_type, (1, 2))
+
+
+def scan_trips(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    for row, (trip_id, route_id, service_id, direction, wheelchair) in enumerate(rows, 1):
+        scan.rows += 1
+        scan.define(row, "trip_id", trip_id)
+        scan.reference(row, "routes", "route_id", route_id)
+        scan.reference(row, "services", "service_id", service_id)
+        if direction:
+            scan.check_int(row, "direction_id", direction, (0, 1))
+        if wheelchair:
+            scan.check_int(row, "wheelchair_accessible", wheelchair, (0, 1, 2))
+
+
+def scan_stop_times(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    """scan_stop_times checks stop times with bounded memory: stop_sequence and departure_time
+    are only compared between consecutive rows of the same trip."""
+    last_trip_id, last_sequence, last_departure = "", -1, -1
+    for row, (trip_id, stop_id, stop_sequence, departure, pickup, drop_off) in enumerate(rows, 1):
+        scan.rows += 1
+        # Stop times without any passenger exchange are skipped by the importer
+        if pickup == "1" and drop_off == "1":
+            continue
+        scan.reference(row, "trips", "trip_id", trip_id)
+        scan.reference(row, "stops", "stop_id", stop_id)
+        scan.trips_with_stop_times.add(trip_id)
+
+        try:
+            sequence = int(stop_sequence)
+        except ValueError:
+            scan.issue(row, f"stop_sequence {stop_sequence!r} is not an integer")
+            continue
+        # NOTE: Empty times are allowed by GTFS for stops which aren't timepoints,
+        #       but the importer requires departure times of all stops.
+        if not scan.check_time(row, "departure_time", departure):
+            continue
+        hours, minutes, seconds = departure.split(":")
+        departure_seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+        if trip_id == last_trip_id:
+            if sequence == last_sequence:
+                scan.issue(row, f"duplicate stop_sequence {sequence} of trip {trip_id!r}")
+            elif sequence < last_sequence:
+                scan.issue(
+                    row,
+                    f"stop_sequence of trip {trip_id!r} decreases - stop times aren't sorted",
+                    "warning",
+                )
+            elif departure_seconds < last_departure:
+                scan.issue(row, f"departure_time of trip {trip_id!r} decreases")
+        last_trip_id, last_sequence, last_departure = trip_id, sequence, departure_seconds
+
+
+def scan_frequencies(rows: Iterable[tuple[str, ...]], scan: TableScan) -> None:
+    for row, (trip_id, start_time, end_time, headway, exact_times) in enumerate(rows, 1):
+        scan.rows += 1
+        scan.reference(row, "trips", "trip_id", trip_id)
+        scan.check_time(row, "start_time", start_time)
+        scan.check_time(row, "end_time", end_time)
+        scan.check_int(row, "headway_secs", headway)
+        if exact_times:
+            scan.check_int(row, "exact_times", exact_times, (0, 1))
+
+
+TableScanner = Callable[[Iterable[tuple[str, ...]], TableScan], None]
+
+TABLES: Final[dict[str, tuple[tuple[str, ...], tuple[str, ...], TableScanner]]] = {
+    # Same columns as required (and optionally used) by GTFSLoader
+    "agency.txt": (
+        ("agency_id", "agency_name", "agency_url", "agency_timezone"),
+        (),
+        scan_agency,
+    ),
+    "routes.txt": (
+        ("route_id", "route_short_name", "route_long_name", "route_type", "agency_id"),
+        (),
+        scan_routes,
+    ),
+    "stops.txt": (
+        ("stop_id", "stop_name", "stop_lat", "stop_lon"),
+        ("wheelchair_boarding",),
+        scan_stops,
+    ),
+    "calendar.txt": (
+        (
+            "service_id",
+            "start_date",
+            "end_date",
+            "monday",
+            "tuesday",
+            "wednesday",
+            "thursday",
+            "friday",
+            "saturday",
+            "sunday",
+        ),
+        (),
+        scan_calendar,
+    ),
+    "calendar_dates.txt": (("service_id", "date", "exception_type"), (), scan_calendar_dates),
+    "trips.txt": (
+        ("trip_id", "route_id", "service_id"),
+        ("direction_id", "wheelchair_accessible"),
+        scan_trips,
+    ),
+    "stop_times.txt": (
+        ("trip_id", "stop_id", "stop_sequence", "departure_time"),
+        ("pickup_type", "drop_off_type"),
+        scan_stop_times,
+    ),
+    "frequencies.txt": (
+        ("trip_id", "start_time", "end_time", "headway_secs"),
+        ("exact_times",),
+        scan_frequencies,
+    ),
+}
+
+DEFINES: Final[dict[str, str]] = {
+    "agency.txt": "agency",
+    "routes.txt": "routes",
+    "stops.txt": "stops",
+    "calendar.txt": "services",
+    "calendar_dates.txt": "services",
+    "trips.txt": "trips",
+}
+
+
+def scan_table(zip: Feed, table: str) -> TableScan:
+    """scan_table checks a single table of an opened feed"""
+    required, optional, scanner = TABLES[table]
+    scan = TableScan(table)
+    with zip.open(table, "r") as stream:
+        fh = TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        try:
+            scanner(read_columns(fh, required, optional), scan)
+        except KeyError as e:
+            scan.issue(None, f"required column {e.args[0]!r} is missing")
+        except UnicodeDecodeError:
+            scan.issue(None, "table is not encoded in UTF-8")
+    return scan
+
+
+def validate_feed(zip_path: str | Path | IO[bytes], workers: int = 4) -> ValidationReport:
+    """validate_feed checks a GTFS feed before it's imported: that all tables required
+    by the importer are present, that values have correct formats, that all referenced
+    IDs are defined, and that stop times of every trip are ordered.
+
+    Tables are checked in parallel threads, each streaming through its table.
+    The feed can also be a directory with unpacked tables.
+    Raises BadZipFile if the file is not a zip archive.
+    """
+    report = ValidationReport()
+    with open_feed(zip_path) as zip:
+        names = set(zip.namelist())
+        for table in REQUIRED_TABLES:
+            if table not in names:
+                report.add(Issue("error", table, None, "required table is missing"))
+        if "calendar.txt" not in names and "calendar_dates.txt" not in names:
+            report.add(
+                Issue(
+                    "error", "calendar.txt", None, "calendar.txt or calendar_dates.txt is required"
+                )
+            )
+
+        tables = [table for table in TABLES if table in names]
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            # NOTE: Both feed types support reading multiple members from multiple threads
+            scans = list(pool.map(partial(scan_table, zip), tables))
+
+    defined: dict[str, set[str]] = {}
+    for scan in scans:
+        if target := DEFINES.get(scan.table):
+            defined.setdefault(target, set()).update(scan.ids)
+
+    for scan in scans:
+        for (target, column), references in scan.references.items():
+            # If the defining table is missing, that's already reported
+            if target in defined:
+                for value, row in references.items():
+                    if value not in defined[target]:
+                        scan.issue(
+                            row, f"{column} {value!r} is not defined in {DEFINED_IN[target]}"
+                        )
+
+    by_table = {scan.table: scan for scan in scans}
+    if "trips.txt" in by_table and "stop_times.txt" in by_table:
+        trips = by_table["trips.txt"]
+        for trip_id in sorted(trips.ids - by_table["stop_times.txt"].trips_with_stop_times):
+            trips.issue(None, f"trip {trip_id!r} has no stop times")
+
+    for scan in scans:
+        report.add_scan(scan)
+    return report
@@ -0,0 +1,201 @@
+import threading
+import time
+import traceback
+from time import sleep
+from typing import Final
+from zipfile import BadZipFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, connections, transaction
+from django.db.models import Exists
+from django.utils import timezone
+
+from .export_artifacts import start_export
+from .gtfs_tools.gtfs_import import CalendarFileNotFound, GTFSLoader
+from .gtfs_tools.profiling import ImportProfiler
+from .gtfs_tools.progress import ImportProgress
+from .gtfs_tools.validation import InvalidFeed, validate_feed
+from .models import DataVersion, ImportJob
+
+POLL_INTERVAL: Final[float] = 2.0
+# How long the worker waits before re-trying to claim a job,
+# if a job is already running in another process.
+
+HEARTBEAT_INTERVAL: Final[float] = 30.0
+# How often a running job signals that its worker is alive.
+
+STALE_TIMEOUT: Final[float] = 600.0
+# How long a running job may go without a heartbeat, before it's considered abandoned
+# (e.g. because its worker was killed) and marked as failed.
+
+CLAIM_LOCK_ID: Final[int] = 0x6774667300
+# Key of the PostgreSQL advisory lock held while claiming jobs.
+
+_worker_lock = threading.Lock()
+_worker: threading.Thread | None = None
+
+
+def enqueue_import(zip_file: UploadedFile, incremental: bool = False) -> ImportJob:
+    """enqueue_import saves an uploaded GTFS zip and creates a queued ImportJob for it"""
+    job = ImportJob(incremental=incremental)
+    job.file.save(zip_file.name or "gtfs.zip", zip_file, save=False)
+    job.save()
+    return job
+
+
+def start_worker() -> threading.Thread:
+    """start_worker ensures a background thread processing queued imports
+    is running in this process, and returns that thread"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="gtfs-import-worker", daemon=True)
+            _worker.start()
+        return _worker
+
+
+def claim_job(job: ImportJob) -> bool:
+    """claim_job atomically marks a queued job as running - but only if
+    no other job is running. Returns False if the job couldn't be claimed."""
+    with transaction.atomic():
+        lock_claims()
+        claimed = (
+            ImportJob.objects.filter(pk=job.pk, status=ImportJob.Status.QUEUED)
+            .exclude(Exists(ImportJob.objects.filter(status=ImportJob.Status.RUNNING)))
+            .update(status=ImportJob.Status.RUNNING, started_at=timezone.now())
+        )
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def claim_next_job() -> ImportJob | None:
+    """claim_next_job claims the oldest queued job, after failing abandoned running jobs"""
+    fail_stale_jobs()
+    job = ImportJob.objects.filter(status=ImportJob.Status.QUEUED).order_by("created_at").first()
+    if job and claim_job(job):
+        return job
+    return None
+
+
+def lock_claims() -> None:
+    """lock_claims serializes claims of jobs until the end of the current transaction.
+
+    NOTE: On PostgreSQL (under READ COMMITTED), concurrent claims of two different jobs
+          could both see that no job is running. SQLite serializes all writes anyway.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CLAIM_LOCK_ID])
+
+
+def is_stale(job: ImportJob) -> bool:
+    """is_stale checks if a running job hasn't signalled that it's alive for too long"""
+    try:
+        last_heartbeat = job.progress_path.stat().st_mtime
+    except (FileNotFoundError, ValueError):
+        last_heartbeat = job.started_at.timestamp() if job.started_at else 0.0
+    return time.time() - last_heartbeat > STALE_TIMEOUT
+
+
+def fail_stale_jobs() -> None:
+    """fail_stale_jobs marks running jobs abandoned by their workers (e.g. killed processes)
+    as failed, so that they don't block other jobs forever.
+
+    NOTE: The jobs aren't re-queued - an import which crashed its worker
+          would most likely crash it again.
+    """
+    for job in ImportJob.objects.filter(status=ImportJob.Status.RUNNING):
+        if not is_stale(job):
+            continue
+        failed = ImportJob.objects.filter(pk=job.pk, status=ImportJob.Status.RUNNING).update(
+            status=ImportJob.Status.FAILED,
+            error="The import was interrupted, as its worker stopped responding.",
+            progress=job.current_progress(),
+            finished_at=timezone.now(),
+        )
+        if failed:
+            job.refresh_from_db()
+            job.progress_path.unlink(missing_ok=True)
+            job.file.delete(save=True)
+
+
+def run_job(job: ImportJob) -> None:
+    """run_job validates the feed of a claimed (running) job and imports it,
+    and saves its outcome and final progress counters.
+    Feeds with errors are rejected before anything is written."""
+    profiler = ImportProfiler()
+    progress = ImportProgress(on_update=job.write_progress, profiler=profiler)
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat, args=(job, stop_heartbeat), name="gtfs-import-heartbeat", daemon=True
+    )
+    heartbeat.start()
+    try:
+        progress.start_stage("validating")
+        report = validate_feed(job.file.path)
+        if not report.ok:
+            raise InvalidFeed(report.summary())
+
+        GTFSLoader(
+            incremental=job.incremental,
+            replace=not job.incremental,
+            fast_load=not job.incremental,
+            progress=progress,
+        ).from_zip(job.file.path)
+    except BadZipFile:
+        job.status, job.error = ImportJob.Status.FAILED, "Bad file was uploaded."
+    except InvalidFeed as e:
+        job.status, job.error = ImportJob.Status.FAILED, str(e)
+    except CalendarFileNotFound:
+        job.status, job.error = ImportJob.Status.FAILED, "Calendar file was not found."
+    except Exception:
+        job.status = ImportJob.Status.FAILED
+        job.error = f"Exception occurred:{traceback.format_exc()}"
+    else:
+        job.status = ImportJob.Status.SUCCEEDED
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+    job.progress = progress.as_dict()
+    job.metrics = profiler.as_dict()
+    job.finished_at = timezone.now()
+    job.save()
+
+    # The uploaded feed is no longer needed
+    job.progress_path.unlink(missing_ok=True)
+    job.file.delete(save=True)
+
+    # The imported data is exported before anyone asks for it
+    if job.status == ImportJob.Status.SUCCEEDED and getattr(
+        settings, "GTFS_EXPORT_AFTER_IMPORT", False
+    ):
+        transaction.on_commit(lambda: start_export(DataVersion.current().key))
+
+
+def _heartbeat(job: ImportJob, stop: threading.Event) -> None:
+    # NOTE: The heartbeat is the modification time of the progress file,
+    #       as the import holds a database transaction open until it's finished.
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        job.progress_path.touch()
+
+
+def _work() -> None:
+    global _worker
+    try:
+        while True:
+            if job := claim_next_job():
+                run_job(job)
+                continue
+
+            with _worker_lock:
+                if not ImportJob.objects.filter(status=ImportJob.Status.QUEUED).exists():
+                    _worker = None
+                    return
+
+            # A job from another process is running - wait for it to finish
+            sleep(POLL_INTERVAL)
+    finally:
+        connections.close_all()
@@ -10,7 +10,13 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser: CommandParser) -> None:
         parser.add_argument("path", type=str, help="Path to the output ZIP file")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker threads exporting tables in parallel",
+        )
 
     def handle(self, *args: Any, **options: Any) -> Optional[str]:
         with open(options["path"], mode="wb") as f:
-            gtfs_export.export_all(f)
+            gtfs_export.export_all(f, workers=options["workers"])
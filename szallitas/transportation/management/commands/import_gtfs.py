@@ -1,12 +1,22 @@
+import cProfile
+from datetime import date, timedelta
+from pathlib import Path
 from typing import Any, Optional
+from zipfile import BadZipFile
 
-from django.core.management.base import BaseCommand, CommandParser
+from django.core.management.base import BaseCommand, CommandError, CommandParser
 
-from ...gtfs_tools.gtfs_import import GTFSLoader, clear_tables
+from ...gtfs_tools.gtfs_import import GTFSLoader, import_feeds
+from ...gtfs_tools.profiling import ImportProfiler
+from ...gtfs_tools.progress import ImportProgress
+from ...gtfs_tools.validation import validate_feed
 
 
 class Command(BaseCommand):
-    help = "Import data from GTFS zip file. By default it cleans database from previous data."
+    help = (
+        "Import data from GTFS zip file or directory. By default it replaces previous data "
+        "in a single transaction."
+    )
 
     def add_arguments(self, parser: CommandParser) -> None:
         parser.add_argument(
@@ -14,15 +24,183 @@ class Command(BaseCommand):
             action="store_true",
             help="Do not clean database before inserting new data, may result some errors",
         )
-        parser.add_argument("path", type=str, help="Path to zip archive with GTFS files")
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Only write the differences between the feed and the stored data, "
+                "keeping IDs of unchanged objects. Implies --no-clean."
+            ),
+        )
+        parser.add_argument(
+            "--stop-times-buffer",
+            type=int,
+            metavar="ROWS",
+            help=(
+                "Stream trips.txt and stop_times.txt through an on-disk sort, keeping at most "
+                "ROWS trips and stop times in memory. By default both tables are loaded "
+                "into memory."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            metavar="N",
+            help="Parse trips.txt and stop_times.txt in N worker processes",
+        )
+        parser.add_argument(
+            "--fast",
+            action="store_true",
+            help=(
+                "On SQLite, drop indexes of the largest tables for the duration of the import "
+                "and re-create them at its end"
+            ),
+        )
+        parser.add_argument(
+            "--resumable",
+            action="store_true",
+            help=(
+                "Commit the import in stages, and continue an interrupted import of the same "
+                "feed from the last committed stage. Imported data replaces previous data "
+                "of the feed's namespace once the whole feed is loaded. Multiple feeds are "
+                "imported one after another."
+            ),
+        )
+        parser.add_argument(
+            "--horizon",
+            type=int,
+            metavar="DAYS",
+            help=(
+                "Only import services operating within DAYS days from --horizon-start "
+                "(calendars, calendar exceptions and trips outside of that window are skipped)"
+            ),
+        )
+        parser.add_argument(
+            "--horizon-start",
+            type=date.fromisoformat,
+            metavar="YYYY-MM-DD",
+            help="First day of the --horizon window (defaults to today)",
+        )
+        parser.add_argument(
+            "--skip-validation",
+            action="store_true",
+            help="Do not check the feeds for errors before importing them",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help=(
+                "Print wall time, rows/s, SQL queries and peak memory usage "
+                "of every import stage"
+            ),
+        )
+        parser.add_argument(
+            "--cprofile",
+            metavar="PATH",
+            help=(
+                "Run the import under cProfile and dump its stats to PATH "
+                "(worker processes are not profiled)"
+            ),
+        )
+        parser.add_argument(
+            "path",
+            type=str,
+            nargs="+",
+            help=(
+                "Path to zip archive with GTFS files, or to a directory with unpacked GTFS files. "
+                "Multiple feeds can be imported at once, "
+                "with their source IDs namespaced by NAME (given as NAME=PATH, "
+                "defaults to the file name without extension)."
+            ),
+        )
 
     def handle(self, *args: Any, **options: Any) -> Optional[str]:
-        if not options["no_clean"]:
-            clear_tables()
-        else:
+        if options["resumable"] and (
+            options["incremental"] or options["no_clean"] or options["fast"]
+        ):
+            raise CommandError(
+                "--resumable can't be combined with --incremental, --no-clean or --fast"
+            )
+        if options["stop_times_buffer"] is not None and options["stop_times_buffer"] < 1:
+            raise CommandError("--stop-times-buffer must be at least 1 row")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        if options["incremental"]:
+            self.stdout.write("Performing an incremental import")
+        elif options["no_clean"]:
             self.stdout.write("Skipped database cleaning. It may cause errors!")
 
+        profiler = ImportProfiler() if options["profile"] else None
+
+        feeds = parse_feeds(options["path"])
+        if not options["skip_validation"]:
+            self.validate_feeds(feeds)
+
         self.stdout.write("Loading data")
-        GTFSLoader().from_zip(options["path"])
+        import_options: dict[str, Any] = {
+            "stop_times_buffer": options["stop_times_buffer"],
+            "workers": options["workers"],
+            "incremental": options["incremental"],
+            "replace": not options["incremental"] and not options["no_clean"],
+            "progress": ImportProgress(profiler=profiler),
+            "fast_load": options["fast"],
+        }
+        if options["horizon"] is not None:
+            if options["horizon"] < 1:
+                raise CommandError("--horizon must be at least 1 day")
+            start = options["horizon_start"] or date.today()
+            import_options["horizon"] = (start, start + timedelta(days=options["horizon"] - 1))
+
+        if options["cprofile"]:
+            with cProfile.Profile() as cprofiler:
+                self.import_feeds(feeds, options["resumable"], import_options)
+            cprofiler.dump_stats(options["cprofile"])
+        else:
+            self.import_feeds(feeds, options["resumable"], import_options)
 
         self.stdout.write("Data loaded successfully")
+        if profiler:
+            self.stdout.write(profiler.report())
+
+    def validate_feeds(self, feeds: dict[str, str]) -> None:
+        """validate_feeds rejects feeds with errors, before anything is written"""
+        for namespace, path in feeds.items():
+            self.stdout.write(f"Validating {path}")
+            try:
+                report = validate_feed(path)
+            except BadZipFile:
+                raise CommandError(f"{path} is not a zip file")
+            if not report.ok:
+                raise CommandError(f"{namespace or path}: {report.summary()}")
+            if report.issues:
+                self.stdout.write(report.summary())
+
+    def import_feeds(
+        self, feeds: dict[str, str], resumable: bool, import_options: dict[str, Any]
+    ) -> None:
+        if not resumable:
+            import_feeds(feeds, **import_options)
+            return
+
+        # Every feed is committed (and published) separately
+        del import_options["replace"]
+        for namespace, path in feeds.items():
+            GTFSLoader(namespace=namespace, resumable=True, **import_options).from_zip(path)
+
+
+def parse_feeds(paths: list[str]) -> dict[str, str]:
+    """parse_feeds maps namespaces to paths of feeds to import.
+    A single feed without an explicit namespace is not namespaced."""
+    if len(paths) == 1 and "=" not in paths[0]:
+        return {"": paths[0]}
+
+    feeds: dict[str, str] = {}
+    for path in paths:
+        namespace, _, feed_path = path.rpartition("=")
+        namespace = namespace or Path(feed_path).stem
+        if namespace in feeds:
+            raise CommandError(f"Duplicate feed namespace: {namespace}")
+        feeds[namespace] = feed_path
+    return feeds
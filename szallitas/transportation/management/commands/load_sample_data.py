@@ -1,19 +1,24 @@
 import json
-from datetime import date, timedelta
+from datetime import date
 from pathlib import Path
 from typing import Any, Optional
 
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Model
 
 from ...gtfs_tools.gtfs_import import clear_tables
 from ...models import (
     Agency,
     Calendar,
     CalendarException,
+    DataVersion,
     Line,
     Pattern,
     PatternStop,
     Stop,
+    TravelTimeProfile,
     Trip,
     WheelchairAccessibility,
 )
@@ -44,7 +49,7 @@ FIXTURE_STOPS = {
         id=3,
         name="Warszawa Zachodnia WKD",
         lat=52.2194428,
-        lon=20.9655565,
+        lon=20.965556,
         wheelchair_accessible=2,
     ),
     "wreor": Stop(
@@ -78,7 +83,7 @@ FIXTURE_STOPS = {
     "opacz": Stop(
         id=8,
         name="Opacz",
-        lat=52.1813825,
+        lat=52.181382,
         lon=20.9046328,
         wheelchair_accessible=1,
     ),
@@ -204,7 +209,7 @@ FIXTURE_STOPS = {
     "gmpia": Stop(
         id=26,
         name="Grodzisk Mazowiecki Piaskowa",
-        lat=52.1025545,
+        lat=52.102554,
         lon=20.6515664,
         wheelchair_accessible=1,
     ),
@@ -301,6 +306,7 @@ FIXTURE_CALENDAR_EXCEPTIONS = [
 
 FIXTURE_PATTERNS: list[Pattern] = []
 FIXTURE_PATTERN_STOPS: list[PatternStop] = []
+FIXTURE_PROFILES: list[TravelTimeProfile] = []
 FIXTURE_TRIPS: list[Trip] = []
 
 
@@ -312,28 +318,45 @@ def load_schedule_fixture() -> None:
     with FIXTURE_SCHEDULES_FILE.open() as f:
         data = json.load(f)
 
-    for json_pattern in data["patterns"]:
-        pattern = Pattern(
-            headsign=json_pattern["headsign"],
-            direction=json_pattern["direction"],
-            line=FIXTURE_LINES[json_pattern["line"]],
-        )
-        FIXTURE_PATTERNS.append(pattern)
+    # Patterns of the fixture which only differ by travel times share a single Pattern
+    patterns: dict[tuple[str, int, str, tuple[str, ...]], Pattern] = {}
 
-        for idx, json_stop in enumerate(json_pattern["stops"]):
-            pattern_stop = PatternStop(
-                pattern=pattern,
-                stop=FIXTURE_STOPS[json_stop["stop"]],
-                travel_time=timedelta(seconds=json_stop["travel_time"]),
-                index=idx,
+    for json_pattern in data["patterns"]:
+        stops = tuple(json_stop["stop"] for json_stop in json_pattern["stops"])
+        key = (json_pattern["headsign"], json_pattern["direction"], json_pattern["line"], stops)
+        pattern = patterns.get(key)
+        if pattern is None:
+            pattern = Pattern(
+                id=len(FIXTURE_PATTERNS) + 1,
+                headsign=json_pattern["headsign"],
+                direction=json_pattern["direction"],
+                line=FIXTURE_LINES[json_pattern["line"]],
             )
-            FIXTURE_PATTERN_STOPS.append(pattern_stop)
+            patterns[key] = pattern
+            FIXTURE_PATTERNS.append(pattern)
+
+            for idx, stop in enumerate(stops):
+                pattern_stop = PatternStop(
+                    id=len(FIXTURE_PATTERN_STOPS) + 1,
+                    pattern=pattern,
+                    stop=FIXTURE_STOPS[stop],
+                    index=idx,
+                )
+                FIXTURE_PATTERN_STOPS.append(pattern_stop)
+
+        profile = TravelTimeProfile(
+            id=len(FIXTURE_PROFILES) + 1,
+            pattern=pattern,
+            travel_times=[json_stop["travel_time"] for json_stop in json_pattern["stops"]],
+        )
+        FIXTURE_PROFILES.append(profile)
 
         for json_trip in json_pattern["trips"]:
             trip = Trip(
+                id=len(FIXTURE_TRIPS) + 1,
                 wheelchair_accessible=WheelchairAccessibility.ACCESSIBLE,
-                departure=timedelta(seconds=json_trip["departure"]),
-                pattern=pattern,
+                departure=json_trip["departure"],
+                profile=profile,
                 calendar=FIXTURE_CALENDARS[json_trip["calendar"]],
             )
             FIXTURE_TRIPS.append(trip)
@@ -341,6 +364,18 @@ def load_schedule_fixture() -> None:
 
 load_schedule_fixture()
 
+FIXTURE_MODELS: list[type[Model]] = [
+    Agency,
+    Stop,
+    Line,
+    Calendar,
+    CalendarException,
+    Pattern,
+    PatternStop,
+    TravelTimeProfile,
+    Trip,
+]
+
 
 def load_wkd_fixture_database() -> None:
     clear_tables()
@@ -358,9 +393,17 @@ def load_wkd_fixture_database() -> None:
         pattern.save()
     for pattern_stop in FIXTURE_PATTERN_STOPS:
         pattern_stop.save()
+    for profile in FIXTURE_PROFILES:
+        profile.save()
     for trip in FIXTURE_TRIPS:
         trip.save()
 
+    # Objects of the fixture have explicit IDs, which sequences (if any) must skip
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), FIXTURE_MODELS):
+            cursor.execute(sql)
+    DataVersion.bump()
+
 
 class Command(BaseCommand):
     def handle(self, *args: Any, **options: Any) -> Optional[str]:
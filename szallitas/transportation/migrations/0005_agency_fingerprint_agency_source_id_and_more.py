@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "transportation",
+            "0004_calendarexception_only_one_calendarexception_for_a_calendar_on_a_given_day",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agency",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="agency",
+            name="source_id",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="calendar",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="calendar",
+            name="source_id",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="line",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="line",
+            name="source_id",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="pattern",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="stop",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="stop",
+            name="source_id",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="fingerprint",
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="source_id",
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transportation", "0006_import_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="metrics",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
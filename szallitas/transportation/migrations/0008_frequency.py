@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transportation", "0007_import_job_metrics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Frequency",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("start_time", models.DurationField()),
+                ("end_time", models.DurationField()),
+                ("headway", models.DurationField()),
+                ("exact_times", models.BooleanField(default=False)),
+                (
+                    "wheelchair_accessible",
+                    models.IntegerField(
+                        choices=[(0, "No Info"), (1, "Accessible"), (2, "Not Accessible")]
+                    ),
+                ),
+                (
+                    "source_id",
+                    models.CharField(blank=True, editable=False, max_length=255, null=True),
+                ),
+                (
+                    "fingerprint",
+                    models.CharField(blank=True, editable=False, max_length=32, null=True),
+                ),
+                (
+                    "calendar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="transportation.calendar"
+                    ),
+                ),
+                (
+                    "pattern",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="transportation.pattern"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Frequencies",
+                "default_related_name": "frequency_set",
+            },
+        ),
+    ]
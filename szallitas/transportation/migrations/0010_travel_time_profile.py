@@ -0,0 +1,189 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:02
+
+from datetime import timedelta
+
+import django.db.models.deletion
+import django.db.models.manager
+import transportation.models.pattern
+from django.db import migrations, models
+
+
+def split_patterns(apps, schema_editor) -> None:
+    """split_patterns moves travel times of patterns into profiles, and merges patterns
+    which only differed by their travel times"""
+    Pattern = apps.get_model("transportation", "Pattern")
+    PatternStop = apps.get_model("transportation", "PatternStop")
+    TravelTimeProfile = apps.get_model("transportation", "TravelTimeProfile")
+    Trip = apps.get_model("transportation", "Trip")
+    Frequency = apps.get_model("transportation", "Frequency")
+
+    pattern_ids: dict[tuple, int] = {}
+    profile_ids: dict[tuple[int, tuple[int, ...]], int] = {}
+    for pattern in Pattern._default_manager.order_by("id"):
+        stops = list(
+            PatternStop._default_manager.filter(pattern_id=pattern.id)
+            .order_by("index")
+            .values_list("stop_id", "travel_time")
+        )
+        key = (pattern.headsign, pattern.direction, pattern.line_id, tuple(s for s, _ in stops))
+        pattern_id = pattern_ids.setdefault(key, pattern.id)
+        travel_times = tuple(round(t.total_seconds()) for _, t in stops)
+
+        profile_id = profile_ids.get((pattern_id, travel_times))
+        if profile_id is None:
+            profile_id = TravelTimeProfile._default_manager.create(
+                pattern_id=pattern_id, travel_times=list(travel_times)
+            ).id
+            profile_ids[pattern_id, travel_times] = profile_id
+
+        Trip._default_manager.filter(pattern_id=pattern.id).update(
+            profile_id=profile_id, pattern=None
+        )
+        Frequency._default_manager.filter(pattern_id=pattern.id).update(
+            profile_id=profile_id, pattern=None
+        )
+        if pattern_id != pattern.id:
+            pattern.delete()
+
+    # Fingerprints of patterns used to include travel times -
+    # the next incremental import recreates patterns with the new ones
+    Pattern._default_manager.update(fingerprint=None)
+
+
+def join_patterns(apps, schema_editor) -> None:
+    """join_patterns copies travel times of profiles back into patterns,
+    duplicating patterns with more than one profile"""
+    Pattern = apps.get_model("transportation", "Pattern")
+    PatternStop = apps.get_model("transportation", "PatternStop")
+    TravelTimeProfile = apps.get_model("transportation", "TravelTimeProfile")
+    Trip = apps.get_model("transportation", "Trip")
+    Frequency = apps.get_model("transportation", "Frequency")
+
+    used_patterns: set[int] = set()
+    for profile in TravelTimeProfile._default_manager.select_related("pattern").order_by("id"):
+        pattern = profile.pattern
+        stops = list(PatternStop._default_manager.filter(pattern_id=pattern.id).order_by("index"))
+        if pattern.id in used_patterns:
+            pattern.pk = None
+            pattern.save()
+            for stop in stops:
+                stop.pk = None
+                stop.pattern_id = pattern.id
+        used_patterns.add(pattern.id)
+
+        for stop in stops:
+            stop.travel_time = timedelta(seconds=profile.travel_times[stop.index])
+            stop.save()
+        Trip._default_manager.filter(profile_id=profile.id).update(pattern_id=pattern.id)
+        Frequency._default_manager.filter(profile_id=profile.id).update(pattern_id=pattern.id)
+
+    PatternStop._default_manager.filter(travel_time=None).update(travel_time=timedelta(0))
+    Pattern._default_manager.update(fingerprint=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transportation", "0009_import_checkpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TravelTimeProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("travel_times", transportation.models.pattern.SecondsListField()),
+                (
+                    "fingerprint",
+                    models.CharField(blank=True, editable=False, max_length=32, null=True),
+                ),
+                (
+                    "pattern",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="transportation.pattern"
+                    ),
+                ),
+            ],
+            options={
+                "default_related_name": "profile_set",
+            },
+            managers=[
+                ("all_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="profile",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="transportation.traveltimeprofile",
+            ),
+        ),
+        migrations.AddField(
+            model_name="frequency",
+            name="profile",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="transportation.traveltimeprofile",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="trip",
+            name="pattern",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="transportation.pattern",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="frequency",
+            name="pattern",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="transportation.pattern",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="patternstop",
+            name="travel_time",
+            field=models.DurationField(null=True),
+        ),
+        migrations.RunPython(split_patterns, join_patterns),
+        migrations.RemoveField(
+            model_name="trip",
+            name="pattern",
+        ),
+        migrations.RemoveField(
+            model_name="frequency",
+            name="pattern",
+        ),
+        migrations.RemoveField(
+            model_name="patternstop",
+            name="travel_time",
+        ),
+        migrations.AlterField(
+            model_name="trip",
+            name="profile",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to="transportation.traveltimeprofile",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="frequency",
+            name="profile",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to="transportation.traveltimeprofile",
+            ),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:10
+
+from datetime import timedelta
+from typing import Any, Callable, Sequence
+
+from django.db import migrations, models
+from django.db.migrations.operations.base import Operation
+
+# Fields converted from DurationField into IntegerField with seconds
+CONVERTED_FIELDS = {
+    "Trip": ("departure",),
+    "Frequency": ("start_time", "end_time", "headway"),
+}
+
+
+# Number of objects converted (and held in memory) at once
+BATCH_SIZE = 1000
+
+
+def convert_objects(
+    model: Any, read: Sequence[str], write: Sequence[str], convert: Callable[[Any], Any]
+) -> None:
+    """convert_objects sets `write` fields of all objects to converted values of their
+    `read` fields, in batches - so that large tables aren't loaded into memory at once"""
+    objects = model._default_manager
+    batch = []
+    for obj in objects.only("pk", *read).iterator(chunk_size=BATCH_SIZE):
+        for source, target in zip(read, write):
+            setattr(obj, target, convert(getattr(obj, source)))
+        batch.append(obj)
+        if len(batch) == BATCH_SIZE:
+            objects.bulk_update(batch, write)
+            batch = []
+    if batch:
+        objects.bulk_update(batch, write)
+
+
+def durations_to_seconds(apps, schema_editor) -> None:
+    for model_name, fields in CONVERTED_FIELDS.items():
+        convert_objects(
+            apps.get_model("transportation", model_name),
+            fields,
+            [f"{field}_seconds" for field in fields],
+            lambda duration: round(duration.total_seconds()),
+        )
+
+
+def seconds_to_durations(apps, schema_editor) -> None:
+    for model_name, fields in CONVERTED_FIELDS.items():
+        convert_objects(
+            apps.get_model("transportation", model_name),
+            [f"{field}_seconds" for field in fields],
+            fields,
+            lambda seconds: timedelta(seconds=seconds),
+        )
+
+
+def convert_field(model_name: str, name: str, help_text: str) -> list[Operation]:
+    """convert_field returns operations adding an IntegerField next to a DurationField,
+    which is made nullable so that it can be restored when the migration is reversed"""
+    return [
+        migrations.AddField(
+            model_name=model_name,
+            name=f"{name}_seconds",
+            field=models.IntegerField(default=0, help_text=help_text),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name=model_name,
+            name=name,
+            field=models.DurationField(null=True),
+        ),
+    ]
+
+
+def rename_field(model_name: str, name: str) -> list[Operation]:
+    """rename_field returns operations replacing a DurationField with the added IntegerField"""
+    return [
+        migrations.RemoveField(model_name=model_name, name=name),
+        migrations.RenameField(model_name=model_name, old_name=f"{name}_seconds", new_name=name),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transportation", "0010_travel_time_profile"),
+    ]
+
+    operations = [
+        *convert_field("trip", "departure", "Seconds since midnight"),
+        *convert_field("frequency", "start_time", "Seconds since midnight"),
+        *convert_field("frequency", "end_time", "Seconds since midnight"),
+        *convert_field("frequency", "headway", "Seconds"),
+        migrations.RunPython(durations_to_seconds, seconds_to_durations),
+        *rename_field("trip", "departure"),
+        *rename_field("frequency", "start_time"),
+        *rename_field("frequency", "end_time"),
+        *rename_field("frequency", "headway"),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transportation", "0012_data_version"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="patternstop",
+            managers=[],
+        ),
+        migrations.AlterModelManagers(
+            name="traveltimeprofile",
+            managers=[],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import StrIndex, Substr
+
+# Models whose objects are imported from GTFS feeds
+IMPORTED_MODELS = ("Agency", "Calendar", "Frequency", "Line", "Stop", "Trip")
+
+
+def namespaces_from_source_ids(apps, schema_editor) -> None:
+    """Namespaces were only stored as prefixes of source IDs ("{namespace}:", or
+    "~{namespace}:" for objects staged by resumable imports) - every source_id
+    with a ":" is assumed to be namespaced.
+
+    NOTE: Feeds imported without a namespace, whose GTFS IDs contain ":",
+          have to be imported again (not incrementally) after the migration.
+    """
+    separator = StrIndex("source_id", Value(":"))
+    for model_name in IMPORTED_MODELS:
+        objects = apps.get_model("transportation", model_name)._default_manager
+        namespaced = objects.filter(source_id__contains=":")
+        namespaced.exclude(source_id__startswith="~").update(
+            namespace=Substr("source_id", 1, separator - 1)
+        )
+        namespaced.filter(source_id__startswith="~").update(
+            namespace=Substr("source_id", 2, separator - 2)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transportation", "0013_plain_pattern_stop_managers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agency",
+            name="namespace",
+            field=models.CharField(blank=True, default="", editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="calendar",
+            name="namespace",
+            field=models.CharField(blank=True, default="", editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="frequency",
+            name="namespace",
+            field=models.CharField(blank=True, default="", editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="line",
+            name="namespace",
+            field=models.CharField(blank=True, default="", editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="stop",
+            name="namespace",
+            field=models.CharField(blank=True, default="", editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="namespace",
+            field=models.CharField(blank=True, default="", editable=False, max_length=255),
+        ),
+        migrations.RunPython(namespaces_from_source_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:05
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+# Models whose objects are imported from GTFS feeds
+IMPORTED_MODELS = ("Agency", "Calendar", "Frequency", "Line", "Stop", "Trip")
+
+
+def staged_from_source_ids(apps, schema_editor) -> None:
+    """Objects staged by resumable imports (which only exist in namespaces with a checkpoint)
+    were marked by a "~{namespace}:" prefix of their source IDs"""
+    checkpoints = apps.get_model("transportation", "ImportCheckpoint")._default_manager
+    for namespace in checkpoints.values_list("namespace", flat=True):
+        prefix = f"~{namespace}:"
+        for model_name in IMPORTED_MODELS:
+            objects = apps.get_model("transportation", model_name)._default_manager
+            objects.filter(namespace=namespace, source_id__startswith=prefix).update(
+                staged=True, source_id=Substr("source_id", len(prefix) + 1)
+            )
+
+
+def staged_to_source_ids(apps, schema_editor) -> None:
+    for model_name in IMPORTED_MODELS:
+        objects = apps.get_model("transportation", model_name)._default_manager
+        objects.filter(staged=True).update(
+            source_id=Concat(Value("~"), "namespace", Value(":"), "source_id")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transportation", "0014_imported_namespace"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agency",
+            name="staged",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="calendar",
+            name="staged",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="frequency",
+            name="staged",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="line",
+            name="staged",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="stop",
+            name="staged",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="staged",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.RunPython(staged_from_source_ids, staged_to_source_ids),
+    ]
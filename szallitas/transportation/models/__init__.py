@@ -1,6 +1,10 @@
 from .agency import Agency
 from .calendar import Calendar, CalendarException
+from .data_version import DataVersion
+from .frequency import Frequency
+from .import_checkpoint import ImportCheckpoint
+from .import_job import ImportJob
 from .line import Line
-from .pattern import Pattern, PatternStop
+from .pattern import Pattern, PatternStop, TravelTimeProfile
 from .stop import Stop, WheelchairAccessibility
 from .trip import Trip
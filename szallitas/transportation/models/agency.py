@@ -2,13 +2,15 @@ from typing import TYPE_CHECKING
 
 from django.db import models
 
+from .imported import ImportedModel
+
 if TYPE_CHECKING:
     from django.db.models import Manager
 
     from .line import Line
 
 
-class Agency(models.Model):
+class Agency(ImportedModel):
     name = models.CharField(max_length=64)
     website = models.CharField(max_length=128)
     timezone = models.CharField(max_length=64, null=True, blank=True)
@@ -2,13 +2,17 @@ from typing import TYPE_CHECKING
 
 from django.db import models
 
+from .imported import ImportedModel
+from .staging import PublishedManager
+
 if TYPE_CHECKING:
     from django.db.models import Manager
 
+    from .frequency import Frequency
     from .trip import Trip
 
 
-class Calendar(models.Model):
+class Calendar(ImportedModel):
     name = models.CharField(max_length=64)
     start_date = models.DateField()
     end_date = models.DateField(null=True, blank=True)
@@ -25,6 +29,7 @@ class Calendar(models.Model):
     pk: int
     calendar_exception_set: "Manager[CalendarException]"
     trip_set: "Manager[Trip]"
+    frequency_set: "Manager[Frequency]"
 
 
 class CalendarException(models.Model):
@@ -32,6 +37,10 @@ class CalendarException(models.Model):
     added = models.BooleanField()
     calendar = models.ForeignKey(Calendar, on_delete=models.CASCADE)
 
+    # Objects staged by unfinished resumable imports are only visible through all_objects
+    all_objects = models.Manager["CalendarException"]()
+    objects = PublishedManager["CalendarException"]("calendar__staged")
+
     class Meta:
         default_related_name = "calendar_exception_set"
         constraints = [
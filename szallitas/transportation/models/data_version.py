@@ -0,0 +1,35 @@
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class DataVersion(models.Model):
+    """DataVersion counts changes of the transportation data - a single row, which is bumped
+    in the same transaction as every import and every edit made through the admin.
+
+    Data derived from the whole database (like GTFS exports) is cached under its `key`.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    # Attributes generated by Django, but which need explicit hints for type checker
+    id: int
+    pk: int
+
+    @property
+    def key(self) -> str:
+        """key identifies the version - including the time of the change, so that versions
+        of a re-created database never collide with cached data of the old one"""
+        return f"{self.version}-{self.changed_at:%Y%m%d%H%M%S%f}"
+
+    @classmethod
+    def current(cls) -> "DataVersion":
+        version, _ = cls.objects.get_or_create(pk=1)
+        return version
+
+    @classmethod
+    def bump(cls) -> None:
+        """bump records a change of the data"""
+        cls.objects.get_or_create(pk=1)
+        cls.objects.filter(pk=1).update(version=F("version") + 1, changed_at=timezone.now())
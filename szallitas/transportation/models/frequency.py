@@ -0,0 +1,50 @@
+from typing import Iterator
+
+from django.db import models
+
+from .calendar import Calendar
+from .imported import ImportedModel
+from .pattern import TravelTimeProfile
+from .stop import WheelchairAccessibility
+from .times import format_time
+
+
+class Frequency(ImportedModel):
+    """Frequency describes headway-based service along a travel time profile: a trip departs
+    every `headway`, starting at `start_time`, as long as it departs before `end_time`.
+
+    It's stored instead of individual trips, which are generated lazily by `departures`.
+    """
+
+    profile = models.ForeignKey(TravelTimeProfile, on_delete=models.CASCADE)
+    calendar = models.ForeignKey(Calendar, on_delete=models.CASCADE)
+    start_time = models.IntegerField(help_text="Seconds since midnight")
+    end_time = models.IntegerField(help_text="Seconds since midnight")
+    headway = models.IntegerField(help_text="Seconds")
+    exact_times = models.BooleanField(default=False)
+    wheelchair_accessible = models.IntegerField(choices=WheelchairAccessibility.choices)
+
+    class Meta:
+        default_related_name = "frequency_set"
+        verbose_name_plural = "Frequencies"
+
+    # Attributes generated by Django, but which need explicit hints for type checker
+    id: int
+    pk: int
+    calendar_id: int
+    profile_id: int
+
+    def departures(self) -> Iterator[int]:
+        """departures yields departure times (from the first stop, in seconds since midnight)
+        of all trips"""
+        if self.headway <= 0:
+            return
+        yield from range(self.start_time, self.end_time, self.headway)
+
+    def start_time_display(self) -> str:
+        """start_time_display returns the start of the frequency as HH:MM:SS"""
+        return format_time(self.start_time)
+
+    def end_time_display(self) -> str:
+        """end_time_display returns the end of the frequency as HH:MM:SS"""
+        return format_time(self.end_time)
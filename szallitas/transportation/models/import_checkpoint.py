@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class ImportCheckpoint(models.Model):
+    """ImportCheckpoint records the progress of a resumable import of a feed into a namespace.
+
+    Objects of the feed are staged (see ImportedModel.staged) and committed in batches,
+    together with the checkpoint. Once the whole feed is loaded, the staged objects
+    replace the published ones, and the checkpoint is removed.
+    """
+
+    namespace = models.CharField(max_length=255, unique=True, blank=True)
+    # SHA-256 of the feed. A checkpoint of a different feed is discarded instead of resumed.
+    feed_digest = models.CharField(max_length=64)
+    finished_stages: "models.JSONField[list[str]]" = models.JSONField(default=list, blank=True)
+    # Number of trips (in the order they are loaded) committed so far
+    trips = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Attributes generated by Django, but which need explicit hints for type checker
+    id: int
+    pk: int
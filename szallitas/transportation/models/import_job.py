@@ -0,0 +1,59 @@
+import json
+from pathlib import Path
+from typing import Any
+
+from django.db import models
+
+
+class ImportJob(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded"
+        FAILED = "failed"
+
+    file = models.FileField(upload_to="gtfs_imports/")
+    incremental = models.BooleanField(default=False)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    progress: "models.JSONField[dict[str, Any]]" = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    # Timings, query counts and memory usage of every stage of a finished import,
+    # as returned by ImportProfiler.as_dict
+    metrics: "models.JSONField[dict[str, Any]]" = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    # Attributes generated by Django, but which need explicit hints for type checker
+    id: int
+    pk: int
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.Status.SUCCEEDED, self.Status.FAILED)
+
+    @property
+    def progress_path(self) -> Path:
+        """progress_path points to a file with counters of a running import.
+
+        Counters are kept outside of the database, as the import holds
+        a database transaction open until it's finished.
+        """
+        return Path(self.file.path).with_suffix(".progress.json")
+
+    def write_progress(self, progress: dict[str, Any]) -> None:
+        temp_path = self.progress_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(progress), encoding="utf-8")
+        temp_path.replace(self.progress_path)
+
+    def current_progress(self) -> dict[str, Any]:
+        """current_progress returns the latest known counters of the import"""
+        if self.status == self.Status.RUNNING:
+            try:
+                return json.loads(self.progress_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                pass
+        return self.progress
@@ -0,0 +1,33 @@
+from typing import TYPE_CHECKING, ClassVar
+
+from django.db import models
+
+from .staging import PublishedManager
+
+if TYPE_CHECKING:
+    from typing_extensions import Self
+
+
+class ImportedModel(models.Model):
+    """ImportedModel is the base of models whose objects are imported from GTFS feeds,
+    and identified by their GTFS IDs"""
+
+    # Identifier of the object in the imported GTFS feed, and a hash of its imported data.
+    # Used by incremental imports to detect which objects have changed.
+    source_id = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    fingerprint = models.CharField(max_length=32, null=True, blank=True, editable=False)
+
+    # Namespace of the feed the object was imported from (empty if it wasn't namespaced).
+    # Incremental and resumable imports only match (and remove) objects from their namespace.
+    namespace = models.CharField(max_length=255, blank=True, default="", editable=False)
+
+    # Objects loaded by an unfinished resumable import are staged - hidden from readers,
+    # until the whole feed is loaded and they're published (see publish_staged)
+    staged = models.BooleanField(default=False, db_index=True, editable=False)
+
+    # Objects staged by unfinished resumable imports are only visible through all_objects
+    all_objects: ClassVar["models.Manager[Self]"] = models.Manager()
+    objects: ClassVar["PublishedManager[Self]"] = PublishedManager()
+
+    class Meta:
+        abstract = True
@@ -3,6 +3,7 @@ from typing import TYPE_CHECKING
 from django.db import models
 
 from .agency import Agency
+from .imported import ImportedModel
 
 if TYPE_CHECKING:
     from django.db.models import Manager
@@ -10,7 +11,7 @@ if TYPE_CHECKING:
     from .pattern import Pattern
 
 
-class Line(models.Model):
+class Line(ImportedModel):
     class LineType(models.IntegerChoices):
         # TODO: Add descriptions
         TRAM = 0
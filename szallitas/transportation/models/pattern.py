@@ -1,17 +1,48 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, cast
 
 from django.db import models
 
 from .line import Line
+from .staging import PublishedManager
 from .stop import Stop
 
 if TYPE_CHECKING:
     from django.db.models import Manager
 
+    from .frequency import Frequency
     from .trip import Trip
 
+    # Model fields are only generic for the type checker, and TextField only holds strings
+    _SecondsListBase = models.Field[list[int] | str, list[int]]
+else:
+    _SecondsListBase = models.TextField
+
+
+class SecondsListField(_SecondsListBase):
+    """SecondsListField stores a list of whole seconds as comma-separated text,
+    which is compact and portable across database backends"""
+
+    def from_db_value(self, value: str | None, *args: Any) -> list[int] | None:
+        return self.to_python(value)
+
+    def to_python(self, value: Any) -> list[int] | None:
+        if value is None or isinstance(value, list):
+            return cast("list[int] | None", value)
+        return [int(seconds) for seconds in value.split(",")] if value else []
+
+    def get_prep_value(self, value: Any) -> str | None:
+        if value is None or isinstance(value, str):
+            return value
+        return ",".join(map(str, value))
+
+    def value_to_string(self, obj: models.Model) -> str:
+        return self.get_prep_value(self.value_from_object(obj)) or ""
+
 
 class Pattern(models.Model):
+    """Pattern is a sequence of stops of a line, visited by trips with the same headsign.
+    Running times of its trips are stored separately, as TravelTimeProfiles."""
+
     class Direction(models.IntegerChoices):
         INBOUND = 0
         OUTBOUND = 1
@@ -21,20 +52,31 @@ class Pattern(models.Model):
     line = models.ForeignKey(Line, on_delete=models.CASCADE)
     stops = models.ManyToManyField[Stop, "PatternStop"](Stop, through="PatternStop")
 
+    # Hash of the headsign, direction, line and stops.
+    # Used by incremental imports to match imported patterns with stored ones.
+    fingerprint = models.CharField(max_length=32, null=True, blank=True, editable=False)
+
+    # Objects staged by unfinished resumable imports are only visible through all_objects
+    all_objects = models.Manager["Pattern"]()
+    objects = PublishedManager["Pattern"]("line__staged")
+
     # Attributes generated by Django, but which need explicit hints for type checker
     id: int
     pk: int
     line_id: int
     pattern_stop_set: "Manager[PatternStop]"
-    trip_set: "Manager[Trip]"
+    profile_set: "Manager[TravelTimeProfile]"
 
 
 class PatternStop(models.Model):
     pattern = models.ForeignKey(Pattern, on_delete=models.CASCADE)
     stop = models.ForeignKey(Stop, on_delete=models.CASCADE)
-    travel_time = models.DurationField()
     index = models.SmallIntegerField()
 
+    # Pattern stops are staged and published together with their pattern -
+    # to hide staged ones, filter them through Pattern.objects
+    objects = models.Manager["PatternStop"]()
+
     class Meta:
         default_related_name = "pattern_stop_set"
         constraints = [
@@ -48,3 +90,34 @@ class PatternStop(models.Model):
     pk: int
     pattern_id: int
     stop_id: int
+
+
+class TravelTimeProfile(models.Model):
+    """TravelTimeProfile describes running times of trips along a pattern:
+    `travel_times` holds the number of seconds from the departure at the first stop,
+    for every PatternStop of the pattern (in the order of their indices).
+
+    Trips over the same stops with different running times share a single Pattern,
+    and only differ by their profiles.
+    """
+
+    pattern = models.ForeignKey(Pattern, on_delete=models.CASCADE)
+    travel_times = SecondsListField()
+
+    # Hash of the pattern and travel times.
+    # Used by incremental imports to match imported profiles with stored ones.
+    fingerprint = models.CharField(max_length=32, null=True, blank=True, editable=False)
+
+    # Profiles are staged and published together with their pattern -
+    # to hide staged ones, filter them through Pattern.objects
+    objects = models.Manager["TravelTimeProfile"]()
+
+    class Meta:
+        default_related_name = "profile_set"
+
+    # Attributes generated by Django, but which need explicit hints for type checker
+    id: int
+    pk: int
+    pattern_id: int
+    trip_set: "Manager[Trip]"
+    frequency_set: "Manager[Frequency]"
@@ -0,0 +1,22 @@
+from typing import TypeVar
+
+from django.db import models
+
+M = TypeVar("M", bound=models.Model)
+
+
+class PublishedManager(models.Manager[M]):
+    """PublishedManager hides objects staged by unfinished resumable imports.
+
+    `staged_field` is the lookup of the `staged` flag of the imported object -
+    objects without one (e.g. patterns) are published together with their parent.
+    Models using this manager also declare a plain `all_objects` manager first,
+    so that it's the default manager - used by the admin, related managers and imports.
+    """
+
+    def __init__(self, staged_field: str = "staged") -> None:
+        super().__init__()
+        self.staged_field = staged_field
+
+    def get_queryset(self) -> "models.QuerySet[M]":
+        return super().get_queryset().filter(**{self.staged_field: False})
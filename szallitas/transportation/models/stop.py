@@ -2,6 +2,8 @@ from typing import TYPE_CHECKING
 
 from django.db import models
 
+from .imported import ImportedModel
+
 if TYPE_CHECKING:
     from django.db.models import Manager
 
@@ -14,7 +16,7 @@ class WheelchairAccessibility(models.IntegerChoices):
     NOT_ACCESSIBLE = 2
 
 
-class Stop(models.Model):
+class Stop(ImportedModel):
     name = models.CharField(max_length=64)
     code = models.CharField(max_length=16, null=True, blank=True)
     lat = models.DecimalField(decimal_places=6, max_digits=9)
@@ -0,0 +1,10 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1 << 17)
+def format_time(seconds: int) -> str:
+    """format_time converts seconds since midnight into a HH:MM:SS string.
+    Hours aren't wrapped, as in GTFS - trips after midnight continue the previous service day."""
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
@@ -1,18 +1,24 @@
 from django.db import models
 
 from .calendar import Calendar
-from .pattern import Pattern
+from .imported import ImportedModel
+from .pattern import TravelTimeProfile
 from .stop import WheelchairAccessibility
+from .times import format_time
 
 
-class Trip(models.Model):
+class Trip(ImportedModel):
     wheelchair_accessible = models.IntegerField(choices=WheelchairAccessibility.choices)
-    departure = models.DurationField()
-    pattern = models.ForeignKey(Pattern, on_delete=models.CASCADE)
+    departure = models.IntegerField(help_text="Seconds since midnight")
+    profile = models.ForeignKey(TravelTimeProfile, on_delete=models.CASCADE)
     calendar = models.ForeignKey(Calendar, on_delete=models.CASCADE)
 
     # Attributes generated by Django, but which need explicit hints for type checker
     id: int
     pk: int
     calendar_id: int
-    pattern_id: int
+    profile_id: int
+
+    def departure_display(self) -> str:
+        """departure_display returns the departure from the first stop as HH:MM:SS"""
+        return format_time(self.departure)
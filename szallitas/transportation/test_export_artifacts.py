@@ -0,0 +1,186 @@
+from io import BytesIO
+from typing import Any
+from unittest.mock import patch
+from zipfile import ZipFile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.urls import reverse
+from django.utils.http import http_date
+
+from . import export_artifacts
+from .admin import admin_site
+from .management.commands.load_sample_data import load_wkd_fixture_database
+from .models import DataVersion, Stop
+from .test_import_jobs import MediaRootMixin, join_exports
+
+
+class ParseRangeTestCase(SimpleTestCase):
+    def test(self) -> None:
+        self.assertEqual(export_artifacts.parse_range("bytes=0-99", 1000), (0, 100))
+        self.assertEqual(export_artifacts.parse_range("bytes=900-", 1000), (900, 1000))
+        self.assertEqual(export_artifacts.parse_range("bytes=900-2000", 1000), (900, 1000))
+        self.assertEqual(export_artifacts.parse_range("bytes=-100", 1000), (900, 1000))
+
+    def test_unsatisfiable(self) -> None:
+        self.assertEqual(export_artifacts.parse_range("bytes=1000-", 1000), (1000, 1000))
+
+    def test_unsupported(self) -> None:
+        self.assertIsNone(export_artifacts.parse_range("bytes=0-1,5-10", 1000))
+        self.assertIsNone(export_artifacts.parse_range("bytes=10-5", 1000))
+        self.assertIsNone(export_artifacts.parse_range("bytes=-", 1000))
+        self.assertIsNone(export_artifacts.parse_range("lines=0-10", 1000))
+
+
+class DataVersionTestCase(TestCase):
+    def test_bump(self) -> None:
+        before = DataVersion.current()
+        DataVersion.bump()
+        after = DataVersion.current()
+        self.assertEqual(after.version, before.version + 1)
+        self.assertNotEqual(after.key, before.key)
+
+    def test_admin_bumps(self) -> None:
+        load_wkd_fixture_database()
+        before = DataVersion.current().version
+
+        stop = Stop.objects.get(pk=1)
+        request = RequestFactory().post("/")
+        admin_site._registry[Stop].delete_model(request, stop)
+        self.assertEqual(DataVersion.current().version, before + 1)
+
+
+class DownloadTestCase(MediaRootMixin, TransactionTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.addCleanup(join_exports)
+        load_wkd_fixture_database()
+        user = get_user_model().objects.create_superuser("test", "", "test1234")  # type: ignore
+        self.client.force_login(user)
+
+    def download(self, **headers: str) -> tuple[int, dict[str, str], bytes]:
+        response = self.client.get(reverse("download_gtfs"), headers=headers)
+        content = (
+            b"".join(response.streaming_content)  # type: ignore
+            if response.streaming
+            else response.content
+        )
+        return response.status_code, response.headers, content  # type: ignore
+
+    def test_streamed(self) -> None:
+        status, headers, content = self.download()
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], "application/zip")
+        self.assertEqual(headers["ETag"], f'"{DataVersion.current().key}"')
+        self.assertNotIn("Content-Length", headers)
+
+        with ZipFile(BytesIO(content)) as archive:
+            self.assertIn("stop_times.txt", archive.namelist())
+
+        # The streamed archive is kept as the artifact of the data version
+        artifact = export_artifacts.artifact_path(DataVersion.current().key)
+        self.assertEqual(artifact.read_bytes(), content)
+
+    def test_failed_before_streaming(self) -> None:
+        export_all = export_artifacts.export_all
+        calls: list[int] = []
+
+        def fail_once(*args: Any, **kwargs: Any) -> None:
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("export failed")
+            export_all(*args, **kwargs)
+
+        # The failed export is retried before the response is started
+        with patch.object(export_artifacts, "export_all", fail_once), patch(
+            "threading.excepthook"
+        ):
+            status, _, content = self.download()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(status, 200)
+        with ZipFile(BytesIO(content)) as archive:
+            self.assertIn("stop_times.txt", archive.namelist())
+
+    def test_cached(self) -> None:
+        with patch.object(
+            export_artifacts, "export_all", wraps=export_artifacts.export_all
+        ) as export_all:
+            _, _, content = self.download()
+            status, headers, cached = self.download()
+        self.assertEqual(export_all.call_count, 1)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(cached, content)
+        self.assertEqual(headers["Content-Length"], str(len(content)))
+        self.assertEqual(
+            headers["Last-Modified"], http_date(DataVersion.current().changed_at.timestamp())
+        )
+
+    def test_not_modified(self) -> None:
+        _, headers, _ = self.download()
+
+        status, _, content = self.download(If_None_Match=headers["ETag"])
+        self.assertEqual(status, 304)
+        self.assertEqual(content, b"")
+
+        status, _, _ = self.download(If_Modified_Since=headers["Last-Modified"])
+        self.assertEqual(status, 304)
+
+    def test_invalidated(self) -> None:
+        _, headers, _ = self.download()
+        old_artifact = export_artifacts.artifact_path(DataVersion.current().key)
+
+        Stop.objects.filter(pk=1).update(name="Warszawa Śródmieście")
+        DataVersion.bump()
+
+        status, new_headers, content = self.download(If_None_Match=headers["ETag"])
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_headers["ETag"], headers["ETag"])
+        with ZipFile(BytesIO(content)) as archive:
+            self.assertIn("Warszawa Śródmieście,", archive.read("stops.txt").decode("utf-8"))
+
+        # Artifacts of older versions are removed
+        join_exports()
+        self.assertFalse(old_artifact.exists())
+
+    def test_resumed(self) -> None:
+        _, headers, content = self.download()
+        etag = headers["ETag"]
+
+        status, headers, partial = self.download(Range="bytes=100-199", If_Range=etag)
+        self.assertEqual(status, 206)
+        self.assertEqual(partial, content[100:200])
+        self.assertEqual(headers["Content-Range"], f"bytes 100-199/{len(content)}")
+
+        status, headers, _ = self.download(Range=f"bytes={len(content)}-")
+        self.assertEqual(status, 416)
+        self.assertEqual(headers["Content-Range"], f"bytes */{len(content)}")
+
+        # Ranges of other versions are ignored - the whole current version is sent
+        status, _, full = self.download(Range="bytes=100-199", If_Range='"other"')
+        self.assertEqual(status, 200)
+        self.assertEqual(full, content)
+
+    def test_outdated_export(self) -> None:
+        key = DataVersion.current().key
+        DataVersion.bump()
+
+        # Data of a newer version is never published as the artifact of an older one
+        with patch("threading.excepthook"):
+            thread = export_artifacts.start_export(key)
+            assert thread is not None
+            thread.join()
+        self.assertFalse(export_artifacts.artifact_path(key).exists())
+        self.assertFalse(export_artifacts.part_path(key).exists())
+
+    def test_exported_once(self) -> None:
+        key = DataVersion.current().key
+        thread = export_artifacts.start_export(key)
+        self.assertIsNotNone(thread)
+
+        # The export is already running, or finished
+        self.assertIsNone(export_artifacts.start_export(key))
+        join_exports()
+        self.assertIsNone(export_artifacts.start_export(key))
+        self.assertTrue(export_artifacts.artifact_path(key).exists())
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from . import import_jobs
+from .export_artifacts import artifact_path
+from .models import DataVersion, ImportJob, Trip
+
+FIXTURES_DIR = Path(__file__).parent / "gtfs_tools" / "fixtures"
+
+
+def fixture_upload() -> SimpleUploadedFile:
+    return SimpleUploadedFile("lomianki.zip", (FIXTURES_DIR / "lomianki.zip").read_bytes())
+
+
+def join_exports() -> None:
+    for thread in threading.enumerate():
+        if thread.name == "gtfs-export":
+            thread.join(timeout=60)
+
+
+class MediaRootMixin:
+    def setUp(self) -> None:
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)  # type: ignore
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)  # type: ignore
+        super().setUp()  # type: ignore
+
+
+class ImportJobQueueTestCase(MediaRootMixin, TestCase):
+    def test_only_one_job_runs(self) -> None:
+        first = import_jobs.enqueue_import(fixture_upload())
+        second = import_jobs.enqueue_import(fixture_upload())
+
+        self.assertTrue(import_jobs.claim_job(first))
+        self.assertEqual(first.status, ImportJob.Status.RUNNING)
+        self.assertIsNotNone(first.started_at)
+
+        self.assertFalse(import_jobs.claim_job(second))
+        self.assertIsNone(import_jobs.claim_next_job())
+
+        import_jobs.run_job(first)
+        self.assertEqual(first.status, ImportJob.Status.SUCCEEDED)
+        self.assertEqual(first.metrics["total"]["rows"], 1222)
+        self.assertFalse(first.file)
+        self.assertEqual(import_jobs.claim_next_job(), second)
+
+    def test_progress_of_running_job(self) -> None:
+        job = import_jobs.enqueue_import(fixture_upload())
+        import_jobs.claim_job(job)
+        job.write_progress({"stage": "trips"})
+        self.assertEqual(job.current_progress(), {"stage": "trips"})
+
+    def test_stale_job_fails(self) -> None:
+        stale = import_jobs.enqueue_import(fixture_upload())
+        queued = import_jobs.enqueue_import(fixture_upload())
+        import_jobs.claim_job(stale)
+
+        # The worker is alive - nothing else can be claimed
+        stale.write_progress({"stage": "trips"})
+        self.assertIsNone(import_jobs.claim_next_job())
+
+        # The worker stopped sending heartbeats
+        old = time.time() - import_jobs.STALE_TIMEOUT - 1
+        os.utime(stale.progress_path, (old, old))
+        self.assertEqual(import_jobs.claim_next_job(), queued)
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ImportJob.Status.FAILED)
+        self.assertEqual(stale.progress, {"stage": "trips"})
+        self.assertFalse(stale.file)
+
+
+class ImportJobWorkerTestCase(MediaRootMixin, TransactionTestCase):
+    def test_worker_runs_queued_jobs(self) -> None:
+        jobs = [import_jobs.enqueue_import(fixture_upload()) for _ in range(2)]
+        jobs[1].incremental = True
+        jobs[1].save()
+
+        worker = import_jobs.start_worker()
+        worker.join(timeout=60)
+        self.assertFalse(worker.is_alive())
+
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(job.status, ImportJob.Status.SUCCEEDED, job.error)
+            self.assertEqual(job.progress["stage"], "done")
+        self.assertEqual(Trip.objects.count(), 61)
+
+        # The imported data is exported in the background
+        join_exports()
+        self.assertTrue(artifact_path(DataVersion.current().key).exists())
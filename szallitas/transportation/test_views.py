@@ -1,11 +1,16 @@
+from io import BytesIO
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile
 
 from django.contrib.auth import get_user_model
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
+from django.urls import reverse
 
+from .gtfs_tools.gtfs_import import GTFSLoader
 from .models import *
 from .views import upload_zip
 
@@ -14,6 +19,15 @@ FIXTURES_DIR = Path(__file__).parent / "gtfs_tools" / "fixtures"
 
 class UploadZIPTestCase(TestCase):
     def setUp(self) -> None:
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name,
+            GTFS_IMPORT_BACKGROUND=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
         get_user_model().objects.create_superuser("test", "", "test1234")  # type: ignore
         self._user = get_user_model().objects.get(username="test")
         self._factory = RequestFactory()
@@ -38,6 +52,11 @@ class UploadZIPTestCase(TestCase):
         self.assertEqual(PatternStop.objects.count(), 332)
         self.assertEqual(Trip.objects.count(), 61)
 
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.Status.SUCCEEDED)
+        self.assertEqual(job.progress["stage"], "done")
+        self.assertEqual(job.progress["rows_written"]["transportation_trip"], 61)
+
     def test_upload_bad_file(self):
         file = SimpleUploadedFile("lomianki.zip", content=b"abcd")
         request = self._factory.post("/transportation/upload_zip", data={"zip_import": file})
@@ -55,3 +74,66 @@ class UploadZIPTestCase(TestCase):
         self.assertEqual(Pattern.objects.count(), 0)
         self.assertEqual(PatternStop.objects.count(), 0)
         self.assertEqual(Trip.objects.count(), 0)
+
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertListEqual([str(m) for m in messages], ["Bad file was uploaded."])
+
+    def test_upload_invalid_feed(self):
+        with ZipFile(FIXTURES_DIR / "lomianki.zip") as src:
+            buffer = BytesIO()
+            with ZipFile(buffer, "w") as dst:
+                for name in src.namelist():
+                    if name != "stops.txt":
+                        dst.writestr(name, src.read(name))
+        file = SimpleUploadedFile("lomianki.zip", content=buffer.getvalue())
+        request = self._factory.post("/transportation/upload_zip", data={"zip_import": file})
+        request.user = self._user
+        setattr(request, "session", "session")
+        messages = FallbackStorage(request)
+        setattr(request, "_messages", messages)
+        upload_zip(request)
+
+        # The feed is rejected by the first stage of the import, before anything is written
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.Status.FAILED)
+        self.assertEqual(job.progress["stage"], "validating")
+        self.assertIn("ERROR stops.txt: required table is missing", job.error)
+        self.assertEqual(Agency.objects.count(), 0)
+        [message] = messages
+        self.assertIn("ERROR stops.txt: required table is missing", str(message))
+
+
+class StagedObjectsTestCase(TestCase):
+    def test_staged_objects_are_not_shown(self):
+        agency = Agency.objects.create(name="Agency", website="", source_id="1", staged=True)
+        line = Line.objects.create(
+            code="1", line_type=Line.LineType.BUS, agency=agency, source_id="1", staged=True
+        )
+        stop = Stop.objects.create(
+            name="Stop", lat=52, lon=21, wheelchair_accessible=0, source_id="1", staged=True
+        )
+
+        self.assertEqual(self.client.get(reverse("line", args=[line.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("stop", args=[stop.pk])).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse("line_at_stop", args=[line.pk, stop.pk])).status_code, 404
+        )
+
+
+class TimetableTestCase(TestCase):
+    def test_timetable_queries(self):
+        GTFSLoader().from_zip(FIXTURES_DIR / "lomianki.zip")
+        ps = PatternStop.objects.filter(index=3).select_related("pattern").first()
+        assert ps is not None
+        url = reverse("line_at_stop", args=[ps.pattern.line_id, ps.stop_id])
+
+        # Line, stop, patterns, their stops, profiles, trips, calendars and frequencies
+        with self.assertNumQueries(8):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["timetable_by_header"])
+
+        with override_settings(MERGE_TIMETABLES_BY_HEADSIGN=True), self.assertNumQueries(8):
+            response = self.client.get(url)
+        self.assertTrue(response.context["timetable_by_header"])
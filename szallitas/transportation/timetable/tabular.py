@@ -1,6 +1,7 @@
 from collections import defaultdict
+from typing import Iterator
 
-from ..models import PatternStop
+from ..models import PatternStop, TravelTimeProfile
 
 Hour = str
 Minutes = list[str]
@@ -16,14 +17,15 @@ def generate_tabular_timetable(*pattern_stops: PatternStop) -> DepartureBoardByC
     max_hours = 20
 
     for pattern_stop in pattern_stops:
-        for trip in pattern_stop.pattern.trip_set.all():
-            seconds = int((trip.departure + pattern_stop.travel_time).total_seconds())
-            minutes, seconds = divmod(seconds, 60)
-            hours, minutes = divmod(minutes, 60)
-            boards[trip.calendar.name][hours].append(minutes)
+        for profile in pattern_stop.pattern.profile_set.all():
+            travel_time = profile.travel_times[pattern_stop.index]
+            for calendar_name, departure in profile_departures(profile):
+                hours, seconds = divmod(departure + travel_time, 3600)
+                minutes = seconds // 60
+                boards[calendar_name][hours].append(minutes)
 
-            min_hours = min(min_hours, hours)
-            max_hours = max(max_hours, hours)
+                min_hours = min(min_hours, hours)
+                max_hours = max(max_hours, hours)
 
     # Generate the timetables
     return [
@@ -36,3 +38,15 @@ def generate_tabular_timetable(*pattern_stops: PatternStop) -> DepartureBoardByC
         )
         for calendar in sorted(boards)
     ]
+
+
+def profile_departures(profile: TravelTimeProfile) -> Iterator[tuple[CalendarName, int]]:
+    """profile_departures yields (calendar name, departure from the first stop in seconds)
+    of all trips of a travel time profile - including trips generated from frequencies"""
+    # NOTE: Calendars are prefetched by the timetable view, so that they aren't fetched
+    #       for every trip separately
+    for trip in profile.trip_set.all():
+        yield trip.calendar.name, trip.departure
+    for frequency in profile.frequency_set.all():
+        for departure in frequency.departures():
+            yield frequency.calendar.name, departure
@@ -1,7 +1,7 @@
 from django.test import TestCase
 
 from ..management.commands.load_sample_data import load_wkd_fixture_database
-from ..models import PatternStop
+from ..models import Calendar, Frequency, PatternStop
 from .tabular import generate_tabular_timetable
 
 
@@ -134,3 +134,24 @@ class GenerateTabularTimetableTestCase(TestCase):
                 ("24", ["12", "28"]),
             ],
         )
+
+    def test_frequencies(self) -> None:
+        ps = PatternStop.objects.filter(stop_id=22, pattern__direction=1).first()
+        assert ps is not None  # normal assertion for type checking
+        profile = ps.pattern.profile_set.get()
+        Frequency.objects.create(
+            profile=profile,
+            calendar=Calendar.objects.get(name="Mon-Fri"),
+            start_time=19 * 3600,
+            end_time=20 * 3600,
+            headway=15 * 60,
+            wheelchair_accessible=1,
+        )
+
+        tt = generate_tabular_timetable(ps)
+        self.assertEqual(tt[0][0], "Mon-Fri")
+        minutes = (profile.travel_times[ps.index] // 60) % 60
+        self.assertIn(
+            ("19", [f"{(minutes + offset) % 60:02}" for offset in (0, 15, 30, 45)]),
+            tt[0][1],
+        )
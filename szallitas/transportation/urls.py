@@ -11,4 +11,5 @@ urlpatterns = [
     path("api/lines", views.lines, name="lines"),
     path("download_gtfs/", views.download, name="download_gtfs"),
     path("upload_zip/", views.upload_zip, name="upload_zip"),
+    path("import_job/<int:job_id>/", views.import_job_status, name="import_job_status"),
 ]
@@ -1,7 +1,5 @@
-import traceback
 from collections import defaultdict
-from typing import IO, cast
-from zipfile import BadZipFile
+from typing import cast
 
 from django import forms
 from django.conf import settings
@@ -9,12 +7,24 @@ from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.files.uploadedfile import UploadedFile
+from django.db.models import Prefetch
 from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http.response import HttpResponseBase
 from django.shortcuts import get_object_or_404, redirect, render
 
-from .gtfs_tools.gtfs_export import export_all
-from .gtfs_tools.gtfs_import import CalendarFileNotFound, GTFSLoader, clear_tables
-from .models import Agency, Calendar, CalendarException, Line, Pattern, PatternStop, Stop, Trip
+from .export_artifacts import download_response
+from .import_jobs import claim_job, enqueue_import, run_job, start_worker
+from .models import (
+    Agency,
+    Calendar,
+    CalendarException,
+    ImportJob,
+    Line,
+    Pattern,
+    PatternStop,
+    Stop,
+    Trip,
+)
 from .timetable.tabular import DepartureBoardByCalendar, generate_tabular_timetable
 
 
@@ -24,7 +34,7 @@ def index(request: HttpRequest) -> HttpResponse:
 
 
 def line(request: HttpRequest, line_id: int) -> HttpResponse:
-    line = get_object_or_404(Line, pk=line_id)
+    line = get_object_or_404(Line.objects, pk=line_id)
     patterns = Pattern.objects.filter(line__id=line_id).prefetch_related("pattern_stop_set__stop")
 
     context = {
@@ -35,7 +45,7 @@ def line(request: HttpRequest, line_id: int) -> HttpResponse:
 
 
 def stop(request: HttpRequest, stop_id: int) -> HttpResponse:
-    stop = get_object_or_404(Stop, id=stop_id)
+    stop = get_object_or_404(Stop.objects, id=stop_id)
 
     context = {"lines": Line.objects.filter(pattern__stops__id=stop_id).distinct(), "stop": stop}
     return render(request, "transportation/stop.html", context)
@@ -43,16 +53,24 @@ def stop(request: HttpRequest, stop_id: int) -> HttpResponse:
 
 def timetable(request: HttpRequest, line_id: int, stop_id: int) -> HttpResponse:
     # FIXME: What if pattern stops multiple times at the stop?
-    line = get_object_or_404(Line, pk=line_id)
-    stop = get_object_or_404(Stop, pk=stop_id)
+    line = get_object_or_404(Line.objects, pk=line_id)
+    stop = get_object_or_404(Stop.objects, pk=stop_id)
 
     timetable_by_header: list[tuple[str, DepartureBoardByCalendar]]
 
+    # Departures of all patterns are fetched with a fixed number of queries.
+    # Only pattern stops at the requested stop are prefetched.
+    patterns = line.pattern_set.prefetch_related(
+        Prefetch("pattern_stop_set", PatternStop.objects.filter(stop_id=stop_id).order_by("id")),
+        "profile_set__trip_set__calendar",
+        "profile_set__frequency_set__calendar",
+    )
+
     if getattr(settings, "MERGE_TIMETABLES_BY_HEADSIGN", False):
         # FIXME: What if there are the same headsigns in two different directions?
         ps_by_headsign: defaultdict[str, list[PatternStop]] = defaultdict(list)
-        for pattern in line.pattern_set.all():
-            for ps in pattern.pattern_stop_set.filter(stop_id=stop_id).all():
+        for pattern in patterns:
+            for ps in pattern.pattern_stop_set.all():
                 ps_by_headsign[pattern.headsign].append(ps)
 
         timetable_by_header = [
@@ -63,9 +81,9 @@ def timetable(request: HttpRequest, line_id: int, stop_id: int) -> HttpResponse:
     else:
         timetable_by_header = [
             (pattern.headsign, generate_tabular_timetable(pattern_stop))
-            for pattern in line.pattern_set.all()
+            for pattern in patterns
             # Skip patterns not stopping at the requested stop
-            if (pattern_stop := pattern.pattern_stop_set.filter(stop_id=stop_id).first())
+            if (pattern_stop := next(iter(pattern.pattern_stop_set.all()), None))
         ]
 
     context = {"line": line, "stop": stop, "timetable_by_header": timetable_by_header}
@@ -82,16 +100,15 @@ def lines(request: HttpRequest) -> JsonResponse:
 
 @login_required
 @staff_member_required
-def download(request: HttpRequest):
-    zipfile_name = "szallitas-gtfs.zip"
-    response = HttpResponse(content_type="application/zip")
-    export_all(cast(IO[bytes], response))
-    response["Content-Disposition"] = "attachment; filename={}".format(zipfile_name)
-    return response
+def download(request: HttpRequest) -> HttpResponseBase:
+    return download_response(request)
 
 
 class CsvImportForm(forms.Form):
     zip_import = forms.FileField(label="")
+    incremental = forms.BooleanField(
+        label="Only apply changes (keeps IDs of unchanged objects)", required=False
+    )
 
 
 @login_required
@@ -99,20 +116,23 @@ class CsvImportForm(forms.Form):
 def upload_zip(request: HttpRequest):
     if request.method == "POST":
         zip_file = cast(UploadedFile, request.FILES["zip_import"])
+        incremental = bool(request.POST.get("incremental"))
 
-        clear_tables()
+        job = enqueue_import(zip_file, incremental)
 
-        gtfs_loader = GTFSLoader()
-        try:
-            gtfs_loader.from_zip(zip_file)
-        except BadZipFile:
-            messages.warning(request, "Bad file was uploaded.")
-            return HttpResponseRedirect(request.path_info)
-        except CalendarFileNotFound:
-            messages.warning(request, "Calendar file was not found.")
-            return HttpResponseRedirect(request.path_info)
-        except Exception:
-            messages.error(request, f"Exception occurred:{traceback.format_exc()}")
+        if getattr(settings, "GTFS_IMPORT_BACKGROUND", False):
+            start_worker()
+            messages.info(request, "Your zip file has been queued for import")
+            return redirect("import_job_status", job_id=job.pk)
+
+        if claim_job(job):
+            run_job(job)
+        else:
+            messages.warning(request, "Another import is running, your zip file has been queued")
+            return redirect("import_job_status", job_id=job.pk)
+
+        if job.status == ImportJob.Status.FAILED:
+            messages.warning(request, job.error)
             return HttpResponseRedirect(request.path_info)
 
         messages.success(request, "Your zip file has been uploaded")
@@ -120,3 +140,11 @@ def upload_zip(request: HttpRequest):
 
     form = CsvImportForm()
     return render(request, "admin/zip_upload.html", {"form": form})
+
+
+@login_required
+@staff_member_required
+def import_job_status(request: HttpRequest, job_id: int) -> HttpResponse:
+    job = get_object_or_404(ImportJob, pk=job_id)
+    context = {"job": job, "progress": job.current_progress()}
+    return render(request, "admin/import_job.html", context)